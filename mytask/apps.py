@@ -0,0 +1,17 @@
+from django.apps import AppConfig
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class MytaskConfig(AppConfig):
+    name = 'mytask'
+
+    def ready(self):
+        from . import db, instrumentation, lookups, saved_searches, signals  # noqa: F401
+
+        for hook in getattr(settings, "PLANET_SEARCH_INSTRUMENTATION_HOOKS", []):
+            instrumentation.add_hook(import_string(hook)())
+
+        if getattr(settings, "PLANET_SEARCH_WARM_UP", False):
+            from .parser import ParserSearch
+            ParserSearch.warm_up()
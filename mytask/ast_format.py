@@ -0,0 +1,311 @@
+'''
+Versioned serialization of the search tree returned by ParserSearch.to_ast().
+
+JSON: {"v": 1, "ast": <group>}
+- group: [[op, node], ...] with op "&" (AND) or "|" (OR)
+- predicate: [field, op, value]
+- value: JSON string, number, boolean or null, {"date": "2016-05-01"}, {"datetime": "..."} or {"decimal": "1.5"}
+
+Binary: b"PSA" + version byte, then the tree in prefix order
+- group: b"G" + varint item count + (op byte + node) per item
+- predicate: b"P" + field + op + value, strings are a varint length and utf-8 bytes
+- value: tag byte + payload, see _dump_value()
+
+Decoding checks the operators and the structure, it never evaluates anything.
+'''
+import json
+import struct
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from typing import Union
+
+from .parser import AND, OR, OPERATORS, Group, ParserSearch, Predicate, SearchLimits, SearchPhraseError
+
+
+VERSION = 1
+MAGIC = b"PSA"
+_OPS = {AND: "&", OR: "|"}
+_OP_NAMES = {symbol: op for op, symbol in _OPS.items()}
+
+
+class ASTFormatError(SearchPhraseError):
+    '''
+    Raised for serialized trees that can not be decoded
+    '''
+
+
+class _Counter:
+    '''
+    Enforce SearchLimits while a tree is decoded
+    '''
+
+    def __init__(self, limits: SearchLimits = None):
+        self.limits = limits
+        self.predicates = 0
+        self.fields = set()
+
+    def group(self, depth: int):
+        if self.limits is not None:
+            # the top level group is not a parenthesis
+            ParserSearch.check_depth(depth - 1, self.limits)
+
+    def predicate(self, field: str):
+        self.predicates += 1
+        self.fields.add(field)
+        if self.limits is not None:
+            ParserSearch.check_counts(self.predicates, len(self.fields), self.limits)
+
+
+def _check_predicate(field, op, value) -> Predicate:
+    if not isinstance(field, str) or not field or op not in OPERATORS:
+        raise ASTFormatError(f"invalid predicate {[field, op, value]!r}")
+    return Predicate(field, op, value)
+
+
+# JSON
+
+def _json_value(value):
+    # bool before int and datetime before date, they are subclasses
+    if value is None or isinstance(value, (bool, str)):
+        return value
+    if isinstance(value, (int, float)):
+        return value
+    if isinstance(value, datetime):
+        return {"datetime": value.isoformat()}
+    if isinstance(value, date):
+        return {"date": value.isoformat()}
+    if isinstance(value, Decimal):
+        return {"decimal": str(value)}
+    raise TypeError(f"can not serialize value {value!r}")
+
+
+def _json_node(node: Union[Group, Predicate]) -> list:
+    if isinstance(node, Predicate):
+        return [node.field, node.op, _json_value(node.value)]
+    return [[_OPS[op], _json_node(item)] for op, item in node.items]
+
+
+def _from_json_value(value):
+    if not isinstance(value, dict):
+        if isinstance(value, list):
+            raise ASTFormatError(f"invalid value {value!r}")
+        return value
+    if len(value) != 1:
+        raise ASTFormatError(f"invalid value {value!r}")
+
+    (tag, text), = value.items()
+    try:
+        if tag == "date":
+            return date.fromisoformat(text)
+        if tag == "datetime":
+            return datetime.fromisoformat(text)
+        if tag == "decimal":
+            return Decimal(text)
+    except (TypeError, ValueError, InvalidOperation):
+        pass
+    raise ASTFormatError(f"invalid value {value!r}")
+
+
+def _from_json_node(node, counter: _Counter, depth: int = 1) -> Union[Group, Predicate]:
+    if not isinstance(node, list):
+        raise ASTFormatError(f"invalid node {node!r}")
+    if node and isinstance(node[0], str):
+        if len(node) != 3:
+            raise ASTFormatError(f"invalid predicate {node!r}")
+        predicate = _check_predicate(node[0], node[1], _from_json_value(node[2]))
+        counter.predicate(predicate.field)
+        return predicate
+
+    counter.group(depth)
+    items = []
+    for item in node:
+        if not isinstance(item, list) or len(item) != 2 or item[0] not in _OP_NAMES:
+            raise ASTFormatError(f"invalid group item {item!r}")
+        items.append((_OP_NAMES[item[0]], _from_json_node(item[1], counter, depth + 1)))
+    return Group(tuple(items))
+
+
+def dumps(tree: Group) -> str:
+    return json.dumps({"v": VERSION, "ast": _json_node(tree)}, separators=(",", ":"), ensure_ascii=False)
+
+
+def loads(data: Union[str, bytes], limits: SearchLimits = None) -> Group:
+    try:
+        document = json.loads(data)
+    except (TypeError, ValueError, RecursionError):
+        raise ASTFormatError("serialized search tree is not valid JSON")
+    if not isinstance(document, dict) or document.get("v") != VERSION:
+        raise ASTFormatError(f"unsupported search tree version, expected {VERSION}")
+
+    tree = document.get("ast")
+    if not isinstance(tree, list) or (tree and isinstance(tree[0], str)):
+        raise ASTFormatError("search tree must be a group")
+    return _decode(_from_json_node, tree, limits)
+
+
+# binary
+
+def _dump_varint(value: int, out: bytearray):
+    while True:
+        byte = value & 0x7f
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return
+
+
+def _dump_str(text: str, out: bytearray):
+    data = text.encode()
+    _dump_varint(len(data), out)
+    out += data
+
+
+def _dump_value(value, out: bytearray):
+    if value is None:
+        out += b"N"
+    elif value is True:
+        out += b"T"
+    elif value is False:
+        out += b"F"
+    elif isinstance(value, int):
+        # zigzag, small negative numbers stay short
+        out += b"i"
+        _dump_varint(value * 2 if value >= 0 else -value * 2 - 1, out)
+    elif isinstance(value, float):
+        out += b"f" + struct.pack("<d", value)
+    elif isinstance(value, str):
+        out += b"s"
+        _dump_str(value, out)
+    elif isinstance(value, datetime):
+        out += b"t"
+        _dump_str(value.isoformat(), out)
+    elif isinstance(value, date):
+        out += b"d"
+        _dump_varint(value.toordinal(), out)
+    elif isinstance(value, Decimal):
+        out += b"m"
+        _dump_str(str(value), out)
+    else:
+        raise TypeError(f"can not serialize value {value!r}")
+
+
+def _dump_node(node: Union[Group, Predicate], out: bytearray):
+    if isinstance(node, Predicate):
+        out += b"P"
+        _dump_str(node.field, out)
+        _dump_str(node.op, out)
+        _dump_value(node.value, out)
+        return
+
+    out += b"G"
+    _dump_varint(len(node.items), out)
+    for op, item in node.items:
+        out += _OPS[op].encode()
+        _dump_node(item, out)
+
+
+class _Reader:
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.pos = 0
+
+    def take(self, size: int) -> bytes:
+        chunk = self.data[self.pos:self.pos + size]
+        if len(chunk) != size:
+            raise ASTFormatError("truncated search tree")
+        self.pos += size
+        return chunk
+
+    def varint(self) -> int:
+        value = shift = 0
+        while True:
+            byte = self.take(1)[0]
+            value |= (byte & 0x7f) << shift
+            if not byte & 0x80:
+                return value
+            shift += 7
+
+    def str(self) -> str:
+        try:
+            return self.take(self.varint()).decode()
+        except UnicodeDecodeError:
+            raise ASTFormatError("invalid string in search tree")
+
+    def value(self):
+        tag = self.take(1)
+        if tag == b"N":
+            return None
+        if tag in (b"T", b"F"):
+            return tag == b"T"
+        if tag == b"i":
+            value = self.varint()
+            return value >> 1 if not value & 1 else -(value >> 1) - 1
+        if tag == b"f":
+            return struct.unpack("<d", self.take(8))[0]
+        if tag == b"s":
+            return self.str()
+        if tag == b"d":
+            try:
+                return date.fromordinal(self.varint())
+            except (ValueError, OverflowError):
+                raise ASTFormatError("invalid date in search tree")
+        try:
+            if tag == b"t":
+                return datetime.fromisoformat(self.str())
+            if tag == b"m":
+                return Decimal(self.str())
+        except (ValueError, InvalidOperation):
+            raise ASTFormatError(f"invalid {tag!r} value in search tree")
+        raise ASTFormatError(f"unknown value tag {tag!r}")
+
+
+def _from_binary_node(reader: _Reader, counter: _Counter, depth: int = 1) -> Union[Group, Predicate]:
+    kind = reader.take(1)
+    if kind == b"P":
+        predicate = _check_predicate(reader.str(), reader.str(), reader.value())
+        counter.predicate(predicate.field)
+        return predicate
+    if kind != b"G":
+        raise ASTFormatError(f"unknown node type {kind!r}")
+
+    counter.group(depth)
+    items = []
+    for _ in range(reader.varint()):
+        op = reader.take(1).decode("latin-1")
+        if op not in _OP_NAMES:
+            raise ASTFormatError(f"unknown operator {op!r}")
+        items.append((_OP_NAMES[op], _from_binary_node(reader, counter, depth + 1)))
+    return Group(tuple(items))
+
+
+def dumpb(tree: Group) -> bytes:
+    out = bytearray(MAGIC)
+    out.append(VERSION)
+    _dump_node(tree, out)
+    return bytes(out)
+
+
+def loadb(data: bytes, limits: SearchLimits = None) -> Group:
+    if data[:len(MAGIC)] != MAGIC:
+        raise ASTFormatError("not a binary search tree")
+    if data[len(MAGIC):len(MAGIC) + 1] != bytes([VERSION]):
+        raise ASTFormatError(f"unsupported search tree version, expected {VERSION}")
+
+    reader = _Reader(data)
+    reader.pos = len(MAGIC) + 1
+    if data[reader.pos:reader.pos + 1] != b"G":
+        raise ASTFormatError("search tree must be a group")
+    tree = _decode(_from_binary_node, reader, limits)
+    if reader.pos != len(data):
+        raise ASTFormatError("trailing data after search tree")
+    return tree
+
+
+def _decode(decode_node, source, limits: SearchLimits = None) -> Group:
+    try:
+        return decode_node(source, _Counter(limits))
+    except RecursionError:
+        raise ASTFormatError("search tree is nested too deeply")
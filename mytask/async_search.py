@@ -0,0 +1,132 @@
+'''
+Async search service for the ASGI deployment.
+
+The event loop never blocks on a search:
+- phrases are parsed (to_ast) in a small thread pool
+- the result cache and the database are used from a bounded pool of database threads,
+  each thread keeps its own connection and closes it like a request would (CONN_MAX_AGE)
+- at most max_concurrency searches run at once per event loop, others wait their turn
+- identical searches in flight are coalesced, every caller awaits the same execution
+
+Sizes come from PLANET_SEARCH_ASYNC.
+'''
+import asyncio
+import contextvars
+import json
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Callable, Union
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections
+
+from . import cache, search
+from .models import Planet
+from .parser import Group, ParserSearch
+
+
+DEFAULTS = {"parse_workers": 2, "db_workers": 8, "max_concurrency": 32}
+
+_executors = {}
+_executors_lock = threading.Lock()
+# event loop -> _LoopState, asyncio primitives belong to one loop
+_loop_states = weakref.WeakKeyDictionary()
+
+
+def get_config() -> dict:
+    return {**DEFAULTS, **getattr(settings, "PLANET_SEARCH_ASYNC", {})}
+
+
+def _executor(kind: str) -> ThreadPoolExecutor:
+    workers = get_config()[f"{kind}_workers"]
+    with _executors_lock:
+        executor = _executors.get(kind)
+        if executor is None or executor._max_workers != workers:
+            executor = _executors[kind] = ThreadPoolExecutor(workers, thread_name_prefix=f"planet-search-{kind}")
+        return executor
+
+
+def shutdown():
+    with _executors_lock:
+        for executor in _executors.values():
+            executor.shutdown(wait=False)
+        _executors.clear()
+
+
+class _LoopState:
+
+    def __init__(self, max_concurrency: int):
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.in_flight = {}
+
+
+def _state() -> _LoopState:
+    loop = asyncio.get_running_loop()
+    state = _loop_states.get(loop)
+    if state is None:
+        state = _loop_states[loop] = _LoopState(get_config()["max_concurrency"])
+    return state
+
+
+def _db_call(func: Callable, *args):
+    close_old_connections()
+    try:
+        return func(*args)
+    finally:
+        close_old_connections()
+
+
+async def _run(kind: str, func: Callable, *args):
+    # executor threads do not inherit the context, instrumentation.request_timings lives in it
+    context = contextvars.copy_context()
+    if kind == "db":
+        args = (func, *args)
+        func = _db_call
+    return await asyncio.get_running_loop().run_in_executor(_executor(kind), partial(context.run, func, *args))
+
+
+async def coalesce(key: str, compute: Callable):
+    '''
+    Await compute() once for concurrent callers with the same key
+    '''
+    in_flight = _state().in_flight
+    future = in_flight.get(key)
+    if future is None:
+        future = in_flight[key] = asyncio.ensure_future(compute())
+        future.add_done_callback(lambda _: in_flight.pop(key, None))
+    # a caller that goes away must not cancel the execution the others wait for
+    return await asyncio.shield(future)
+
+
+async def _search_page(parts: tuple, search_phrase: str, allowed_fields: Union[list[str], tuple[str]],
+                       tree: Union[Group, None], ordering: str, cursor: Union[str, None], limit: Union[int, None],
+                       columns: Union[list[str], tuple[str], None]) -> dict:
+    async with _state().semaphore:
+        key, page = await _run("db", cache.lookup, "page", parts)
+        if page is not cache.MISSING:
+            return page
+
+        if tree is None:
+            tree = await _run("parse", ParserSearch.to_ast, allowed_fields, search_phrase, Planet, search.get_limits())
+        # the tree takes precedence, the phrase is passed on for the slow search log
+        page = await _run(
+            "db", search.compute_page, search_phrase, allowed_fields, tree, ordering, cursor, limit, columns)
+        await _run("db", cache.store, key, page)
+        return page
+
+
+async def asearch_page(search_phrase: str, ordering: str = "date", cursor: str = None, limit: int = None,
+                       columns: Union[list[str], tuple[str]] = None,
+                       allowed_fields: Union[list[str], tuple[str]] = None, tree: Group = None) -> dict:
+    '''
+    Async search.search_page(), same arguments and result
+    '''
+    if allowed_fields is None:
+        allowed_fields = search.get_allowed_fields()
+    parts = search.page_parts(search_phrase, ordering, cursor, limit, columns, allowed_fields, tree)
+    key = json.dumps(parts, cls=DjangoJSONEncoder, sort_keys=True)
+    return await coalesce(
+        key, lambda: _search_page(parts, search_phrase, allowed_fields, tree, ordering, cursor, limit, columns))
@@ -0,0 +1,331 @@
+'''
+Synthetic phrases and planets for benchmarking the search, see the bench_search command.
+
+Both generators are seeded, the same arguments give the same phrases and rows
+on every run so results can be compared across commits.
+
+startup() measures a cold process instead: Django setup, importing the
+search service, the first and a second parse, and which of the LAZY_MODULES
+were loaded before the first parse.
+
+run() times each phrase through the stages of a search separately:
+- parse: ParserSearch.to_ast(), tokenizing and converting the values
+- build: ParserSearch.compile() with the optimizer, the Q object
+- compile: the SQL of the page query, as the ORM writes it
+- execute: running that SQL and fetching the page
+'''
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+from datetime import date, timedelta
+from itertools import islice
+from time import perf_counter
+from typing import Iterator, Union
+
+from django.core.exceptions import EmptyResultSet
+from django.db import connections, transaction
+from django.db.models import Max, Q
+
+from .models import Planet, SavedSearchMatch
+from .optimizer import EmptyQ
+from .parser import AND, OR, ParserSearch, SearchLimitError, SearchLimits
+from .saved_searches import deferred_rebuild
+from .signals import planets_changed
+
+
+STAGES = ("parse", "build", "compile", "execute")
+# field -> operators the generator uses with it
+FIELD_OPERATORS = {
+    "name": ("eq", "ne"),
+    "description": ("match",),
+    "distance": ("eq", "ne", "gt", "lt"),
+    "date": ("eq", "ne", "gt", "lt"),
+}
+WORDS = (
+    "gas", "giant", "rocky", "ice", "dwarf", "ring", "moon", "red", "blue", "hot", "cold", "dense", "thin",
+    "atmosphere", "ocean", "desert", "storm", "orbit", "binary", "rogue",
+)
+SYLLABLES = ("ka", "ne", "pto", "ur", "sa", "tur", "ve", "mer", "ju", "pi", "ter", "ma", "rs", "ga", "lo", "xi")
+FIRST_DATE = date(1900, 1, 1)
+DATE_SPAN = 365 * 130
+# imported by the first parse, not on startup (see mytask.parser)
+LAZY_MODULES = ("pyparsing", "dateutil", "multiprocessing")
+STARTUP_PHRASE = "date gt 2000-01-01 AND (name eq Mars OR distance lt 100)"
+_STARTUP_SCRIPT = """
+import json
+import sys
+from time import perf_counter
+
+started = perf_counter()
+import django
+django.setup()
+setup = perf_counter()
+from mytask import search, views  # noqa: F401
+imported = perf_counter()
+loaded = [name for name in json.loads(sys.argv[1]) if name in sys.modules]
+search.build_query(sys.argv[2], ["name", "distance", "date"])
+first = perf_counter()
+search.build_query(sys.argv[2] + " ", ["name", "distance", "date"])
+second = perf_counter()
+print(json.dumps({
+    "setup_ms": (setup - started) * 1000, "import_ms": (imported - setup) * 1000,
+    "first_parse_ms": (first - imported) * 1000, "parse_ms": (second - first) * 1000, "loaded": loaded,
+}))
+"""
+# ways to break a valid phrase, see generate_phrase(invalid=True)
+_BREAKERS = ("open", "close", "character", "operator")
+
+
+def _name(rng: random.Random) -> str:
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).capitalize()
+
+
+def _distance(rng: random.Random) -> int:
+    # log uniform, most planets are near and a few are very far
+    return int(10 ** rng.uniform(0, 6))
+
+
+def _date(rng: random.Random) -> date:
+    return FIRST_DATE + timedelta(days=rng.randrange(DATE_SPAN))
+
+
+def _value(rng: random.Random, field: str) -> str:
+    if field == "name":
+        return _name(rng)
+    if field == "description":
+        return f'"{" ".join(rng.sample(WORDS, rng.randint(1, 2)))}"'
+    if field == "distance":
+        return str(_distance(rng))
+    if field == "date":
+        return _date(rng).isoformat()
+    # fields without a known type get a plain word
+    return rng.choice(WORDS)
+
+
+def _predicate(rng: random.Random, fields: tuple, operators: dict) -> str:
+    field = rng.choice(fields)
+    return f"{field} {rng.choice(operators[field])} {_value(rng, field)}"
+
+
+def _group(rng: random.Random, depth: int, width: int, fields: tuple, operators: dict, or_ratio: float) -> str:
+    terms = []
+    for _ in range(rng.randint(1, width)):
+        if depth > 1 and rng.random() < 0.5:
+            terms.append(f"({_group(rng, depth - 1, width, fields, operators, or_ratio)})")
+        else:
+            terms.append(_predicate(rng, fields, operators))
+
+    phrase = terms[0]
+    for term in terms[1:]:
+        phrase += f" {OR if rng.random() < or_ratio else AND} {term}"
+    return phrase
+
+
+def _break(rng: random.Random, phrase: str) -> str:
+    breaker = rng.choice(_BREAKERS)
+    if breaker == "open":
+        return f"({phrase}"
+    if breaker == "close":
+        return f"{phrase})"
+    if breaker == "character":
+        # characters inside double quotes are allowed, insert outside of them
+        position = rng.choice([index for index in range(len(phrase) + 1) if phrase.count('"', 0, index) % 2 == 0])
+        return phrase[:position] + rng.choice("!$%&*+,;<=>?@[]^{|}~") + phrase[position:]
+    return f"{phrase} {AND} {rng.choice(WORDS)} {rng.choice(('like', 'is', 'has'))} {rng.choice(WORDS)}"
+
+
+def generate_phrase(rng: random.Random, depth: int = 3, width: int = 3, fields: Union[list[str], tuple[str]] = None,
+                    operators: Union[list[str], tuple[str]] = None, or_ratio: float = 0.5,
+                    invalid: bool = False) -> str:
+    '''
+    Random search phrase nested at most depth groups deep, with 1 to width terms per group.
+    :param fields, fields the predicates use, default the keys of FIELD_OPERATORS
+    :param operators, restrict the operators of FIELD_OPERATORS, a field left without one is not used
+    :param float or_ratio, share of OR between terms, the rest are AND
+    :param bool invalid, break the phrase (parenthesis, character or predicate) so it does not parse
+    '''
+    if depth < 1 or width < 1:
+        raise ValueError("depth and width must be positive")
+
+    fields = tuple(fields or FIELD_OPERATORS)
+    allowed = {
+        field: tuple(op for op in FIELD_OPERATORS.get(field, ("eq", "ne")) if operators is None or op in operators)
+        for field in fields
+    }
+    fields = tuple(field for field in fields if allowed[field])
+    if not fields:
+        raise ValueError("no field can be used with these operators")
+
+    phrase = _group(rng, depth, width, fields, allowed, or_ratio)
+    return _break(rng, phrase) if invalid else phrase
+
+
+def generate_phrases(count: int, seed: int = 0, invalid_ratio: float = 0.0, **options) -> list[str]:
+    '''
+    count phrases from generate_phrase(**options), invalid_ratio of them broken
+    '''
+    rng = random.Random(seed)
+    return [generate_phrase(rng, invalid=rng.random() < invalid_ratio, **options) for _ in range(count)]
+
+
+def generate_planets(count: int, seed: int = 0) -> Iterator[Planet]:
+    '''
+    Yield count unsaved planets, values follow the distributions generate_phrase() draws from
+    '''
+    rng = random.Random(seed)
+    for _ in range(count):
+        description = " ".join(rng.sample(WORDS, rng.randint(2, 6))) if rng.random() < 0.8 else None
+        yield Planet(name=_name(rng), description=description, distance=_distance(rng), date=_date(rng))
+
+
+def load_planets(count: int, seed: int = 0, batch_size: int = 10000, using: str = "default") -> int:
+    '''
+    Insert count generated planets in batches, memory does not grow with count (10 ** 7 rows is fine).
+    Return the highest id before the insert, rows above it are the generated ones.
+    '''
+    start = Planet.objects.using(using).order_by("-id").values_list("id", flat=True).first() or 0
+    planets = generate_planets(count, seed)
+    # saved searches are rebuilt once after the load, not after every batch
+    with deferred_rebuild():
+        while True:
+            batch = list(islice(planets, batch_size))
+            if not batch:
+                break
+            with transaction.atomic(using=using):
+                Planet.objects.using(using).bulk_create(batch)
+    return start
+
+
+def delete_planets(start: int, batch_size: int = 10000, using: str = "default") -> int:
+    '''
+    Delete the planets above id start (see load_planets()) in id range batches, return how many.
+    Rows are deleted in SQL without loading them: their saved search matches go first instead of
+    through the cascade, and a single planets_changed is sent instead of a post_delete per row.
+    '''
+    end = Planet.objects.using(using).aggregate(end=Max("id"))["end"] or start
+    deleted = 0
+    for low in range(start, end, batch_size):
+        with transaction.atomic(using=using):
+            SavedSearchMatch.objects.using(using).filter(
+                planet_id__gt=low, planet_id__lte=low + batch_size)._raw_delete(using)
+            deleted += Planet.objects.using(using).filter(id__gt=low, id__lte=low + batch_size)._raw_delete(using)
+    planets_changed.send(sender=Planet, deleted=True)
+    return deleted
+
+
+def percentile(samples: list[float], fraction: float) -> float:
+    '''
+    Nearest rank percentile of sorted samples
+    '''
+    if not samples:
+        return 0.0
+    return samples[min(len(samples), max(1, math.ceil(fraction * len(samples)))) - 1]
+
+
+def summarize(samples: list[float]) -> dict:
+    samples = sorted(samples)
+    total = sum(samples)
+    return {
+        "count": len(samples),
+        "p50_ms": percentile(samples, 0.5) * 1000,
+        "p99_ms": percentile(samples, 0.99) * 1000,
+        "mean_ms": total / len(samples) * 1000 if samples else 0.0,
+        "max_ms": samples[-1] * 1000 if samples else 0.0,
+        "per_second": len(samples) / total if total else 0.0,
+    }
+
+
+def _page_sql(query: Q, limit: int, using: str) -> tuple:
+    queryset = Planet.objects.using(using).filter(query).order_by("date", "id").values("id", "name", "date")[:limit]
+    return queryset.query.get_compiler(using).as_sql()
+
+
+def _fetch(sql: str, params: tuple, using: str) -> list:
+    with connections[using].cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def run(phrases: list[str], allowed_fields: Union[list[str], tuple[str]], limit: int = 50, execute: bool = True,
+        limits: SearchLimits = None, using: str = "default") -> dict:
+    '''
+    Time every phrase through STAGES, return {"stages": {stage: summarize()}, "rejected": n, "never_match": n}.
+    Phrases over the limits are counted as rejected and not timed, phrases the optimizer
+    proves empty stop after build like the search service does.
+    '''
+    samples = {stage: [] for stage in STAGES}
+    rejected = never_match = 0
+    for phrase in phrases:
+        start = perf_counter()
+        try:
+            tree = ParserSearch.to_ast(allowed_fields, phrase, model=Planet, limits=limits)
+        except SearchLimitError:
+            rejected += 1
+            continue
+        parsed = perf_counter()
+        query = ParserSearch.compile(tree, allowed_fields, model=Planet, optimize=True)
+        built = perf_counter()
+        samples["parse"].append(parsed - start)
+        samples["build"].append(built - parsed)
+        if isinstance(query, EmptyQ):
+            never_match += 1
+            continue
+
+        try:
+            sql, params = _page_sql(query, limit, using)
+        except EmptyResultSet:
+            never_match += 1
+            continue
+        compiled = perf_counter()
+        samples["compile"].append(compiled - built)
+        if execute:
+            _fetch(sql, params, using)
+            samples["execute"].append(perf_counter() - compiled)
+
+    return {
+        "stages": {stage: summarize(values) for stage, values in samples.items() if values},
+        "rejected": rejected,
+        "never_match": never_match,
+    }
+
+
+def compare(baseline: dict, current: dict) -> dict:
+    '''
+    current / baseline ratio of p50 and p99 per stage found in both results, below 1 is faster.
+    Startup timings are compared too when both results have them.
+    '''
+    ratios = {}
+    for stage, stats in current["stages"].items():
+        before = baseline.get("stages", {}).get(stage)
+        if before is None:
+            continue
+        ratios[stage] = {
+            key: stats[key] / before[key] if before[key] else None for key in ("p50_ms", "p99_ms")
+        }
+    if "startup" in current and "startup" in baseline:
+        ratios["startup"] = {
+            key: value / baseline["startup"][key] if baseline["startup"].get(key) else None
+            for key, value in current["startup"].items() if key.endswith("_ms")
+        }
+    return ratios
+
+
+def startup(repeat: int = 5, phrase: str = STARTUP_PHRASE) -> dict:
+    '''
+    Median timings of repeat fresh interpreters (setup_ms, import_ms, first_parse_ms, parse_ms)
+    and the LAZY_MODULES already loaded before the first parse, expected [].
+    '''
+    env = {**os.environ, "DJANGO_SETTINGS_MODULE": os.environ.get("DJANGO_SETTINGS_MODULE", "mytask.settings")}
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", _STARTUP_SCRIPT, json.dumps(LAZY_MODULES), phrase],
+            env=env, check=True, capture_output=True, text=True).stdout
+        runs.append(json.loads(output))
+
+    result = {key: sorted(run[key] for run in runs)[len(runs) // 2] for key in runs[0] if key != "loaded"}
+    result["loaded"] = sorted({name for run in runs for name in run["loaded"]})
+    return result
@@ -0,0 +1,111 @@
+'''
+Result cache for Planet searches.
+
+Keys embed a generation number that is bumped on every Planet write, so a
+write invalidates every cached search without scanning keys. Stale entries
+are never read again and expire with PLANET_SEARCH_CACHE_TIMEOUT.
+
+With the cache disabled the generation is kept in the process, it still tracks
+the writes of this process (see mytask.snapshot) but not those of other ones.
+'''
+import hashlib
+import json
+import threading
+import time
+from typing import Callable
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+
+
+GENERATION_KEY = "planet-search:generation"
+MISSING = object()
+
+
+def get_cache():
+    '''
+    Cache used for search results, None when PLANET_SEARCH_CACHE is None
+    '''
+    alias = getattr(settings, "PLANET_SEARCH_CACHE", "default")
+    return caches[alias] if alias else None
+
+
+def _new_generation() -> int:
+    # time based so a generation lost to eviction is never handed out again
+    return time.time_ns() // 1000
+
+
+# generation used when PLANET_SEARCH_CACHE is None
+_local_generation = _new_generation()
+_local_lock = threading.Lock()
+
+
+def get_generation(cache=None) -> int:
+    cache = cache or get_cache()
+    if cache is None:
+        return _local_generation
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        cache.add(GENERATION_KEY, _new_generation(), timeout=None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def _bump():
+    global _local_generation
+
+    cache = get_cache()
+    if cache is None:
+        with _local_lock:
+            _local_generation += 1
+        return
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, _new_generation(), timeout=None)
+
+
+def invalidate():
+    '''
+    Invalidate every cached search.
+    Inside a transaction the generation is bumped again on commit, a search that ran between the
+    write and the commit may have cached the old rows under the new generation.
+    '''
+    _bump()
+    if connection.in_atomic_block:
+        transaction.on_commit(_bump)
+
+
+def make_key(namespace: str, *parts, cache=None) -> str:
+    digest = hashlib.sha1(json.dumps(parts, cls=DjangoJSONEncoder, sort_keys=True).encode()).hexdigest()
+    return f"planet-search:{get_generation(cache)}:{namespace}:{digest}"
+
+
+def lookup(namespace: str, parts: tuple) -> tuple:
+    '''
+    Return (key, cached value or MISSING), key is None when the cache is disabled.
+    Take the key before computing the value, rows read during a concurrent write land on the old generation.
+    '''
+    cache = get_cache()
+    if cache is None:
+        return None, MISSING
+    key = make_key(namespace, *parts, cache=cache)
+    return key, cache.get(key, MISSING)
+
+
+def store(key: str, value):
+    if key is not None:
+        get_cache().set(key, value, getattr(settings, "PLANET_SEARCH_CACHE_TIMEOUT", 300))
+
+
+def get_or_set(namespace: str, parts: tuple, compute: Callable):
+    '''
+    Return the cached value for (namespace, parts) or store compute() under it
+    '''
+    key, value = lookup(namespace, parts)
+    if value is MISSING:
+        value = compute()
+        store(key, value)
+    return value
@@ -0,0 +1,74 @@
+'''
+Value converters for ParserSearch, picked from the type of the model field a
+predicate targets instead of guessing the type from the text
+'''
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.db import connection, models
+
+
+def to_bool(text_value: str) -> bool:
+    value = text_value.lower()
+    if value in ("true", "1", "yes"):
+        return True
+    if value in ("false", "0", "no"):
+        return False
+    raise ValueError(f"invalid boolean {text_value!r}")
+
+
+def to_int(field: models.IntegerField):
+    '''
+    int() bounded by the range of the column of field, out of range values are a ValueError instead of an
+    OverflowError when the query runs. SQLite does not report a range, its integers are 64 bits.
+    '''
+    minimum, maximum = connection.ops.integer_field_range(field.get_internal_type())
+    minimum = -2 ** 63 if minimum is None else minimum
+    maximum = 2 ** 63 - 1 if maximum is None else maximum
+
+    def convert(text_value: str) -> int:
+        value = int(text_value)
+        if not minimum <= value <= maximum:
+            raise ValueError(f"{text_value!r} is out of range for {field.name!r}")
+        return value
+    return convert
+
+
+# converters built for each field, checked before FIELD_CONVERTERS
+FIELD_CONVERTER_FACTORIES = (
+    (models.IntegerField, to_int),
+)
+
+# first match wins, subclasses must come before their parents
+FIELD_CONVERTERS = (
+    (models.BooleanField, to_bool),
+    (models.DateTimeField, datetime.fromisoformat),
+    (models.DateField, date.fromisoformat),
+    (models.DecimalField, Decimal),
+    (models.FloatField, float),
+    (models.CharField, str),
+    (models.TextField, str),
+)
+
+_MODEL_CONVERTERS = {}
+
+
+def get_converters(model) -> dict:
+    '''
+    Return {field name: converter} for the concrete fields of model, computed once per model
+    '''
+    converters = _MODEL_CONVERTERS.get(model)
+    if converters is None:
+        converters = {}
+        for field in model._meta.concrete_fields:
+            for field_class, factory in FIELD_CONVERTER_FACTORIES:
+                if isinstance(field, field_class):
+                    converters[field.name] = factory(field)
+                    break
+            else:
+                for field_class, converter in FIELD_CONVERTERS:
+                    if isinstance(field, field_class):
+                        converters[field.name] = converter
+                        break
+        _MODEL_CONVERTERS[model] = converters
+    return converters
@@ -0,0 +1,105 @@
+'''
+Database profile helpers: SQLite pragmas and read replica routing for searches.
+
+Pragmas are read from a "PRAGMAS" entry of the DATABASES alias and applied to
+every new connection, ex:
+
+    DATABASES["default"]["PRAGMAS"] = {"journal_mode": "WAL", "synchronous": "NORMAL"}
+
+SearchReplicaRouter sends the reads of the search service, made with
+search_db(), to the aliases listed in PLANET_SEARCH_READ_DATABASES in turn.
+Everything else, writes included, stays on "default". Replicas are copies kept
+up to date outside of Django, a search may not see a write until its replica
+caught up.
+'''
+import itertools
+import re
+import threading
+
+from django.conf import settings
+from django.db import router
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+PRODUCTION_PRAGMAS = {
+    "journal_mode": "WAL",
+    # with WAL only a power loss (not a crash) can lose the last transactions
+    "synchronous": "NORMAL",
+    "mmap_size": 256 * 1024 * 1024,
+    # negative: KiB instead of pages
+    "cache_size": -64 * 1024,
+    "temp_store": "MEMORY",
+    "busy_timeout": 5000,
+}
+REPLICA_PRAGMAS = {
+    **{key: value for key, value in PRODUCTION_PRAGMAS.items() if key not in ("journal_mode", "synchronous")},
+    "query_only": "ON",
+}
+
+_NAME_PATTERN = re.compile(r"[a-z_]+")
+_VALUE_PATTERN = re.compile(r"-?\d+|[A-Za-z_]+")
+
+
+def pragma_statements(pragmas: dict) -> list[str]:
+    statements = []
+    for name, value in pragmas.items():
+        if not _NAME_PATTERN.fullmatch(name) or not _VALUE_PATTERN.fullmatch(str(value)):
+            raise ValueError(f"invalid pragma {name}={value!r}")
+        statements.append(f"PRAGMA {name} = {value}")
+    return statements
+
+
+@receiver(connection_created)
+def apply_pragmas(sender, connection, **kwargs):
+    pragmas = connection.settings_dict.get("PRAGMAS")
+    if connection.vendor != "sqlite" or not pragmas:
+        return
+    with connection.cursor() as cursor:
+        for statement in pragma_statements(pragmas):
+            cursor.execute(statement)
+
+
+class SearchReplicaRouter:
+    '''
+    Route search reads (hint search=True) to PLANET_SEARCH_READ_DATABASES round robin
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._aliases = None
+        self._cycle = None
+
+    def _next_replica(self):
+        aliases = tuple(getattr(settings, "PLANET_SEARCH_READ_DATABASES", ()))
+        if not aliases:
+            return
+        with self._lock:
+            if aliases != self._aliases:
+                self._aliases, self._cycle = aliases, itertools.cycle(aliases)
+            return next(self._cycle)
+
+    def db_for_read(self, model, **hints):
+        if hints.get("search"):
+            return self._next_replica()
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the same rows as default
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas are copies of default, they are never migrated on their own
+        return db not in getattr(settings, "PLANET_SEARCH_READ_DATABASES", ())
+
+
+def search_db(model=None) -> str:
+    '''
+    Alias for the reads of the search service
+    '''
+    if model is None:
+        from .models import Planet
+        model = Planet
+    return router.db_for_read(model, search=True)
@@ -0,0 +1,84 @@
+'''
+Facets of a Planet search: match count, distance histogram and matches per year of date.
+
+Everything comes from one grouped query over (distance bucket, year), the
+count and both histograms are sums over its rows. Results are cached like
+search pages, under the filter part of the page key.
+'''
+from typing import Union
+
+from django.conf import settings
+from django.db.models import Case, Count, IntegerField, Q, QuerySet, Value, When
+from django.db.models.functions import ExtractYear, Mod
+
+from . import cache
+from .parser import Group
+from .search import build_query, filter_query, get_allowed_fields, page_parts
+
+
+DISTANCE_EDGES = (100, 1000, 10000, 100000)
+MAX_EDGES = 50
+
+
+def get_edges(edges: Union[list[int], tuple[int], None] = None) -> tuple[int]:
+    edges = tuple(edges or getattr(settings, "PLANET_SEARCH_FACET_DISTANCE_EDGES", DISTANCE_EDGES))
+    if not all(type(edge) is int for edge in edges) or list(edges) != sorted(set(edges)):
+        raise ValueError("distance edges must be increasing integers")
+    if len(edges) > MAX_EDGES:
+        raise ValueError(f"at most {MAX_EDGES} distance edges")
+    return edges
+
+
+def _buckets(queryset: QuerySet, edges: tuple[int], sample: int) -> list[dict]:
+    if sample > 1:
+        queryset = queryset.annotate(sample_key=Mod("id", sample)).filter(sample_key=0)
+    bucket = Case(
+        *[When(distance__lt=edge, then=Value(index)) for index, edge in enumerate(edges)],
+        default=Value(len(edges)), output_field=IntegerField(),
+    )
+    return list(
+        queryset.order_by()
+        .annotate(bucket=bucket, year=ExtractYear("date"))
+        .values("bucket", "year")
+        .annotate(count=Count("id"))
+    )
+
+
+def compute_facets(query: Q, edges: tuple[int], sample: int = 1) -> dict:
+    '''
+    Facets of the rows matching query, with sample > 1 only ids divisible by sample are counted and the
+    counts are scaled up
+    '''
+    distance = [0] * (len(edges) + 1)
+    years = {}
+    for row in _buckets(filter_query(query), edges, sample):
+        distance[row["bucket"]] += row["count"] * sample
+        years[row["year"]] = years.get(row["year"], 0) + row["count"] * sample
+
+    bounds = [None, *edges, None]
+    return {
+        "count": sum(distance),
+        "distance": [
+            {"from": bounds[index], "to": bounds[index + 1], "count": count} for index, count in enumerate(distance)
+        ],
+        "year": [{"year": year, "count": years[year]} for year in sorted(years)],
+        "approximate": sample > 1,
+    }
+
+
+def facets(search_phrase: str, edges: Union[list[int], tuple[int]] = None, approximate: bool = False,
+           allowed_fields: Union[list[str], tuple[str]] = None, tree: Group = None) -> dict:
+    '''
+    {"count": matches, "distance": [{"from": lower edge or None, "to": upper edge or None, "count": n}, ...],
+     "year": [{"year": 2016, "count": n}, ...], "approximate": bool}
+    A distance bucket holds from <= distance < to. approximate counts one row in PLANET_SEARCH_FACET_SAMPLE.
+    '''
+    if allowed_fields is None:
+        allowed_fields = get_allowed_fields()
+    edges = get_edges(edges)
+    sample = getattr(settings, "PLANET_SEARCH_FACET_SAMPLE", 10) if approximate else 1
+    # same filter part as the page key, the generation invalidates both together
+    search, allowed, *_ = page_parts(search_phrase, None, None, None, None, allowed_fields, tree)
+    return cache.get_or_set(
+        "facets", (search, allowed, edges, sample),
+        lambda: compute_facets(build_query(search_phrase, allowed_fields, tree), edges, sample))
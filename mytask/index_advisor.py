@@ -0,0 +1,149 @@
+'''
+Index advisor for the fields used in ParserSearch filters.
+
+Searches record the (field, lookup) pairs of their Q objects and a sample of
+their SQL in the Django cache, so the numbers are shared by every worker using
+the same cache backend. The advise_indexes command runs EXPLAIN on the sampled
+queries and reports or writes migrations for the missing indexes.
+'''
+import random
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections, models
+from django.db.models import Q, QuerySet
+
+
+USAGE_KEY = "index-advisor:usage"
+SAMPLES_KEY = "index-advisor:samples"
+
+
+def iter_lookups(qobj: Q):
+    '''
+    Yield (field, lookup) for every predicate of qobj
+    '''
+    for child in qobj.children:
+        if isinstance(child, Q):
+            yield from iter_lookups(child)
+            continue
+        field, _, lookup = child[0].partition("__")
+        yield field, lookup or "exact"
+
+
+def get_advisor():
+    '''
+    IndexAdvisor configured by PLANET_SEARCH_INDEX_ADVISOR, None when disabled
+    '''
+    config = getattr(settings, "PLANET_SEARCH_INDEX_ADVISOR", None)
+    return IndexAdvisor(**config) if config is not None else None
+
+
+class IndexAdvisor:
+
+    def __init__(self, sample_rate: float = 0.01, max_samples: int = 200, cache: str = "default"):
+        self.sample_rate = sample_rate
+        self.max_samples = max_samples
+        self.cache = caches[cache]
+
+    def record(self, qobj: Q, queryset: QuerySet = None):
+        # full text lookups are served by the FTS table, not by a b-tree index
+        lookups = Counter(lookup for lookup in iter_lookups(qobj) if lookup[1] != "match")
+        if not lookups:
+            return
+
+        known = self.cache.get(USAGE_KEY) or set()
+        for (field, lookup), uses in lookups.items():
+            key = f"{USAGE_KEY}:{field}:{lookup}"
+            try:
+                self.cache.incr(key, uses)
+            except ValueError:
+                self.cache.add(key, 0, timeout=None)
+                self.cache.incr(key, uses)
+            if key not in known:
+                known = known | {key}
+                self.cache.set(USAGE_KEY, known, timeout=None)
+
+        if queryset is not None and random.random() < self.sample_rate:
+            try:
+                sql, params = queryset.query.sql_with_params()
+            except Exception:
+                # EmptyResultSet and friends, nothing to explain
+                return
+            samples = self.cache.get(SAMPLES_KEY) or []
+            samples.append({"fields": sorted({field for field, _ in lookups}), "sql": sql, "params": params,
+                            "using": queryset.db})
+            self.cache.set(SAMPLES_KEY, samples[-self.max_samples:], timeout=None)
+
+    def reset(self):
+        self.cache.delete_many([USAGE_KEY, SAMPLES_KEY, *(self.cache.get(USAGE_KEY) or ())])
+
+    def usage(self) -> Counter:
+        keys = self.cache.get(USAGE_KEY) or ()
+        return Counter({
+            tuple(key[len(USAGE_KEY) + 1:].split(":")): uses
+            for key, uses in self.cache.get_many(keys).items()
+        })
+
+    def samples(self) -> list[dict]:
+        return self.cache.get(SAMPLES_KEY) or []
+
+    @staticmethod
+    def explain(sample: dict) -> list[str]:
+        connection = connections[sample["using"]]
+        prefix = "EXPLAIN QUERY PLAN" if connection.vendor == "sqlite" else "EXPLAIN"
+        with connection.cursor() as cursor:
+            cursor.execute(f"{prefix} {sample['sql']}", sample["params"])
+            return [str(row[-1]) for row in cursor.fetchall()]
+
+    @staticmethod
+    def is_full_scan(plan: list[str]) -> bool:
+        # sqlite: "SCAN mytask_planet", postgres: "Seq Scan on mytask_planet"
+        return any(line.startswith("SCAN") or "Seq Scan" in line for line in plan)
+
+    @staticmethod
+    def indexed_fields(model) -> set:
+        '''
+        Fields that lead an index of model
+        '''
+        fields = {field.name for field in model._meta.concrete_fields if field.db_index or field.unique}
+        fields.update(index.fields[0].lstrip("-") for index in model._meta.indexes if index.fields)
+        fields.update(fields_[0] for fields_ in model._meta.index_together if fields_)
+        return fields
+
+    def report(self, model, explain: bool = True) -> list[dict]:
+        '''
+        One entry per filtered field ordered by impact: uses, lookups, indexed, sampled and full scan counts
+        '''
+        concrete = {field.name for field in model._meta.concrete_fields}
+        indexed = self.indexed_fields(model)
+        entries = {}
+        for (field, lookup), uses in self.usage().items():
+            if field not in concrete:
+                continue
+            entry = entries.setdefault(field, {
+                "field": field, "uses": 0, "lookups": Counter(), "indexed": field in indexed,
+                "sampled": 0, "full_scans": 0,
+            })
+            entry["uses"] += uses
+            entry["lookups"][lookup] += uses
+
+        if explain:
+            for sample in self.samples():
+                full_scan = self.is_full_scan(self.explain(sample))
+                for field in sample["fields"]:
+                    if field in entries:
+                        entries[field]["sampled"] += 1
+                        entries[field]["full_scans"] += full_scan
+
+        for entry in entries.values():
+            scan_ratio = entry["full_scans"] / entry["sampled"] if entry["sampled"] else 1
+            entry["impact"] = 0 if entry["indexed"] else entry["uses"] * scan_ratio
+        return sorted(entries.values(), key=lambda entry: (-entry["impact"], -entry["uses"], entry["field"]))
+
+    def suggest(self, model, min_uses: int = 1, explain: bool = True) -> list[models.Index]:
+        return [
+            models.Index(fields=[entry["field"]], name=f"{model._meta.model_name}_{entry['field']}_idx"[:30])
+            for entry in self.report(model, explain)
+            if entry["impact"] > 0 and entry["uses"] >= min_uses
+        ]
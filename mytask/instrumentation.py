@@ -0,0 +1,165 @@
+'''
+Per-stage timings for ParserSearch and the search service.
+
+Nothing is measured unless a hook is registered or a request runs inside
+ServerTimingMiddleware. Each measured call reports a stats dict to the hooks:
+
+    {"kind": "parse", "phrase": ..., "engine": ..., "timings": {"tokenize": 0.0001, "coerce": ..., "build": ...},
+     "predicates": 3, "depth": 2}
+    {"kind": "execute", "timings": {"execute": 0.002}, "rows": 50}
+
+Timings are in seconds.
+'''
+import logging
+import threading
+from collections import defaultdict
+from contextvars import ContextVar
+from time import perf_counter
+from typing import Callable
+
+from django.db.models import Q
+
+
+_hooks = []
+# stage -> seconds of the current request, set by ServerTimingMiddleware
+request_timings = ContextVar("request_timings", default=None)
+
+
+def add_hook(hook: Callable[[dict], None]):
+    _hooks.append(hook)
+
+
+def remove_hook(hook: Callable[[dict], None]):
+    _hooks.remove(hook)
+
+
+def is_enabled() -> bool:
+    return bool(_hooks) or request_timings.get() is not None
+
+
+def timed(timings: dict, stage: str, func: Callable, *args):
+    '''
+    Call func(*args), adding its duration to timings[stage] unless timings is None
+    '''
+    if timings is None:
+        return func(*args)
+
+    start = perf_counter()
+    try:
+        return func(*args)
+    finally:
+        timings[stage] = timings.get(stage, 0) + perf_counter() - start
+
+
+def measure(qobj: Q) -> dict:
+    '''
+    Number of predicates and nesting depth of qobj
+    '''
+    predicates = depth = 0
+    stack = [(qobj, 1)]
+    while stack:
+        node, level = stack.pop()
+        depth = max(depth, level)
+        for child in node.children:
+            if isinstance(child, Q):
+                stack.append((child, level + 1))
+            else:
+                predicates += 1
+    return {"predicates": predicates, "depth": depth}
+
+
+def report(stats: dict):
+    timings = request_timings.get()
+    if timings is not None:
+        for stage, seconds in stats["timings"].items():
+            timings[stage] = timings.get(stage, 0) + seconds
+
+    for hook in _hooks:
+        hook(stats)
+
+
+def server_timing(timings: dict) -> str:
+    return ", ".join(f"{stage};dur={seconds * 1000:.3f}" for stage, seconds in timings.items())
+
+
+class LoggingHook:
+
+    def __init__(self, logger: logging.Logger = None, level: int = logging.DEBUG):
+        self.logger = logger or logging.getLogger("mytask.search")
+        self.level = level
+
+    def __call__(self, stats: dict):
+        if self.logger.isEnabledFor(self.level):
+            timings = " ".join(f"{stage}={seconds * 1000:.3f}ms" for stage, seconds in stats["timings"].items())
+            details = " ".join(f"{key}={value}" for key, value in stats.items() if key not in ("kind", "timings"))
+            self.logger.log(self.level, "search %s %s %s", stats["kind"], timings, details)
+
+
+class StatsHook:
+    '''
+    Aggregated count, total and max seconds per stage
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.stages = defaultdict(lambda: {"count": 0, "total": 0.0, "max": 0.0})
+            self.predicates = 0
+            self.max_depth = 0
+
+    def __call__(self, stats: dict):
+        with self._lock:
+            for stage, seconds in stats["timings"].items():
+                entry = self.stages[stage]
+                entry["count"] += 1
+                entry["total"] += seconds
+                entry["max"] = max(entry["max"], seconds)
+            self.predicates += stats.get("predicates", 0)
+            self.max_depth = max(self.max_depth, stats.get("depth", 0))
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "stages": {stage: dict(entry) for stage, entry in self.stages.items()},
+                "predicates": self.predicates,
+                "max_depth": self.max_depth,
+            }
+
+
+class PrometheusHook:
+    '''
+    Histogram of stage durations in the Prometheus text exposition format, see render()
+    '''
+    BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+
+    def __init__(self, name: str = "planet_search_stage_seconds", buckets: tuple = BUCKETS):
+        self.name = name
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._counts = defaultdict(lambda: [0] * len(self.buckets))
+        self._sums = defaultdict(float)
+        self._totals = defaultdict(int)
+
+    def __call__(self, stats: dict):
+        with self._lock:
+            for stage, seconds in stats["timings"].items():
+                counts = self._counts[stage]
+                for index, bound in enumerate(self.buckets):
+                    if seconds <= bound:
+                        counts[index] += 1
+                self._sums[stage] += seconds
+                self._totals[stage] += 1
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} ParserSearch stage duration", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for stage in sorted(self._totals):
+                for bound, count in zip(self.buckets, self._counts[stage]):
+                    lines.append(f'{self.name}_bucket{{stage="{stage}",le="{bound}"}} {count}')
+                lines.append(f'{self.name}_bucket{{stage="{stage}",le="+Inf"}} {self._totals[stage]}')
+                lines.append(f'{self.name}_sum{{stage="{stage}"}} {self._sums[stage]}')
+                lines.append(f'{self.name}_count{{stage="{stage}"}} {self._totals[stage]}')
+        return "\n".join(lines) + "\n"
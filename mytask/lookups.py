@@ -0,0 +1,61 @@
+'''
+Full text "match" lookup backed by an SQLite FTS5 table.
+
+``Planet.objects.filter(description__match="gas giant")`` keeps the rows whose
+description contains the phrase. The FTS5 table of a model is named
+``<db_table>_fts`` and is kept in sync by triggers (see migration 0003).
+'''
+from django.db import NotSupportedError
+from django.db.models import CharField, Lookup, TextField
+from django.db.models.expressions import Col, RawSQL
+from django.core.exceptions import EmptyResultSet
+
+
+def fts_table(model) -> str:
+    return f"{model._meta.db_table}_fts"
+
+
+def fts_phrase(text: str) -> str:
+    '''
+    Quote text as a single FTS5 phrase so user input can not use the FTS query syntax
+    '''
+    return '"%s"' % text.replace('"', '""')
+
+
+def fts_query(columns: list[str], text: str) -> str:
+    return "{%s} : %s" % (" ".join(columns), fts_phrase(text))
+
+
+@CharField.register_lookup
+@TextField.register_lookup
+class FullTextMatch(Lookup):
+    lookup_name = "match"
+    prepare_rhs = False
+
+    def as_sql(self, compiler, connection):
+        raise NotSupportedError("the match lookup needs SQLite FTS5")
+
+    def as_sqlite(self, compiler, connection):
+        if not isinstance(self.lhs, Col):
+            raise NotSupportedError("match can only be used on a model column")
+        text = str(self.rhs).strip()
+        if not text:
+            raise EmptyResultSet
+
+        model = self.lhs.target.model
+        qn = compiler.quote_name_unless_alias
+        table = connection.ops.quote_name(fts_table(model))
+        sql = f"{qn(self.lhs.alias)}.{qn(model._meta.pk.column)} IN (SELECT rowid FROM {table} WHERE {table} MATCH %s)"
+        return sql, [fts_query([self.lhs.target.column], text)]
+
+
+def match_rank(model, text: str, columns: list[str]) -> RawSQL:
+    '''
+    bm25 rank of the rows matching text in columns, lower is better.
+    ex: Planet.objects.annotate(rank=match_rank(Planet, "giant", ["name", "description"])).order_by("rank")
+    '''
+    table = fts_table(model)
+    return RawSQL(
+        f'(SELECT rank FROM "{table}" WHERE "{table}" MATCH %s AND rowid = "{model._meta.db_table}"."{model._meta.pk.column}")',  # noqa: E501
+        [fts_query(columns, text)],
+    )
@@ -0,0 +1,65 @@
+import os
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import migrations
+from django.db.migrations.loader import MigrationLoader
+from django.db.migrations.writer import MigrationWriter
+
+from ...index_advisor import IndexAdvisor, get_advisor
+
+
+class Command(BaseCommand):
+    help = "Report the fields used by searches that lack an index, optionally write a migration adding them"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--model", default="mytask.Planet")
+        parser.add_argument("--min-uses", type=int, default=1)
+        parser.add_argument("--no-explain", action="store_true", help="do not run EXPLAIN on the sampled queries")
+        parser.add_argument("--migration", action="store_true", help="write a migration adding the suggested indexes")
+        parser.add_argument("--reset", action="store_true", help="clear the recorded usage and samples")
+
+    def handle(self, *args, **options):
+        advisor = get_advisor() or IndexAdvisor()
+        if options["reset"]:
+            advisor.reset()
+            self.stdout.write("index advisor data cleared")
+            return
+
+        model = apps.get_model(options["model"])
+        explain = not options["no_explain"]
+        for entry in advisor.report(model, explain):
+            lookups = ", ".join(f"{lookup}={uses}" for lookup, uses in entry["lookups"].most_common())
+            self.stdout.write(
+                f"{entry['field']:<20} uses={entry['uses']:<8} indexed={'yes' if entry['indexed'] else 'no':<4} "
+                f"full_scans={entry['full_scans']}/{entry['sampled']} lookups: {lookups}")
+
+        indexes = advisor.suggest(model, options["min_uses"], explain)
+        if not indexes:
+            self.stdout.write("no missing indexes")
+            return
+
+        for index in indexes:
+            self.stdout.write(f"suggested: models.Index(fields={index.fields!r}, name={index.name!r})")
+        if options["migration"]:
+            path = self.write_migration(model, indexes)
+            self.stdout.write(f"wrote {path}, add the indexes to {model.__name__}.Meta.indexes as well")
+
+    def write_migration(self, model, indexes) -> str:
+        app_label = model._meta.app_label
+        loader = MigrationLoader(None, ignore_no_migrations=True)
+        leaves = loader.graph.leaf_nodes(app_label)
+        if len(leaves) != 1:
+            raise CommandError(f"{app_label} must have exactly one leaf migration")
+
+        number = int(leaves[0][1].split("_")[0]) + 1
+        migration = migrations.Migration(f"{number:04d}_advised_indexes", app_label)
+        migration.dependencies = leaves
+        migration.operations = [migrations.AddIndex(model._meta.model_name, index) for index in indexes]
+
+        writer = MigrationWriter(migration)
+        if os.path.exists(writer.path):
+            raise CommandError(f"{writer.path} already exists")
+        with open(writer.path, "w") as output:
+            output.write(writer.as_string())
+        return writer.path
@@ -0,0 +1,94 @@
+import json
+import platform
+from time import perf_counter
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+
+from ... import bench
+from ...models import Planet
+from ...parser import OPERATORS
+from ...search import get_allowed_fields, get_limits
+
+
+class Command(BaseCommand):
+    help = "Time parsing, Q building, SQL compilation and execution of generated phrases, report JSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--phrases", type=int, default=1000, help="number of generated phrases")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--depth", type=int, default=3, help="maximum nesting of the phrases")
+        parser.add_argument("--width", type=int, default=3, help="maximum terms per group")
+        parser.add_argument("--operators", default=",".join(OPERATORS), help="comma separated operators to use")
+        parser.add_argument("--or-ratio", type=float, default=0.5, help="share of OR between terms")
+        parser.add_argument("--invalid", type=float, default=0.0, help="share of phrases that do not parse")
+        parser.add_argument("--rows", type=int, default=0,
+                            help="insert that many generated planets before the run and delete them after")
+        parser.add_argument("--keep-rows", action="store_true", help="keep the planets inserted by --rows")
+        parser.add_argument("--limit", type=int, default=50, help="page size of the executed queries")
+        parser.add_argument("--no-execute", action="store_true", help="stop after SQL compilation")
+        parser.add_argument("--warmup", type=int, default=100, help="phrases run before measuring")
+        parser.add_argument("--startup", type=int, default=0, metavar="N",
+                            help="also time the startup of N fresh processes (import and first parse)")
+        parser.add_argument("--compare", help="JSON output of an earlier run, adds the p50 / p99 ratios to it")
+        parser.add_argument("-o", "--output", help="write the JSON report to this file instead of stdout")
+
+    def handle(self, *args, **options):
+        for name in ("phrases", "depth", "width", "limit"):
+            if options[name] < 1:
+                raise CommandError(f"--{name} must be positive")
+        if not 0 <= options["invalid"] <= 1 or not 0 <= options["or_ratio"] <= 1:
+            raise CommandError("--invalid and --or-ratio must be between 0 and 1")
+
+        baseline = None
+        if options["compare"]:
+            try:
+                with open(options["compare"]) as baseline_file:
+                    baseline = json.load(baseline_file)
+            except (OSError, ValueError) as ex:
+                raise CommandError(f"can not read {options['compare']}: {ex}")
+
+        allowed_fields = get_allowed_fields()
+        try:
+            phrases = bench.generate_phrases(
+                options["phrases"] + options["warmup"], options["seed"], options["invalid"],
+                depth=options["depth"], width=options["width"], fields=allowed_fields,
+                operators=[op.strip() for op in options["operators"].split(",")], or_ratio=options["or_ratio"])
+        except ValueError as ex:
+            raise CommandError(str(ex))
+
+        start = None
+        if options["rows"]:
+            started = perf_counter()
+            start = bench.load_planets(options["rows"], options["seed"])
+            self.stderr.write(f"inserted {options['rows']} planets in {perf_counter() - started:.1f}s")
+        try:
+            run = {"execute": not options["no_execute"], "limit": options["limit"], "limits": get_limits()}
+            bench.run(phrases[:options["warmup"]], allowed_fields, **run)
+            result = bench.run(phrases[options["warmup"]:], allowed_fields, **run)
+            rows = Planet.objects.count()
+        finally:
+            if start is not None and not options["keep_rows"]:
+                bench.delete_planets(start)
+
+        report = {
+            "settings": {
+                key: options[key] for key in
+                ("phrases", "seed", "depth", "width", "operators", "or_ratio", "invalid", "limit", "warmup")
+            },
+            "rows": rows,
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            **result,
+        }
+        if options["startup"]:
+            report["startup"] = bench.startup(options["startup"])
+        if baseline is not None:
+            report["compare"] = bench.compare(baseline, report)
+
+        output = json.dumps(report, indent=2, sort_keys=True)
+        if options["output"]:
+            with open(options["output"], "w") as output_file:
+                output_file.write(output + "\n")
+        else:
+            self.stdout.write(output)
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ...search import COLUMNS, EXPORT_FORMATS, filter_planets, stream_rows
+
+
+class Command(BaseCommand):
+    help = "Stream the planets matching a search phrase as NDJSON or CSV"
+
+    def add_arguments(self, parser):
+        parser.add_argument("search_phrase", nargs="?", default="", help="ParserSearch phrase, empty exports all rows")
+        parser.add_argument("--format", choices=EXPORT_FORMATS, default="ndjson")
+        parser.add_argument("--fields", default=",".join(COLUMNS), help="comma separated columns")
+        parser.add_argument("--chunk-size", type=int, default=2000)
+        parser.add_argument("--output", "-o", help="output file, defaults to stdout")
+
+    def handle(self, *args, **options):
+        columns = [column.strip() for column in options["fields"].split(",") if column.strip()]
+        try:
+            rows = stream_rows(
+                filter_planets(options["search_phrase"]),
+                export_format=options["format"],
+                columns=columns,
+                chunk_size=options["chunk_size"],
+            )
+            if not options["output"]:
+                for chunk in rows:
+                    self.stdout.write(chunk, ending="")
+                return
+
+            with open(options["output"], "w", newline="") as output:
+                for chunk in rows:
+                    output.write(chunk)
+        except ValueError as ex:
+            raise CommandError(ex)
@@ -0,0 +1,142 @@
+import csv
+import json
+import os
+import sys
+import time
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from ...converters import get_converters
+from ...models import Planet
+from ...saved_searches import deferred_rebuild
+
+
+FORMATS = ("csv", "jsonl")
+FIELDS = ("name", "description", "distance", "date")
+
+
+class Command(BaseCommand):
+    help = "Bulk load planets from a CSV or JSONL file (one object per line)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="input file, - reads stdin")
+        parser.add_argument("--format", choices=FORMATS, help="defaults to the file extension")
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument(
+            "--upsert", action="store_true",
+            help="rows with an id that already exists update that planet instead of inserting a new one")
+        parser.add_argument(
+            "--checkpoint",
+            help="file recording the number of rows already loaded, an interrupted import resumes from it")
+        parser.add_argument("--progress-every", type=int, default=10, help="report progress every N batches")
+
+    def read_rows(self, stream, input_format: str):
+        if input_format == "csv":
+            yield from csv.DictReader(stream)
+            return
+
+        rows = 0
+        for line in stream:
+            line = line.strip()
+            if line:
+                row = json.loads(line)
+                rows += 1
+                if not isinstance(row, dict):
+                    raise CommandError(f"row {rows}: expected a JSON object")
+                yield row
+
+    def coerce(self, row: dict, line: int) -> Planet:
+        converters = get_converters(Planet)
+        values = {}
+        for field in FIELDS:
+            value = row.get(field)
+            if value in (None, "") and field == "description":
+                values[field] = None
+                continue
+            if value in (None, ""):
+                raise CommandError(f"row {line}: missing {field}")
+            if isinstance(value, str):
+                value = value.strip()
+            elif not (field == "distance" and type(value) is int):
+                raise CommandError(f"row {line}: invalid {field} {value!r}")
+            try:
+                # JSON integers go through the converter too for its range check
+                value = converters[field](value)
+            except ValueError:
+                raise CommandError(f"row {line}: invalid {field} {value!r}")
+            values[field] = value
+
+        if row.get("id") not in (None, ""):
+            try:
+                values["id"] = int(row["id"])
+            except (TypeError, ValueError):
+                raise CommandError(f"row {line}: invalid id {row['id']!r}")
+        return Planet(**values)
+
+    def write_batch(self, planets: list, upsert: bool):
+        if upsert:
+            existing = Planet.objects.in_bulk([planet.id for planet in planets if planet.id is not None])
+            updates = [planet for planet in planets if planet.id in existing]
+            if updates:
+                Planet.objects.bulk_update(updates, FIELDS)
+            planets = [planet for planet in planets if planet.id not in existing]
+        Planet.objects.bulk_create(planets)
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        input_format = options["format"] or os.path.splitext(path)[1].lstrip(".").lower()
+        if input_format == "ndjson":
+            input_format = "jsonl"
+        if input_format not in FORMATS:
+            raise CommandError(f"unknown input format, use --format {'/'.join(FORMATS)}")
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be positive")
+
+        checkpoint = options["checkpoint"]
+        done = 0
+        if checkpoint and os.path.exists(checkpoint):
+            with open(checkpoint) as checkpoint_file:
+                done = int(checkpoint_file.read().strip() or 0)
+            self.stdout.write(f"resuming after row {done}")
+
+        stream = sys.stdin if path == "-" else open(path, newline="")
+        started = time.monotonic()
+        loaded = batches = 0
+        try:
+            rows = self.read_rows(stream, input_format)
+            # rows already loaded by a previous run are read but not coerced
+            for _ in islice(rows, done):
+                pass
+
+            # saved searches are rebuilt once after the import, not after every batch
+            with deferred_rebuild():
+                while True:
+                    batch = list(islice(rows, options["batch_size"]))
+                    if not batch:
+                        break
+                    planets = [self.coerce(row, done + loaded + line) for line, row in enumerate(batch, 1)]
+                    with transaction.atomic():
+                        self.write_batch(planets, options["upsert"])
+
+                    loaded += len(batch)
+                    batches += 1
+                    if checkpoint:
+                        with open(checkpoint, "w") as checkpoint_file:
+                            checkpoint_file.write(str(done + loaded))
+                    if batches % options["progress_every"] == 0:
+                        self.report(loaded, started)
+        except (json.JSONDecodeError, csv.Error) as ex:
+            raise CommandError(f"row {done + loaded + 1}: {ex}")
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        self.report(loaded, started)
+        if checkpoint and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+
+    def report(self, loaded: int, started: float):
+        elapsed = max(time.monotonic() - started, 1e-9)
+        self.stdout.write(f"{loaded} rows in {elapsed:.1f}s ({loaded / elapsed:.0f} rows/s)")
@@ -0,0 +1,58 @@
+import json
+
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+
+from ...slow_log import SlowSearchLog, get_log
+
+
+class Command(BaseCommand):
+    help = "Show the searches recorded by the slow search log, optionally aggregated by query shape"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--aggregate", action="store_true", help="one line per query shape, worst first")
+        parser.add_argument("--limit", type=int, default=20, help="entries or shapes to show, 0 for all")
+        parser.add_argument("--json", action="store_true", help="print the entries as JSON")
+        parser.add_argument("--clear", action="store_true", help="delete the recorded searches")
+
+    def handle(self, *args, **options):
+        log = get_log() or SlowSearchLog()
+        if options["clear"]:
+            log.clear()
+            self.stdout.write("slow search log cleared")
+            return
+
+        if options["aggregate"]:
+            items = log.aggregate()
+        else:
+            # most recent first
+            items = log.entries()[::-1]
+        if options["limit"]:
+            items = items[:options["limit"]]
+
+        if options["json"]:
+            self.stdout.write(json.dumps(items, cls=DjangoJSONEncoder, indent=2))
+            return
+        if not items:
+            self.stdout.write("no slow searches recorded")
+            return
+
+        for item in items:
+            if options["aggregate"]:
+                self.stdout.write(
+                    f"{item['total_ms']:>10.1f}ms total  count={item['count']:<6} mean={item['mean_ms']:.1f}ms "
+                    f"max={item['max_ms']:.1f}ms full_scan={'yes' if item['full_scan'] else 'no'}  {item['shape']}")
+                item = item["slowest"]
+                self.write_entry(item, "    slowest: ")
+            else:
+                self.write_entry(item, f"{item['time']} {item['total_ms']:.1f}ms ")
+
+    def write_entry(self, entry: dict, prefix: str):
+        timings = " ".join(f"{stage}={ms:.2f}ms" for stage, ms in entry["timings_ms"].items())
+        self.stdout.write(f"{prefix}{entry['phrase']!r} fields={','.join(entry['allowed_fields'])} {timings}")
+        indent = " " * 4
+        if entry["sql"] is not None:
+            self.stdout.write(f"{indent}sql: {entry['sql']}")
+            self.stdout.write(f"{indent}params: {json.dumps(entry['params'], cls=DjangoJSONEncoder)}")
+        for line in entry["plan"] or ():
+            self.stdout.write(f"{indent}plan: {line}")
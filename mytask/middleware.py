@@ -0,0 +1,44 @@
+import asyncio
+
+from . import instrumentation
+
+
+class ServerTimingMiddleware:
+    '''
+    Add the search stage timings of the request to a Server-Timing header
+    '''
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # mark the instance as a coroutine function so the async view chain is not run in a thread
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self._acall(request)
+
+        timings = {}
+        token = instrumentation.request_timings.set(timings)
+        try:
+            response = self.get_response(request)
+        finally:
+            instrumentation.request_timings.reset(token)
+        return self._add_header(response, timings)
+
+    async def _acall(self, request):
+        timings = {}
+        token = instrumentation.request_timings.set(timings)
+        try:
+            response = await self.get_response(request)
+        finally:
+            instrumentation.request_timings.reset(token)
+        return self._add_header(response, timings)
+
+    @staticmethod
+    def _add_header(response, timings: dict):
+        if timings:
+            response["Server-Timing"] = instrumentation.server_timing(timings)
+        return response
@@ -0,0 +1,25 @@
+# Generated by Django 3.2.12 on 2026-10-17 02:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mytask', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='planet',
+            index=models.Index(fields=['date', 'id'], name='planet_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='planet',
+            index=models.Index(fields=['distance', 'id'], name='planet_distance_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='planet',
+            index=models.Index(fields=['name'], name='planet_name_idx'),
+        ),
+    ]
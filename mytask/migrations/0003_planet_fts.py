@@ -0,0 +1,61 @@
+from django.db import migrations
+
+
+# Django rebuilds SQLite tables for most column changes, which drops these triggers.
+# A later migration changing mytask_planet has to run create_fts again.
+CREATE_FTS = [
+    """
+    CREATE VIRTUAL TABLE mytask_planet_fts USING fts5(
+        name, description, content='mytask_planet', content_rowid='id'
+    )
+    """,
+    """
+    CREATE TRIGGER mytask_planet_fts_insert AFTER INSERT ON mytask_planet BEGIN
+        INSERT INTO mytask_planet_fts(rowid, name, description) VALUES (new.id, new.name, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER mytask_planet_fts_delete AFTER DELETE ON mytask_planet BEGIN
+        INSERT INTO mytask_planet_fts(mytask_planet_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER mytask_planet_fts_update AFTER UPDATE ON mytask_planet BEGIN
+        INSERT INTO mytask_planet_fts(mytask_planet_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+        INSERT INTO mytask_planet_fts(rowid, name, description) VALUES (new.id, new.name, new.description);
+    END
+    """,
+    "INSERT INTO mytask_planet_fts(mytask_planet_fts) VALUES ('rebuild')",
+]
+
+DROP_FTS = [
+    "DROP TRIGGER IF EXISTS mytask_planet_fts_insert",
+    "DROP TRIGGER IF EXISTS mytask_planet_fts_delete",
+    "DROP TRIGGER IF EXISTS mytask_planet_fts_update",
+    "DROP TABLE IF EXISTS mytask_planet_fts",
+]
+
+
+def create_fts(apps, schema_editor):
+    if schema_editor.connection.vendor == "sqlite":
+        for sql in CREATE_FTS:
+            schema_editor.execute(sql)
+
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor == "sqlite":
+        for sql in DROP_FTS:
+            schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mytask', '0002_planet_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts, drop_fts),
+    ]
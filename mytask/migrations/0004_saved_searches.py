@@ -0,0 +1,44 @@
+# Generated by Django 3.2.12 on 2026-10-17 03:19
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mytask', '0003_planet_fts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SavedSearch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200, unique=True)),
+                ('phrase', models.TextField()),
+                ('allowed_fields', models.JSONField(blank=True, default=list)),
+                ('tree', models.TextField(editable=False)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SavedSearchMatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('planet', models.ForeignKey(
+                    on_delete=django.db.models.deletion.CASCADE, related_name='+', to='mytask.planet')),
+                ('saved_search', models.ForeignKey(
+                    on_delete=django.db.models.deletion.CASCADE, related_name='matches', to='mytask.savedsearch')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='savedsearch',
+            name='planets',
+            field=models.ManyToManyField(
+                related_name='saved_searches', through='mytask.SavedSearchMatch', to='mytask.Planet'),
+        ),
+        migrations.AddConstraint(
+            model_name='savedsearchmatch',
+            constraint=models.UniqueConstraint(fields=('saved_search', 'planet'), name='saved_search_match_unique'),
+        ),
+    ]
@@ -1,5 +1,44 @@
 from django.db import models
 
+from .signals import planets_changed
+
+
+class PlanetQuerySet(models.QuerySet):
+    '''
+    Bulk writes do not send post_save / post_delete, send planets_changed instead
+    '''
+
+    def bulk_create(self, objs, *args, **kwargs):
+        result = super().bulk_create(objs, *args, **kwargs)
+        # the ids are only known when the database returns them or they were given
+        pks = [planet.pk for planet in result]
+        planets_changed.send(sender=self.model, pks=pks if None not in pks else None)
+        return result
+
+    def bulk_update(self, objs, *args, **kwargs):
+        objs = tuple(objs)
+        result = super().bulk_update(objs, *args, **kwargs)
+        planets_changed.send(sender=self.model, pks=[planet.pk for planet in objs])
+        return result
+
+    def update(self, **kwargs):
+        # the rows are selected first, the update may move them out of the filter
+        pks = list(self.values_list("pk", flat=True))
+        result = super().update(**kwargs)
+        if result:
+            # rows written in between are not known, report every row
+            planets_changed.send(sender=self.model, pks=pks if result == len(pks) else None)
+        return result
+    update.alters_data = True
+
+    def delete(self):
+        result = super().delete()
+        if result[0]:
+            planets_changed.send(sender=self.model, deleted=True)
+        return result
+    delete.alters_data = True
+    delete.queryset_only = True
+
 
 class Planet(models.Model):
     name = models.CharField(max_length=300)
@@ -9,5 +48,42 @@ class Planet(models.Model):
     # Found date
     date = models.DateField()
 
+    objects = PlanetQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # keyset pagination orders on (date, id) and (distance, id), range filters use the leading column
+            models.Index(fields=["date", "id"], name="planet_date_id_idx"),
+            models.Index(fields=["distance", "id"], name="planet_distance_id_idx"),
+            models.Index(fields=["name"], name="planet_name_idx"),
+        ]
+
     def __str__(self) -> str:
         return self.name
+
+
+class SavedSearch(models.Model):
+    '''
+    Search phrase whose matching planets are kept in SavedSearchMatch, see mytask.saved_searches
+    '''
+    name = models.CharField(max_length=200, unique=True)
+    phrase = models.TextField()
+    # empty: PLANET_SEARCH_ALLOWED_FIELDS when saved
+    allowed_fields = models.JSONField(default=list, blank=True)
+    # mytask.ast_format JSON of the parsed phrase, set from phrase on every save
+    tree = models.TextField(editable=False)
+    planets = models.ManyToManyField(Planet, through="SavedSearchMatch", related_name="saved_searches")
+
+    def __str__(self) -> str:
+        return self.name
+
+
+class SavedSearchMatch(models.Model):
+    saved_search = models.ForeignKey(SavedSearch, on_delete=models.CASCADE, related_name="matches")
+    planet = models.ForeignKey(Planet, on_delete=models.CASCADE, related_name="+")
+
+    class Meta:
+        constraints = [
+            # also the index of the saved search -> planets join
+            models.UniqueConstraint(fields=["saved_search", "planet"], name="saved_search_match_unique"),
+        ]
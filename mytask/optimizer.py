@@ -0,0 +1,306 @@
+'''
+Optimization pass over the Q objects built by ParserSearch.
+
+The Q tree is rewritten into a small boolean tree, simplified and turned back
+into a Q object:
+- nested groups with the same operator are flattened
+- bounds on the same field joined by AND are merged into the tightest bound,
+  or into ``__range`` when the field is discrete (IntegerField, DateField)
+- ``field eq A OR field eq B ...`` becomes ``field__in``
+- provably unsatisfiable phrases become EmptyQ, which Django answers without a query
+'''
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from typing import NamedTuple
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db import models
+from django.db.models import Q
+
+
+LOOKUPS = ("exact", "gt", "gte", "lt", "lte", "in", "range")
+
+
+class EmptyQ(Q):
+    '''
+    Q object that never matches, filter(EmptyQ()) returns an empty queryset without hitting the database
+    '''
+
+    def __init__(self, *args, **kwargs):
+        if not args and not kwargs:
+            kwargs = {"pk__in": []}
+        super().__init__(*args, **kwargs)
+
+
+class _Leaf(NamedTuple):
+    field: str
+    # None for lookups the optimizer does not understand, those are kept as they are
+    lookup: str
+    value: object
+    negated: bool = False
+
+
+class _Bool(NamedTuple):
+    connector: str
+    children: list
+    negated: bool = False
+
+
+# an empty AND always matches, an empty OR never does
+_TRUE = _Bool(Q.AND, [])
+_FALSE = _Bool(Q.OR, [])
+
+
+def _from_q(qobj: Q) -> _Bool:
+    children = []
+    for child in qobj.children:
+        if isinstance(child, Q):
+            children.append(_from_q(child))
+            continue
+
+        key, value = child
+        field, _, lookup = key.rpartition("__")
+        if not field:
+            field, lookup = key, "exact"
+        elif lookup not in LOOKUPS:
+            field, lookup = key, None
+        children.append(_Leaf(field, lookup, value))
+
+    return _Bool(qobj.connector, children, qobj.negated)
+
+
+def _family(value):
+    '''
+    Values of the same family can be ordered against each other
+    '''
+    if isinstance(value, bool):
+        return
+    if isinstance(value, (int, float, Decimal)):
+        return "number"
+    if isinstance(value, datetime):
+        # a DateField truncates datetimes, only midnight keeps strict bounds exact
+        return "date" if value.tzinfo is None and value.time() == time() else None
+    if isinstance(value, date):
+        return "date"
+    if isinstance(value, str):
+        return "str"
+
+
+def _step(field_name: str, value, model):
+    '''
+    Distance to the next possible value of a discrete field, None when the field is not discrete
+    '''
+    if model is None:
+        return
+    try:
+        field = model._meta.get_field(field_name)
+    except FieldDoesNotExist:
+        return
+
+    if isinstance(field, models.IntegerField) and type(value) is int:
+        return 1
+    if isinstance(field, models.DateField) and not isinstance(field, models.DateTimeField) and type(value) is date:
+        return timedelta(days=1)
+
+
+def _in_bounds(value, lower, upper) -> bool:
+    if lower is not None and (value < lower[0] or (value == lower[0] and not lower[1])):
+        return False
+    if upper is not None and (value > upper[0] or (value == upper[0] and not upper[1])):
+        return False
+    return True
+
+
+def _merge_field(field: str, leaves: list, model):
+    '''
+    Merge the predicates on one field joined by AND.
+    Return the replacement leaves, _FALSE for a contradiction or None when the values can not be reasoned about.
+    '''
+    eq, ne, allowed = [], [], None
+    # (value, inclusive)
+    lower = upper = None
+    try:
+        for leaf in leaves:
+            if leaf.negated:
+                ne.append(leaf.value)
+            elif leaf.lookup == "exact":
+                eq.append(leaf.value)
+            elif leaf.lookup == "in":
+                values = list(leaf.value)
+                allowed = values if allowed is None else [value for value in allowed if value in values]
+            else:
+                if leaf.lookup == "range":
+                    bounds = [("gte", leaf.value[0]), ("lte", leaf.value[1])]
+                else:
+                    bounds = [(leaf.lookup, leaf.value)]
+                for lookup, value in bounds:
+                    bound = (value, lookup.endswith("e"))
+                    if lookup.startswith("g"):
+                        if lower is None or value > lower[0] or (value == lower[0] and not bound[1]):
+                            lower = bound
+                    elif upper is None or value < upper[0] or (value == upper[0] and not bound[1]):
+                        upper = bound
+
+        values = eq + ne + (allowed or []) + [bound[0] for bound in (lower, upper) if bound is not None]
+        families = {_family(value) for value in values}
+        if len(families) != 1 or None in families:
+            return
+
+        if families == {"str"}:
+            # string comparisons depend on the database collation, only same value contradictions are safe
+            if any(value in ne for value in eq):
+                return _FALSE
+            return
+
+        if len(set(eq)) > 1:
+            return _FALSE
+        if eq:
+            allowed = [value for value in eq if allowed is None or value in allowed]
+        if allowed is not None:
+            allowed = [value for value in dict.fromkeys(allowed) if value not in ne and _in_bounds(value, lower, upper)]
+            if not allowed:
+                return _FALSE
+            if len(allowed) == 1:
+                return [_Leaf(field, "exact", allowed[0])]
+            return [_Leaf(field, "in", allowed)]
+
+        ne = [value for value in dict.fromkeys(ne) if _in_bounds(value, lower, upper)]
+        if lower is not None and upper is not None:
+            step = _step(field, lower[0], model)
+            if step is not None and _step(field, upper[0], model) is not None:
+                lower = lower if lower[1] else (lower[0] + step, True)
+                upper = upper if upper[1] else (upper[0] - step, True)
+
+            if lower[0] > upper[0] or (lower[0] == upper[0] and not (lower[1] and upper[1])):
+                return _FALSE
+            if lower[0] == upper[0]:
+                return _FALSE if lower[0] in ne else [_Leaf(field, "exact", lower[0])]
+            if lower[1] and upper[1] and step is not None:
+                return [_Leaf(field, "range", (lower[0], upper[0]))] + [_Leaf(field, "exact", v, True) for v in ne]
+    except TypeError:
+        return
+
+    merged = []
+    if lower is not None:
+        merged.append(_Leaf(field, "gte" if lower[1] else "gt", lower[0]))
+    if upper is not None:
+        merged.append(_Leaf(field, "lte" if upper[1] else "lt", upper[0]))
+    return merged + [_Leaf(field, "exact", value, True) for value in ne]
+
+
+def _merge_and(children: list, model):
+    by_field = {}
+    for child in children:
+        if isinstance(child, _Leaf) and child.lookup is not None and (not child.negated or child.lookup == "exact"):
+            by_field.setdefault(child.field, []).append(child)
+
+    result = []
+    for child in children:
+        leaves = by_field.get(child.field) if isinstance(child, _Leaf) else None
+        if not leaves or len(leaves) < 2 or not any(child is leaf for leaf in leaves):
+            result.append(child)
+            continue
+        if leaves[0] is not child:
+            # already merged on the first predicate of the field
+            continue
+
+        merged = _merge_field(child.field, leaves, model)
+        if merged is _FALSE:
+            return _FALSE
+        result.extend(leaves if merged is None else merged)
+    return result
+
+
+def _merge_or(children: list) -> list:
+    values_by_field = {}
+    for child in children:
+        if isinstance(child, _Leaf) and not child.negated and child.lookup in ("exact", "in"):
+            # "field = NULL" is an IS NULL lookup and can not go into IN
+            if child.lookup == "exact" and child.value is None:
+                continue
+            values_by_field.setdefault(child.field, []).append(child)
+
+    result = []
+    for child in children:
+        leaves = values_by_field.get(child.field) if isinstance(child, _Leaf) else None
+        if not leaves or len(leaves) < 2 or not any(child is leaf for leaf in leaves):
+            result.append(child)
+            continue
+        if leaves[0] is not child:
+            continue
+
+        values = []
+        for leaf in leaves:
+            values.extend([leaf.value] if leaf.lookup == "exact" else leaf.value)
+        try:
+            values = list(dict.fromkeys(values))
+        except TypeError:
+            result.extend(leaves)
+            continue
+        result.append(_Leaf(child.field, "in", values) if len(values) > 1 else _Leaf(child.field, "exact", values[0]))
+    return result
+
+
+def _negate(node):
+    if node is _TRUE:
+        return _FALSE
+    if node is _FALSE:
+        return _TRUE
+    return node._replace(negated=not node.negated)
+
+
+def _simplify(node, model):
+    if isinstance(node, _Leaf):
+        return node
+
+    absorbing, neutral = (_FALSE, _TRUE) if node.connector == Q.AND else (_TRUE, _FALSE)
+    children = []
+    for child in node.children:
+        child = _simplify(child, model)
+        if child is absorbing:
+            return _negate(absorbing) if node.negated else absorbing
+        if child is neutral:
+            continue
+        if isinstance(child, _Bool) and not child.negated and \
+                (child.connector == node.connector or len(child.children) == 1):
+            children.extend(child.children)
+        else:
+            children.append(child)
+
+    children = _merge_and(children, model) if node.connector == Q.AND else _merge_or(children)
+    if children is _FALSE:
+        result = _FALSE
+    elif not children:
+        result = neutral
+    elif len(children) == 1:
+        result = children[0]
+    else:
+        result = _Bool(node.connector, children)
+    return _negate(result) if node.negated else result
+
+
+def _to_q(node) -> Q:
+    if isinstance(node, _Leaf):
+        key = node.field if node.lookup in ("exact", None) else f"{node.field}__{node.lookup}"
+        qobj = Q(**{key: node.value})
+        return ~qobj if node.negated else qobj
+
+    children = [
+        (child.field if child.lookup in ("exact", None) else f"{child.field}__{child.lookup}", child.value)
+        if isinstance(child, _Leaf) and not child.negated else _to_q(child)
+        for child in node.children
+    ]
+    return Q(*children, _connector=node.connector, _negated=node.negated)
+
+
+def optimize(qobj: Q, model=None) -> Q:
+    '''
+    Return an equivalent, simplified Q object, EmptyQ when qobj can never match.
+    :param model, optional model class, enables __range rewrites for its discrete fields
+    '''
+    node = _simplify(_from_q(qobj), model)
+    if node is _FALSE:
+        return EmptyQ()
+    if node is _TRUE:
+        return Q()
+    return _to_q(node)
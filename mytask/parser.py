@@ -1,22 +1,206 @@
 import re
-from typing import Union
-from datetime import datetime
-from ast import literal_eval
-
-from dateutil.parser import parse, ParserError
-from pyparsing import Word, alphanums, nestedExpr
-from pyparsing.exceptions import ParseException
+import copy
+import threading
+from collections import OrderedDict
+from decimal import Decimal
+from typing import NamedTuple, Union
+from datetime import date, datetime
 
+from django.core.exceptions import ValidationError
 from django.db.models import Q
+from django.utils.hashable import make_hashable
+
+from . import instrumentation, optimizer
+from .converters import get_converters
 
 
-WORD = Word(alphanums + " " + "-")
+# pyparsing, dateutil and the pyparsing grammar are loaded by the first parse that needs them
+# (or ParserSearch.warm_up()), workers and commands that never search do not pay for them
 AND = "AND"
 OR = "OR"
 
+ENGINE_NATIVE = "native"
+ENGINE_PYPARSING = "pyparsing"
+OPERATORS = ("ne", "eq", "gt", "lt", "match")
+
+PREDICATE_PATTERN = re.compile(r'(?P<field>[A-Za-z-0-9_]+) (?P<op>ne|eq|gt|lt|match) (?P<value>[\w\W]+)')
+# same character set accepted by the pyparsing grammar words, anything else outside double quotes is a syntax error
+_INVALID_CHAR_PATTERN = re.compile(r'[^A-Za-z0-9\s()-]')
+_QUOTED_PATTERN = re.compile(r'"[^"]*"')
+_TOKEN_PATTERN = re.compile(r'"[^"]*"|[()]|[^\s()"]+')
+
+
+class SearchPhraseError(ValueError):
+    '''
+    Raised when a search phrase can not be turned into an expression tree
+    '''
+
+
+class SearchLimitError(SearchPhraseError):
+    '''
+    Raised when a search phrase exceeds one of the SearchLimits, limit is the name of the SearchLimits field
+    '''
+
+    def __init__(self, limit: str, value: int, maximum: int):
+        super().__init__(f"search phrase exceeds {limit}: {value} > {maximum}")
+        self.limit = limit
+        self.value = value
+        self.maximum = maximum
+
+    def as_dict(self) -> dict:
+        return {"error": str(self), "limit": self.limit, "value": self.value, "maximum": self.maximum}
+
+
+class SearchLimits(NamedTuple):
+    # None disables a limit
+    max_length: int = 2000
+    max_depth: int = 16
+    max_predicates: int = 64
+    max_fields: int = 16
+
+
+class Predicate(NamedTuple):
+    field: str
+    op: str
+    # text as written in the phrase, the converted value once resolved
+    value: object
+
+
+class Group(NamedTuple):
+    # (operator, node) pairs, folded left to right with the operator that was
+    # in effect when the node was read
+    items: tuple
+
+
+# values that stay in the shape of a tree (see ParserSearch.split_values), they change the SQL (IS NULL)
+# or have too few values to stand for a query parameter
+_STRUCTURAL_VALUES = (bool, type(None))
+# values that can be shared between a cached Q and the copies handed out
+_IMMUTABLE_VALUES = (str, int, float, Decimal, date, tuple, frozenset, type(None))
+
+
+def _copy_q(qobj: Q) -> Q:
+    clone = copy.copy(qobj)
+    clone.children = [
+        _copy_q(child) if isinstance(child, Q) else
+        child if isinstance(child[1], _IMMUTABLE_VALUES) else (child[0], copy.deepcopy(child[1]))
+        for child in qobj.children
+    ]
+    return clone
+
+
+class PhraseCache:
+    '''
+    Bounded LRU cache of parsed search phrases.
+    Stored and returned Q objects are copies, callers may combine or mutate them freely.
+    '''
+
+    def __init__(self, maxsize: int = 256):
+        if maxsize < 1:
+            raise ValueError("maxsize must be a positive number")
+
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key) -> Union[Q, None]:
+        with self._lock:
+            qobj = self._data.get(key)
+            if qobj is None:
+                self.misses += 1
+                return
+            self._data.move_to_end(key)
+            self.hits += 1
+        return _copy_q(qobj)
+
+    def set(self, key, qobj: Q):
+        qobj = _copy_q(qobj)
+        with self._lock:
+            self._data[key] = qobj
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+        }
+
+
+def _init_worker():
+    # spawned (not forked) workers start without the app registry, models are needed for the converters
+    from django.apps import apps
+    if not apps.ready:
+        import django
+        django.setup()
+
+
+def _parse_chunk(args) -> list:
+    allowed_fields, phrases, options = args
+    if options.pop("as_ast"):
+        return [ParserSearch.to_ast(allowed_fields, phrase, options["model"], options["limits"]) for phrase in phrases]
+    return [ParserSearch.parse(allowed_fields, phrase, use_cache=False, **options) for phrase in phrases]
+
+
+def _q_key(qobj: Q, keys: dict):
+    '''
+    Hashable key equal for equal Q objects. Q.__hash__ hashes every subtree twice per level
+    (make_hashable), exponential in the nesting depth; keys are memoized per object instead.
+    keys holds the objects too, so their ids are not reused while it lives.
+    '''
+    entry = keys.get(id(qobj))
+    if entry is None:
+        children = []
+        for child in qobj.children:
+            if isinstance(child, Q):
+                children.append(_q_key(child, keys))
+            else:
+                try:
+                    children.append(make_hashable(child))
+                except TypeError:
+                    # unhashable values are compared by identity, at worst a duplicate is kept
+                    children.append(("id", id(child)))
+        entry = keys[id(qobj)] = (qobj, (type(qobj), qobj.connector, qobj.negated, tuple(children)))
+    return entry[1]
+
+
+def _word():
+    from pyparsing import Word, alphanums
+    return Word(alphanums + " " + "-")
+
+
+def __getattr__(name: str):
+    # WORD used to be built on import, it is still available
+    if name == "WORD":
+        return _word()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 class ParserSearch:
-    _PARSER = nestedExpr(opener='(', closer=')', content=WORD)
+    # nestedExpr grammar of the pyparsing engine, built by _grammar()
+    _PARSER = None
+    _PARSER_LOCK = threading.Lock()
+    ENGINE = ENGINE_NATIVE
+    # PhraseCache instance, see enable_cache()
+    cache = None
+    # SearchLimits applied when parse() is not given limits, None accepts any phrase
+    LIMITS = None
 
     @staticmethod
     def _parse_value(text_value: str) -> Union[str, int, bool, datetime]:
@@ -28,6 +212,9 @@ class ParserSearch:
         if text_value.isdigit():
             return int(text_value)
 
+        from ast import literal_eval
+        from dateutil.parser import parse, ParserError
+
         # parse datetime format
         try:
             return parse(text_value)
@@ -37,29 +224,60 @@ class ParserSearch:
         # parse other format
         try:
             return literal_eval(text_value)
-        except ValueError:
+        except (ValueError, SyntaxError):
+            return text_value
+
+    @classmethod
+    def _coerce_value(cls, field: str, text_value: str, converters: dict = None, op: str = None):
+        '''
+        Convert the value with the converter of the model field, fallback to _parse_value.
+        A double quoted value is a string literal and full text ("match") values are never converted.
+        '''
+        text_value = text_value.strip()
+        quoted = _QUOTED_PATTERN.fullmatch(text_value) is not None
+        if quoted:
+            text_value = text_value[1:-1]
+        if op == "match":
+            cls._check_match(field, converters)
             return text_value
 
+        converter = converters.get(field) if converters else None
+        if converter is None:
+            return text_value if quoted else cls._parse_value(text_value)
+
+        try:
+            return converter(text_value)
+        except (ValueError, ArithmeticError):
+            raise SearchPhraseError(f"invalid value {text_value!r} for field {field!r}")
+
+    @staticmethod
+    def _check_match(field: str, converters: Union[dict, None]):
+        # full text search only exists on text fields (see mytask.lookups), without a model anything goes
+        if converters is not None and converters.get(field) is not str:
+            raise SearchPhraseError(f"match is only supported on text fields, not on {field!r}")
+
     @staticmethod
     def _clean_query_string(query_string: str):
         return re.split(r'(AND|OR)', query_string)
 
+    @staticmethod
+    def _predicate_query(field: str, op: str, value) -> Q:
+        field = "%s" % (field + "__" + op) if op not in ["eq", "ne"] else field
+        qobj = Q(**{field: value})
+        return ~qobj if op == "ne" else qobj
+
     @classmethod
-    def _make_query(cls, allowed_fields: Union[list[str], tuple[str]], query_string: str):
-        query = re.match(
-            r'(?P<field>[A-Za-z-0-9_]+) (?P<op>ne|eq|gt|lt) (?P<value>[\w\W]+)',
-            query_string).groupdict()
+    def _make_query(cls, allowed_fields: Union[list[str], tuple[str]], query_string: str, converters: dict = None):
+        query = PREDICATE_PATTERN.match(query_string).groupdict()
 
         if query["field"] not in allowed_fields:
             return
 
-        op = query["op"]
-        field = "%s" % (query["field"] + "__" + op) if op not in ["eq", "ne"] else query["field"]
-        qobj = Q(**{field: cls._parse_value(query["value"])})
-        return ~qobj if op == "ne" else qobj
+        value = cls._coerce_value(query["field"], query["value"], converters, query["op"])
+        return cls._predicate_query(query["field"], query["op"], value)
 
     @classmethod
-    def _build_query(cls, allowed_fields: Union[list[str], tuple[str]], raw_data):
+    def _build_query(cls, allowed_fields: Union[list[str], tuple[str]], raw_data, converters: dict = None):
         qobj = Q()
         last_op = AND
         idx = 0
@@ -69,7 +287,7 @@ class ParserSearch:
             idx += 1
 
             if isinstance(item, list):
-                item = cls._build_query(allowed_fields, item)
+                item = cls._build_query(allowed_fields, item, converters)
 
             if isinstance(item, str):
                 item = item.strip()
@@ -84,7 +302,7 @@ class ParserSearch:
                     item = cleaned_query[0]
 
                 if item:
-                    item = cls._make_query(allowed_fields, item)
+                    item = cls._make_query(allowed_fields, item, converters)
 
             if isinstance(item, Q):
                 if last_op == AND:
@@ -97,6 +315,275 @@ class ParserSearch:
 
         return qobj
 
+    @staticmethod
+    def _make_predicate(text: str) -> Predicate:
+        query = PREDICATE_PATTERN.match(text)
+        if query is None:
+            raise SearchPhraseError(f"invalid predicate {text!r}")
+        return Predicate(query["field"], query["op"], query["value"])
+
+    @classmethod
+    def _build_tree(cls, search_phrase: str) -> Group:
+        '''
+        Tokenize and parse the search phrase in a single pass.
+        AND / OR share one precedence level and fold left to right, a missing
+        operator between two terms reuses the last one of the same group.
+        '''
+        if _INVALID_CHAR_PATTERN.search(_QUOTED_PATTERN.sub("", search_phrase)):
+            raise SearchPhraseError("search phrase contains invalid characters")
+
+        # one entry per open parenthesis: collected items and the current operator
+        groups = [[]]
+        ops = [AND]
+        start = end = None
+
+        for token in _TOKEN_PATTERN.finditer(search_phrase):
+            text = token.group()
+            if text not in ("(", ")", AND, OR):
+                if start is None:
+                    start = token.start()
+                end = token.end()
+                continue
+
+            if start is not None:
+                cls._add_term(groups[-1], ops, search_phrase[start:end])
+                start = None
+
+            if text == "(":
+                groups.append([])
+                ops.append(AND)
+            elif text == ")":
+                if len(groups) == 1:
+                    raise SearchPhraseError("unbalanced closing parenthesis")
+                items = groups.pop()
+                ops.pop()
+                groups[-1].append((ops[-1], Group(tuple(items))))
+            else:
+                ops[-1] = text
+
+        if start is not None:
+            cls._add_term(groups[-1], ops, search_phrase[start:end])
+        if len(groups) != 1:
+            raise SearchPhraseError("unbalanced opening parenthesis")
+
+        return Group(tuple(groups[0]))
+
+    @classmethod
+    def _add_term(cls, items: list, ops: list, text: str):
+        # keywords are upper case, inside a predicate "and" / "or" are part of the value ("Black and White"),
+        # on their own (between groups) they are keywords in any case like the pyparsing engine reads them
+        if text.upper() in (AND, OR):
+            ops[-1] = text.upper()
+        else:
+            items.append((ops[-1], cls._make_predicate(text)))
+
+    @staticmethod
+    def check_depth(depth: int, limits: SearchLimits):
+        if limits.max_depth is not None and depth > limits.max_depth:
+            raise SearchLimitError("max_depth", depth, limits.max_depth)
+
+    @staticmethod
+    def check_counts(predicates: int, fields: int, limits: SearchLimits):
+        if limits.max_predicates is not None and predicates > limits.max_predicates:
+            raise SearchLimitError("max_predicates", predicates, limits.max_predicates)
+        if limits.max_fields is not None and fields > limits.max_fields:
+            raise SearchLimitError("max_fields", fields, limits.max_fields)
+
+    @classmethod
+    def check_limits(cls, search_phrase: str, limits: SearchLimits):
+        '''
+        Linear pre-scan of the phrase, raise SearchLimitError on the first exceeded limit.
+        Only counts tokens, a phrase within the limits can still be invalid.
+        '''
+        if limits.max_length is not None and len(search_phrase) > limits.max_length:
+            raise SearchLimitError("max_length", len(search_phrase), limits.max_length)
+
+        depth = predicates = 0
+        fields = set()
+        # the next word starts a predicate
+        predicate_start = True
+        for token in _TOKEN_PATTERN.finditer(search_phrase):
+            text = token.group()
+            if text == "(":
+                depth += 1
+                cls.check_depth(depth, limits)
+            elif text == ")":
+                depth -= 1
+            elif text in (AND, OR) or (predicate_start and text.upper() in (AND, OR)):
+                pass
+            elif predicate_start:
+                predicates += 1
+                fields.add(text)
+                cls.check_counts(predicates, len(fields), limits)
+                predicate_start = False
+                continue
+            else:
+                continue
+            predicate_start = True
+
+    @staticmethod
+    def _walk(node: Group, convert, combine):
+        '''
+        Rebuild node bottom up with an explicit stack, nesting depth is not bounded by the recursion limit.
+        convert(predicate) returns the new item or None to drop it, combine([(op, item), ...]) builds a group.
+        '''
+        # one frame per open group: remaining items, converted items, operator of the group in its parent
+        stack = [(iter(node.items), [], None)]
+        while True:
+            items, converted, parent_op = stack[-1]
+            for op, item in items:
+                if isinstance(item, Group):
+                    stack.append((iter(item.items), [], op))
+                    break
+                item = convert(item)
+                if item is not None:
+                    converted.append((op, item))
+            else:
+                stack.pop()
+                group = combine(converted)
+                if not stack:
+                    return group
+                stack[-1][1].append((parent_op, group))
+
+    @classmethod
+    def _resolve(cls, allowed_fields: Union[list[str], tuple[str]], node: Group, converters: dict = None) -> Group:
+        '''
+        Convert the predicate values, predicates on fields outside allowed_fields are dropped
+        '''
+        def convert(item: Predicate):
+            if item.field in allowed_fields:
+                return item._replace(value=cls._coerce_value(item.field, item.value, converters, item.op))
+
+        return cls._walk(node, convert, lambda items: Group(tuple(items)))
+
+    @classmethod
+    def _restrict(cls, allowed_fields: Union[list[str], tuple[str]], node: Group) -> Group:
+        return cls._walk(
+            node, lambda item: item if item.field in allowed_fields else None, lambda items: Group(tuple(items)))
+
+    @classmethod
+    def _check_value(cls, model, item: Predicate, converter):
+        if item.value is None:
+            # eq / ne None is an isnull lookup
+            if item.op not in ("eq", "ne"):
+                raise ValueError("None can only be compared with eq or ne")
+            return None
+        if isinstance(item.value, str):
+            return converter(item.value)
+        if item.op == "match":
+            raise ValueError("match takes a string")
+
+        # the value is kept (ex: a float on an integer field is rounded by the lookup), it is only checked
+        value = model._meta.get_field(item.field).to_python(item.value)
+        if type(value) is int:
+            # only integer fields give an int, their converter bounds it to the column range
+            converter(value)
+        return item.value
+
+    @classmethod
+    def check_tree(cls, tree: Group, model) -> Group:
+        '''
+        Check the predicates of a tree that may come from a client against the fields of model and convert
+        their values like to_ast() converts the values of a phrase (ex: "2016-05-01" for a date field).
+        Raise ASTFormatError for a predicate the model can not run.
+        '''
+        from .ast_format import ASTFormatError
+
+        converters = get_converters(model)
+
+        def check(item: Predicate):
+            if item.op == "match":
+                try:
+                    cls._check_match(item.field, converters)
+                except SearchPhraseError as ex:
+                    raise ASTFormatError(str(ex))
+            converter = converters.get(item.field)
+            if converter is None:
+                return item
+            try:
+                return item._replace(value=cls._check_value(model, item, converter))
+            except (ValidationError, ValueError, TypeError, ArithmeticError):
+                raise ASTFormatError(f"invalid value {item.value!r} for field {item.field!r}")
+
+        return cls._walk(tree, check, lambda items: Group(tuple(items)))
+
+    @classmethod
+    def _compile(cls, node: Union[Group, Predicate]) -> Q:
+        if isinstance(node, Predicate):
+            return cls._predicate_query(node.field, node.op, node.value)
+
+        keys = {}
+        return cls._walk(
+            node, lambda item: cls._predicate_query(item.field, item.op, item.value),
+            lambda items: cls._fold(items, keys))
+
+    @staticmethod
+    def _fold(items, keys: dict = None) -> Q:
+        '''
+        Same tree as folding ``Q() & a | b ...`` left to right, but the
+        accumulated node is extended in place instead of being copied on every
+        step, so long phrases stay linear.
+        keys memoizes the deduplication keys of the Q objects (see _q_key), share it across the folds of one tree.
+        '''
+        if keys is None:
+            keys = {}
+        qobj = Q()
+        seen = None
+        for op, item in items:
+            if not item:
+                continue
+            if not qobj:
+                qobj, seen = item, None
+                continue
+
+            if qobj.negated or (qobj.connector != op and len(qobj) > 1):
+                qobj, seen = Q(qobj, _connector=op), None
+            qobj.connector = op
+
+            # Node.add() deduplicates with a linear scan, keep a set instead
+            if seen is None:
+                seen = set()
+                for child in qobj.children:
+                    if isinstance(child, Q):
+                        seen.add(_q_key(child, keys))
+            key = _q_key(item, keys)
+            if key in seen:
+                continue
+
+            if not item.negated and (item.connector == op or len(item) == 1):
+                children = item.children
+            else:
+                children = [item]
+            qobj.children.extend(children)
+            for child in children:
+                if isinstance(child, Q):
+                    seen.add(_q_key(child, keys))
+
+        return qobj
+
+    @classmethod
+    def _grammar(cls):
+        if cls._PARSER is None:
+            from pyparsing import nestedExpr
+
+            with cls._PARSER_LOCK:
+                if cls._PARSER is None:
+                    cls._PARSER = nestedExpr(opener='(', closer=')', content=_word())
+        return cls._PARSER
+
+    @classmethod
+    def _parse_pyparsing(cls, allowed_fields: Union[list[str], tuple[str]], search_phrase: str,
+                         converters: dict = None, timings: dict = None):
+        from pyparsing.exceptions import ParseException
+
+        try:
+            raw_data = instrumentation.timed(
+                timings, "tokenize", lambda: cls._grammar().parseString(f"({search_phrase})", parseAll=True).as_list())
+            # values are converted while the query is built
+            return instrumentation.timed(timings, "build", cls._build_query, allowed_fields, raw_data, converters)
+        except (ParseException, AttributeError, SearchPhraseError, RecursionError):
+            return Q()
+
     @staticmethod
     def _validate_parse_input(allowed_fields: Union[list[str], tuple[str]], search_phrase: str):
         if not isinstance(allowed_fields, (list, tuple)):
@@ -106,7 +593,174 @@ class ParserSearch:
             raise ValueError
 
     @classmethod
-    def parse(cls, allowed_fields: Union[list[str], tuple[str]], search_phrase: str):
+    def warm_up(cls):
+        '''
+        Load what the first parse would load: pyparsing, its grammar and the dateutil value parser.
+        For long lived or preforked workers that should not pay for it on their first request.
+        '''
+        cls._grammar()
+        # no model: values go through _parse_value and dateutil
+        cls.parse(["name", "date"], "date gt 2000-01-01 AND (name eq Mars OR name ne Venus)", use_cache=False)
+
+    @classmethod
+    def enable_cache(cls, maxsize: int = 256) -> PhraseCache:
+        '''
+        Cache parsed phrases keyed on the stripped phrase and the allowed fields set
+        '''
+        cls.cache = PhraseCache(maxsize)
+        return cls.cache
+
+    @classmethod
+    def disable_cache(cls):
+        cls.cache = None
+
+    @classmethod
+    def _parse(cls, allowed_fields: Union[list[str], tuple[str]], search_phrase: str, engine: str, model=None,
+               optimize: bool = False, timings: dict = None):
+        converters = get_converters(model) if model is not None else None
+        timed = instrumentation.timed
+        if engine == ENGINE_PYPARSING:
+            qobj = cls._parse_pyparsing(allowed_fields, search_phrase, converters, timings)
+        elif engine == ENGINE_NATIVE:
+            try:
+                tree = timed(timings, "tokenize", cls._build_tree, search_phrase)
+                tree = timed(timings, "coerce", cls._resolve, allowed_fields, tree, converters)
+                qobj = timed(timings, "build", cls._compile, tree)
+            except SearchPhraseError:
+                qobj = Q()
+        else:
+            raise ValueError(f"unknown parser engine {engine!r}")
+
+        try:
+            return timed(timings, "optimize", optimizer.optimize, qobj, model) if optimize else qobj
+        except RecursionError:
+            # the optimizer and Q comparisons recurse, nesting they can not walk is an invalid phrase
+            return Q()
+
+    @classmethod
+    def to_ast(cls, allowed_fields: Union[list[str], tuple[str]], search_phrase: str, model=None,
+               limits: SearchLimits = None) -> Group:
+        '''
+        Parse the search phrase into a tree of Group and Predicate with converted values,
+        see mytask.ast_format to serialize it and compile() to turn it into a Q object.
+        Always uses the native tokenizer, an invalid phrase returns an empty Group like parse() returns Q().
+        '''
+        cls._validate_parse_input(allowed_fields, search_phrase)
+        limits = limits or cls.LIMITS
+        if limits is not None:
+            cls.check_limits(search_phrase, limits)
+
+        converters = get_converters(model) if model is not None else None
+        try:
+            return cls._resolve(allowed_fields, cls._build_tree(search_phrase), converters)
+        except SearchPhraseError:
+            return Group(())
+
+    @classmethod
+    def compile(cls, tree: Group, allowed_fields: Union[list[str], tuple[str]], model=None,
+                optimize: bool = False) -> Q:
+        '''
+        Q object of a tree from to_ast() or mytask.ast_format, no text is parsed.
+        Predicates on fields outside allowed_fields are dropped, the tree may come from a client.
+        With a model the predicates are checked too (see check_tree()).
+        '''
+        if not isinstance(allowed_fields, (list, tuple)) or not isinstance(tree, Group):
+            raise ValueError
+
+        timings = {} if instrumentation.is_enabled() else None
+        timed = instrumentation.timed
+        tree = cls._restrict(allowed_fields, tree)
+        if model is not None:
+            tree = cls.check_tree(tree, model)
+        qobj = timed(timings, "build", cls._compile, tree)
+        if optimize:
+            try:
+                qobj = timed(timings, "optimize", optimizer.optimize, qobj, model)
+            except RecursionError:
+                raise SearchPhraseError("search tree is nested too deeply")
+
+        if timings is not None:
+            instrumentation.report({"kind": "compile", "timings": timings, **instrumentation.measure(qobj)})
+        return qobj
+
+    @classmethod
+    def split_values(cls, node: Union[Group, Predicate], values: list = None) -> tuple:
+        '''
+        Return (shape, values) of a to_ast() tree. The shape is hashable and the same for trees that only
+        differ in predicate values of the same type, bind(shape, values) rebuilds the tree.
+        '''
+        if values is None:
+            values = []
+        if isinstance(node, Predicate):
+            if isinstance(node.value, _STRUCTURAL_VALUES):
+                return ("P", node.field, node.op, True, node.value), values
+            values.append(node.value)
+            return ("P", node.field, node.op, False, type(node.value)), values
+        return ("G", tuple((op, cls.split_values(item, values)[0]) for op, item in node.items)), values
+
+    @classmethod
+    def bind(cls, shape: tuple, values) -> Union[Group, Predicate]:
+        values = iter(values)
+
+        def build(shape):
+            if shape[0] == "P":
+                _, field, op, structural, value = shape
+                return Predicate(field, op, value if structural else next(values))
+            return Group(tuple((op, build(item)) for op, item in shape[1]))
+
+        return build(shape)
+
+    @classmethod
+    def parse_many(cls, allowed_fields: Union[list[str], tuple[str]], phrases, model=None, optimize: bool = False,
+                   as_ast: bool = False, processes: int = None, chunksize: int = 500) -> list:
+        '''
+        Parse many phrases, results are in the order of phrases.
+        Identical phrases (ignoring surrounding whitespace) are parsed once, duplicates get copies of the Q.
+        :param bool as_ast, return to_ast() trees instead of Q objects
+        :param int processes, parse in a pool of that many worker processes, chunksize phrases per task.
+        None or 1 parses in this process (and uses ParserSearch.cache).
+        Errors such as SearchLimitError are raised like in parse().
+        '''
+        if not isinstance(allowed_fields, (list, tuple)):
+            raise ValueError
+        phrases = list(phrases)
+        for phrase in phrases:
+            cls._validate_parse_input(allowed_fields, phrase)
+
+        unique = list(dict.fromkeys(phrase.strip() for phrase in phrases))
+        if processes is None or processes <= 1 or len(unique) <= chunksize:
+            if as_ast:
+                parsed = [cls.to_ast(allowed_fields, phrase, model) for phrase in unique]
+            else:
+                parsed = [cls.parse(allowed_fields, phrase, model=model, optimize=optimize) for phrase in unique]
+        else:
+            # class attributes are not carried over to spawned workers
+            options = {"model": model, "optimize": optimize, "as_ast": as_ast, "engine": cls.ENGINE,
+                       "limits": cls.LIMITS}
+            chunks = [
+                (allowed_fields, unique[start:start + chunksize], dict(options))
+                for start in range(0, len(unique), chunksize)
+            ]
+            from concurrent.futures import ProcessPoolExecutor
+
+            with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker) as executor:
+                parsed = [result for chunk in executor.map(_parse_chunk, chunks) for result in chunk]
+
+        results = dict(zip(unique, parsed))
+        seen = set()
+        output = []
+        for phrase in phrases:
+            phrase = phrase.strip()
+            result = results[phrase]
+            if phrase in seen and not as_ast:
+                result = _copy_q(result)
+            seen.add(phrase)
+            output.append(result)
+        return output
+
+    @classmethod
+    def parse(cls, allowed_fields: Union[list[str], tuple[str]], search_phrase: str, engine: str = None,
+              use_cache: bool = True, model=None, optimize: bool = False, limits: SearchLimits = None):
         '''
         Parse text string to Q object
         :param Union[list, tuple, None] allowed_fields, if None then return all field in search_phrase
@@ -123,10 +777,37 @@ class ParserSearch:
         - "date gt 2000-01-01 AND distance gt 2000 OR name eq Mars OR name ne Saturnus"
         - (date ne 2016-05-01) AND (((distance gt 20) OR (distance lt 10)) AND (name eq momon))
         - (date ne 2016-05-01) AND ((((distance gt 20) OR (distance lt 10)) AND (name eq momon)) AND (date gt 2000-01-01)) OR (name ne Neptunus)"  # noqa: E501
+        - 'description match "gas giant" AND name ne "Mars 2"' (double quoted values are plain strings,
+          "match" is a full text search, see mytask.lookups)
+
+        :param str engine, "native" (default, linear time tokenizer) or "pyparsing" (the original nestedExpr parser)
+        :param bool use_cache, look the phrase up in ParserSearch.cache when the cache is enabled
+        :param model, optional model class, values of its fields are converted by field type
+        (ex: Planet, "distance gt 20" -> int, "date eq 2016-05-01" -> date, "name eq 2016" -> str)
+        :param bool optimize, simplify the Q tree (see mytask.optimizer), a phrase that can never match
+        returns optimizer.EmptyQ which Django answers without a query
+        :param SearchLimits limits, default ParserSearch.LIMITS, a phrase over the limits raises SearchLimitError
+        before it is parsed
         '''
         cls._validate_parse_input(allowed_fields, search_phrase)
-        try:
-            raw_data = cls._PARSER.parseString(f"({search_phrase})", parseAll=True).as_list()
-            return cls._build_query(allowed_fields, raw_data)
-        except (ParseException, AttributeError):
-            return Q()
+        limits = limits or cls.LIMITS
+        if limits is not None:
+            cls.check_limits(search_phrase, limits)
+        engine = engine or cls.ENGINE
+        timings = {} if instrumentation.is_enabled() else None
+        cache = cls.cache if use_cache else None
+        if cache is None:
+            qobj = cls._parse(allowed_fields, search_phrase, engine, model, optimize, timings)
+        else:
+            key = (engine, model, optimize, frozenset(allowed_fields), search_phrase.strip())
+            qobj = instrumentation.timed(timings, "cache", cache.get, key)
+            if qobj is None:
+                qobj = cls._parse(allowed_fields, search_phrase, engine, model, optimize, timings)
+                cache.set(key, qobj)
+
+        if timings is not None:
+            instrumentation.report({
+                "kind": "parse", "phrase": search_phrase, "engine": engine, "timings": timings,
+                **instrumentation.measure(qobj),
+            })
+        return qobj
@@ -0,0 +1,207 @@
+'''
+Saved searches with materialized results.
+
+SavedSearchMatch holds the planets matching every SavedSearch, reading a
+saved search is a join on that table instead of a search over Planet:
+
+    Planet.objects.filter(saved_searches__name="giants")
+
+The matches of a saved search are rebuilt when it is saved. After that they
+are maintained row by row: a saved Planet is checked against every saved
+search with one query on that planet's row and its matches are added or
+removed, deleted planets lose theirs through the foreign key cascade. Bulk
+writes (planets_changed) update the rows they wrote the same way, in chunks.
+
+Matches are written in the transaction of the write, they roll back with it.
+Only writes whose rows are not known (bulk_create without returned ids, raw
+fixture rows) rebuild every saved search, once their transaction commits and
+once per transaction however many writes it holds. Bulk loaders committing
+batch after batch run in deferred_rebuild() to rebuild once at the end.
+'''
+from contextlib import contextmanager
+from contextvars import ContextVar
+from itertools import islice
+
+from django.db import transaction
+from django.db.models import Count, Q, QuerySet
+from django.db.models.signals import post_save, pre_save
+from django.dispatch import receiver
+
+from . import ast_format
+from .models import Planet, SavedSearch, SavedSearchMatch
+from .optimizer import EmptyQ
+from .parser import Group, ParserSearch, SearchPhraseError
+from .search import get_allowed_fields, get_limits
+from .signals import planets_changed
+
+
+# saved searches and planets checked per query when planets change
+CHUNK_SIZE = 100
+ROW_CHUNK_SIZE = 500
+BATCH_SIZE = 5000
+
+# {"pending": bool} inside deferred_rebuild()
+_deferred = ContextVar("deferred_rebuild", default=None)
+
+
+def compile_search(saved_search: SavedSearch) -> Q:
+    tree = ast_format.loads(saved_search.tree)
+    return ParserSearch.compile(tree, saved_search.allowed_fields, model=Planet, optimize=True)
+
+
+def _has_predicate(node: Group) -> bool:
+    return any(not isinstance(item, Group) or _has_predicate(item) for _, item in node.items)
+
+
+def rebuild(saved_search: SavedSearch):
+    '''
+    Replace the matches of saved_search with a full search
+    '''
+    query = compile_search(saved_search)
+    with transaction.atomic():
+        SavedSearchMatch.objects.filter(saved_search=saved_search).delete()
+        if isinstance(query, EmptyQ):
+            return
+        ids = Planet.objects.filter(query).values_list("id", flat=True).iterator(chunk_size=BATCH_SIZE)
+        while True:
+            batch = list(islice(ids, BATCH_SIZE))
+            if not batch:
+                break
+            SavedSearchMatch.objects.bulk_create(
+                [SavedSearchMatch(saved_search=saved_search, planet_id=pk) for pk in batch])
+
+
+def rebuild_all():
+    for saved_search in SavedSearch.objects.all():
+        rebuild(saved_search)
+
+
+def schedule_rebuild():
+    '''
+    Run rebuild_all() when the current transaction commits, at once outside of one.
+    A rebuild already waiting for the commit is not scheduled again.
+    '''
+    deferred = _deferred.get()
+    if deferred is not None:
+        deferred["pending"] = True
+        return
+    connection = transaction.get_connection()
+    if connection.in_atomic_block and any(entry[1] is rebuild_all for entry in connection.run_on_commit):
+        return
+    transaction.on_commit(rebuild_all)
+
+
+@contextmanager
+def deferred_rebuild():
+    '''
+    Hold the rebuilds bulk writes ask for in the block and schedule a single one when it ends
+    '''
+    if _deferred.get() is not None:
+        yield
+        return
+
+    deferred = {"pending": False}
+    token = _deferred.set(deferred)
+    try:
+        yield
+    finally:
+        _deferred.reset(token)
+        # batches committed before an error still changed the planets
+        if deferred["pending"]:
+            schedule_rebuild()
+
+
+def _matches(pks: list, queries: dict) -> set:
+    '''
+    (planet id, saved search id) of the planets pks matching the saved searches (id -> Q),
+    one conditional count per search and planet
+    '''
+    # a filter that can never match (ex: an empty full text phrase) is compiled to a constant 0 count
+    rows = Planet.objects.filter(pk__in=pks).order_by().values("id").annotate(
+        **{f"search_{search_id}": Count("id", filter=query) for search_id, query in queries.items()})
+    return {(row["id"], search_id) for row in rows for search_id in queries if row[f"search_{search_id}"]}
+
+
+def update_planets(pks):
+    '''
+    Add or remove the planets pks from the matches of every saved search
+    '''
+    saved_searches = list(SavedSearch.objects.only("id", "tree", "allowed_fields"))
+    if not saved_searches:
+        return
+
+    queries = {}
+    for saved_search in saved_searches:
+        query = compile_search(saved_search)
+        if not isinstance(query, EmptyQ):
+            queries[saved_search.pk] = query
+
+    items = list(queries.items())
+    pks = list(pks)
+    for start in range(0, len(pks), ROW_CHUNK_SIZE):
+        chunk = pks[start:start + ROW_CHUNK_SIZE]
+        matches = set()
+        for search_start in range(0, len(items), CHUNK_SIZE):
+            matches |= _matches(chunk, dict(items[search_start:search_start + CHUNK_SIZE]))
+
+        current = {
+            (planet_id, search_id): match_id for match_id, planet_id, search_id in
+            SavedSearchMatch.objects.filter(planet_id__in=chunk).values_list("id", "planet_id", "saved_search_id")
+        }
+        if current.keys() - matches:
+            SavedSearchMatch.objects.filter(id__in=[current[key] for key in current.keys() - matches]).delete()
+        if matches - current.keys():
+            SavedSearchMatch.objects.bulk_create([
+                SavedSearchMatch(saved_search_id=search_id, planet_id=planet_id)
+                for planet_id, search_id in matches - current.keys()])
+
+
+def update_planet(pk: int):
+    update_planets([pk])
+
+
+def saved_search_planets(saved_search: SavedSearch, using: str = None) -> QuerySet:
+    '''
+    Planets matching saved_search, read from the materialized matches
+    '''
+    return Planet.objects.using(using).filter(saved_searches=saved_search)
+
+
+@receiver(pre_save, sender=SavedSearch)
+def _parse_saved_search(sender, instance, **kwargs):
+    if not instance.allowed_fields:
+        instance.allowed_fields = get_allowed_fields()
+    if not isinstance(instance.allowed_fields, list) or \
+            not all(isinstance(field, str) for field in instance.allowed_fields):
+        raise ValueError("allowed_fields must be a list of field names")
+
+    tree = ParserSearch.to_ast(instance.allowed_fields, instance.phrase, model=Planet, limits=get_limits())
+    if instance.phrase.strip() and not _has_predicate(tree):
+        raise SearchPhraseError("saved search phrase has no valid predicate on the allowed fields")
+    instance.tree = ast_format.dumps(tree)
+
+
+@receiver(post_save, sender=SavedSearch)
+def _saved_search_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        rebuild(instance)
+
+
+@receiver(post_save, sender=Planet)
+def _planet_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        # loaddata saves every row of the fixture in one transaction, rebuild once after it
+        schedule_rebuild()
+    else:
+        update_planet(instance.pk)
+
+
+@receiver(planets_changed)
+def _planets_changed(sender, pks=None, deleted=False, **kwargs):
+    # deleted planets lost their matches through the foreign key cascade
+    if deleted:
+        return
+    if pks is None:
+        schedule_rebuild()
+    else:
+        update_planets(pks)
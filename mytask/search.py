@@ -0,0 +1,301 @@
+'''
+Planet search service, shared by the views and the management commands
+'''
+import csv
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+from datetime import date
+from typing import Iterator, Union
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q, QuerySet
+
+from . import ast_format, cache, db, index_advisor, instrumentation, slow_log, snapshot, sql_templates
+from .models import Planet
+from .optimizer import EmptyQ
+from .parser import Group, ParserSearch, SearchLimits
+
+
+# keyset orderings, always paired with "id" so the order is total
+ORDERINGS = ("date", "-date", "distance", "-distance")
+COLUMNS = ("id", "name", "description", "distance", "date")
+EXPORT_FORMATS = ("ndjson", "csv")
+
+
+class CursorError(ValueError):
+    '''
+    Raised for a cursor that was not issued for the current ordering
+    '''
+
+
+def get_allowed_fields() -> list[str]:
+    return list(getattr(settings, "PLANET_SEARCH_ALLOWED_FIELDS", ["name", "distance", "date"]))
+
+
+def get_limits() -> Union[SearchLimits, None]:
+    config = getattr(settings, "PLANET_SEARCH_LIMITS", None)
+    return SearchLimits(**config) if config is not None else None
+
+
+def filter_planets(search_phrase: str, allowed_fields: Union[list[str], tuple[str]] = None,
+                   tree: Group = None) -> QuerySet:
+    '''
+    Planet queryset filtered by the search phrase, no query is made for a phrase that can never match.
+    A pre-parsed tree (see ParserSearch.to_ast) replaces the phrase and is only compiled.
+    '''
+    return filter_query(build_query(search_phrase, allowed_fields, tree))
+
+
+def build_query(search_phrase: str, allowed_fields: Union[list[str], tuple[str]] = None, tree: Group = None) -> Q:
+    if allowed_fields is None:
+        allowed_fields = get_allowed_fields()
+    if tree is not None:
+        return ParserSearch.compile(tree, allowed_fields, model=Planet, optimize=True)
+    return ParserSearch.parse(allowed_fields, search_phrase, model=Planet, optimize=True, limits=get_limits())
+
+
+def filter_query(query: Q) -> QuerySet:
+    '''
+    Planet queryset of a query from build_query(), recorded by the index advisor
+    '''
+    if isinstance(query, EmptyQ):
+        return Planet.objects.none()
+
+    queryset = Planet.objects.using(db.search_db()).filter(query)
+    advisor = index_advisor.get_advisor()
+    if advisor is not None:
+        advisor.record(query, queryset)
+    return queryset
+
+
+def encode_cursor(ordering: str, row: dict) -> str:
+    key = ordering.lstrip("-")
+    value = row[key].isoformat() if isinstance(row[key], date) else row[key]
+    data = json.dumps([ordering, value, row["id"]], separators=(",", ":"))
+    return urlsafe_b64encode(data.encode()).decode().rstrip("=")
+
+
+def decode_cursor(ordering: str, cursor: str) -> tuple:
+    try:
+        data = urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        cursor_ordering, value, pk = json.loads(data)
+        if cursor_ordering != ordering or not isinstance(pk, int):
+            raise CursorError("cursor does not belong to this ordering")
+        if ordering.lstrip("-") == "date":
+            value = date.fromisoformat(value)
+        elif not isinstance(value, int):
+            raise CursorError("invalid cursor")
+    except (BinasciiError, UnicodeDecodeError, TypeError, ValueError) as ex:
+        raise CursorError(str(ex) if isinstance(ex, CursorError) else "invalid cursor")
+    return value, pk
+
+
+def _validate_columns(columns: Union[list[str], tuple[str], None]) -> list[str]:
+    columns = list(columns or COLUMNS)
+    unknown = set(columns) - set(COLUMNS)
+    if unknown:
+        raise ValueError(f"unknown columns {', '.join(sorted(unknown))}")
+    return columns
+
+
+def _page_args(ordering: str, cursor: Union[str, None], limit: Union[int, None],
+               columns: Union[list[str], tuple[str], None]) -> tuple:
+    '''
+    Validated (limit, columns, filter of the rows after the cursor or None)
+    '''
+    if ordering not in ORDERINGS:
+        raise ValueError(f"ordering must be one of {', '.join(ORDERINGS)}")
+    max_limit = getattr(settings, "PLANET_SEARCH_MAX_PAGE_SIZE", 500)
+    limit = limit or getattr(settings, "PLANET_SEARCH_PAGE_SIZE", 50)
+    if not 0 < limit <= max_limit:
+        raise ValueError(f"limit must be between 1 and {max_limit}")
+
+    columns = _validate_columns(columns)
+
+    key = ordering.lstrip("-")
+    after = None
+    if cursor:
+        value, pk = decode_cursor(ordering, cursor)
+        lookup = "lt" if ordering.startswith("-") else "gt"
+        after = Q(**{f"{key}__{lookup}": value}) | Q(**{key: value, f"id__{lookup}": pk})
+
+    # the cursor needs the ordering key and the id of the last row
+    for column in ("id", key):
+        if column not in columns:
+            columns.append(column)
+    return limit, columns, after
+
+
+def _fetch(fetch, *args) -> list[dict]:
+    timings = {} if instrumentation.is_enabled() else None
+    rows = instrumentation.timed(timings, "execute", fetch, *args)
+    if timings is not None:
+        instrumentation.report({"kind": "execute", "timings": timings, "rows": len(rows)})
+    return rows
+
+
+def _page(rows: list[dict], ordering: str, limit: int) -> dict:
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(ordering, rows[-1])
+    return {"results": rows, "next": next_cursor}
+
+
+def paginate(queryset: QuerySet, ordering: str = "date", cursor: str = None, limit: int = None,
+             columns: Union[list[str], tuple[str]] = None) -> dict:
+    '''
+    Keyset (seek) pagination over (ordering, id), page N costs the same as the first page.
+    Return {"results": [row dict, ...], "next": cursor of the next page or None}
+    '''
+    limit, columns, after = _page_args(ordering, cursor, limit, columns)
+    if after is not None:
+        queryset = queryset.filter(after)
+    queryset = queryset.order_by(ordering, "-id" if ordering.startswith("-") else "id").values(*columns)[:limit + 1]
+    slow_log.statement(queryset.query.sql_with_params, queryset.db)
+    return _page(_fetch(list, queryset), ordering, limit)
+
+
+def paginate_snapshot(planets: snapshot.PlanetSnapshot, query: Q, ordering: str = "date", cursor: str = None,
+                      limit: int = None, columns: Union[list[str], tuple[str]] = None) -> dict:
+    '''
+    paginate() answered from the in-memory snapshot, raise snapshot.Unsupported when query needs the database
+    '''
+    limit, columns, after = _page_args(ordering, cursor, limit, columns)
+    if after is not None:
+        query = query & after
+    mask = planets.evaluate(query)
+    return _page(_fetch(planets.rows, mask, columns, ordering, limit + 1), ordering, limit)
+
+
+def paginate_template(templates: sql_templates.TemplateCache, tree: Group,
+                      allowed_fields: Union[list[str], tuple[str]], ordering: str = "date", cursor: str = None,
+                      limit: int = None, columns: Union[list[str], tuple[str]] = None) -> dict:
+    '''
+    paginate() with the SQL compiled once per shape of the tree (see mytask.sql_templates),
+    raise sql_templates.Untemplatable when the ORM has to build the query
+    '''
+    limit, columns, _ = _page_args(ordering, cursor, limit, columns)
+    shape, values = ParserSearch.split_values(ParserSearch.check_tree(tree, Planet))
+    predicates = len(values)
+    if cursor:
+        value, pk = decode_cursor(ordering, cursor)
+        values += [value, value, pk]
+
+    def make_queryset(values: list) -> QuerySet:
+        query = ParserSearch.compile(ParserSearch.bind(shape, values[:predicates]), allowed_fields)
+        queryset = Planet.objects.using(db.search_db()).filter(query)
+        if cursor:
+            key = ordering.lstrip("-")
+            lookup = "lt" if ordering.startswith("-") else "gt"
+            queryset = queryset.filter(
+                Q(**{f"{key}__{lookup}": values[-3]}) | Q(**{key: values[-2], f"id__{lookup}": values[-1]}))
+        order = (ordering, "-id" if ordering.startswith("-") else "id")
+        return queryset.order_by(*order).values(*columns)[:limit + 1]
+
+    key = (shape, tuple(allowed_fields), ordering, bool(cursor), limit, tuple(columns))
+    template = templates.get_or_build(key, make_queryset, values)
+    using = db.search_db()
+    slow_log.statement(lambda: (template.sql, sql_templates.bind_params(template, values)), using)
+    return _page(_fetch(sql_templates.execute, template, values, using), ordering, limit)
+
+
+def compute_page(search_phrase: str, allowed_fields: Union[list[str], tuple[str]], tree: Union[Group, None],
+                 ordering: str, cursor: Union[str, None], limit: Union[int, None],
+                 columns: Union[list[str], tuple[str], None]) -> dict:
+    '''
+    Uncached search page from the snapshot, an SQL template or the ORM, whichever applies first.
+    Slow pages are recorded by the slow search log (see mytask.slow_log).
+    '''
+    log = slow_log.get_log()
+    if log is None:
+        return _compute_page(search_phrase, allowed_fields, tree, ordering, cursor, limit, columns)
+    with log.watch(search_phrase, allowed_fields, tree, Planet, ordering=ordering, cursor=cursor):
+        return _compute_page(search_phrase, allowed_fields, tree, ordering, cursor, limit, columns)
+
+
+def _compute_page(search_phrase: str, allowed_fields: Union[list[str], tuple[str]], tree: Union[Group, None],
+                  ordering: str, cursor: Union[str, None], limit: Union[int, None],
+                  columns: Union[list[str], tuple[str], None]) -> dict:
+    planets = snapshot.get_snapshot()
+    if planets is not None:
+        try:
+            return paginate_snapshot(
+                planets, build_query(search_phrase, allowed_fields, tree), ordering, cursor, limit, columns)
+        except snapshot.Unsupported:
+            pass
+
+    templates = sql_templates.get_cache()
+    if templates is not None:
+        if tree is None:
+            tree = ParserSearch.to_ast(allowed_fields, search_phrase, model=Planet, limits=get_limits())
+        try:
+            return paginate_template(templates, tree, allowed_fields, ordering, cursor, limit, columns)
+        except sql_templates.Untemplatable:
+            pass
+    return paginate(filter_planets(search_phrase, allowed_fields, tree), ordering, cursor, limit, columns)
+
+
+def page_parts(search_phrase: str, ordering: str, cursor: Union[str, None], limit: Union[int, None],
+               columns: Union[list[str], tuple[str], None], allowed_fields: Union[list[str], tuple[str]],
+               tree: Union[Group, None]) -> tuple:
+    '''
+    Result cache key parts of a search page
+    '''
+    search = ast_format.dumps(tree) if tree is not None else search_phrase.strip()
+    return search, sorted(allowed_fields), ordering, cursor, limit, columns and list(columns)
+
+
+def search_page(search_phrase: str, ordering: str = "date", cursor: str = None, limit: int = None,
+                columns: Union[list[str], tuple[str]] = None,
+                allowed_fields: Union[list[str], tuple[str]] = None, tree: Group = None) -> dict:
+    '''
+    One page of search results, served from the result cache (see mytask.cache) when possible
+    '''
+    if allowed_fields is None:
+        allowed_fields = get_allowed_fields()
+    parts = page_parts(search_phrase, ordering, cursor, limit, columns, allowed_fields, tree)
+    return cache.get_or_set(
+        "page", parts, lambda: compute_page(search_phrase, allowed_fields, tree, ordering, cursor, limit, columns))
+
+
+class _Echo:
+    '''
+    File-like object for csv.writer, writerow() returns the line instead of buffering it
+    '''
+
+    def write(self, value: str) -> str:
+        return value
+
+
+def stream_rows(queryset: QuerySet, export_format: str = "ndjson", columns: Union[list[str], tuple[str]] = None,
+                chunk_size: int = 2000) -> Iterator[str]:
+    '''
+    Yield the queryset as NDJSON or CSV text, one chunk of rows at a time.
+    Rows are read with values_list().iterator() so memory does not grow with the number of matches.
+    '''
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"format must be one of {', '.join(EXPORT_FORMATS)}")
+    columns = _validate_columns(columns)
+    rows = queryset.order_by("id").values_list(*columns).iterator(chunk_size=chunk_size)
+
+    if export_format == "csv":
+        writer = csv.writer(_Echo())
+        encode = writer.writerow
+        yield writer.writerow(columns)
+    else:
+        encoder = DjangoJSONEncoder(separators=(",", ":"))
+
+        def encode(row):
+            return encoder.encode(dict(zip(columns, row))) + "\n"
+
+    chunk = []
+    for row in rows:
+        chunk.append(encode(row))
+        if len(chunk) >= chunk_size:
+            yield "".join(chunk)
+            chunk = []
+    if chunk:
+        yield "".join(chunk)
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/3.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -49,6 +50,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'mytask.middleware.ServerTimingMiddleware',
 ]
 
 ROOT_URLCONF = 'mytask.urls'
@@ -82,6 +84,32 @@ DATABASES = {
     }
 }
 
+# Production database profile: MYTASK_DB_PROFILE=production
+# WAL and the other pragmas of mytask.db.PRODUCTION_PRAGMAS, persistent connections and optional read-only
+# replica files for searches, MYTASK_DB_REPLICAS=/data/replica1.sqlite3:/data/replica2.sqlite3
+PLANET_SEARCH_READ_DATABASES = []
+if os.environ.get('MYTASK_DB_PROFILE') == 'production':
+    from mytask.db import PRODUCTION_PRAGMAS, REPLICA_PRAGMAS
+
+    DATABASES['default'].update({
+        'NAME': os.environ.get('MYTASK_DB_PATH', DATABASES['default']['NAME']),
+        'CONN_MAX_AGE': int(os.environ.get('MYTASK_DB_CONN_MAX_AGE', 600)),
+        'PRAGMAS': PRODUCTION_PRAGMAS,
+    })
+    for index, path in enumerate(filter(None, os.environ.get('MYTASK_DB_REPLICAS', '').split(os.pathsep))):
+        alias = f'replica{index + 1}'
+        DATABASES[alias] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': f'file:{path}?mode=ro',
+            'OPTIONS': {'uri': True},
+            'CONN_MAX_AGE': DATABASES['default']['CONN_MAX_AGE'],
+            'PRAGMAS': REPLICA_PRAGMAS,
+            # tests read the replicas through the default test database
+            'TEST': {'MIRROR': 'default'},
+        }
+        PLANET_SEARCH_READ_DATABASES.append(alias)
+    DATABASE_ROUTERS = ['mytask.db.SearchReplicaRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -125,3 +153,35 @@ STATIC_URL = '/static/'
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Planet search
+# fields a search phrase may filter on
+PLANET_SEARCH_ALLOWED_FIELDS = ['name', 'description', 'distance', 'date']
+PLANET_SEARCH_PAGE_SIZE = 50
+PLANET_SEARCH_MAX_PAGE_SIZE = 500
+# cache alias for search results, None disables the result cache
+PLANET_SEARCH_CACHE = 'default'
+PLANET_SEARCH_CACHE_TIMEOUT = 300
+# mytask.parser.SearchLimits, phrases over a limit are rejected with a 400 before they are parsed
+PLANET_SEARCH_LIMITS = {'max_length': 2000, 'max_depth': 16, 'max_predicates': 64, 'max_fields': 8}
+# serve searches from an in-memory copy of the Planet table (mytask.snapshot), for small read heavy tables
+PLANET_SEARCH_SNAPSHOT = False
+# thread pool sizes and concurrent searches per event loop of the async search view (mytask.async_search)
+PLANET_SEARCH_ASYNC = {'parse_workers': 2, 'db_workers': 8, 'max_concurrency': 32}
+# upper bounds of the distance histogram buckets and the 1 in N sample of approximate facets (mytask.facets)
+PLANET_SEARCH_FACET_DISTANCE_EDGES = [100, 1000, 10000, 100000]
+PLANET_SEARCH_FACET_SAMPLE = 10
+# number of compiled SQL templates kept per process (mytask.sql_templates), 0 disables them.
+# Templated searches skip the optimizer, contradictory phrases run a query instead of returning no rows at once.
+PLANET_SEARCH_SQL_TEMPLATES = 0
+# record filtered fields and sample SQL for `manage.py advise_indexes`, None disables it
+PLANET_SEARCH_INDEX_ADVISOR = {'sample_rate': 0.01, 'max_samples': 200, 'cache': 'default'}
+# searches slower than threshold_ms are kept with their SQL and query plan (mytask.slow_log,
+# `manage.py slow_searches`), sample_rate of them, the last max_entries; None disables it
+PLANET_SEARCH_SLOW_LOG = {'threshold_ms': 500, 'sample_rate': 1.0, 'max_entries': 200, 'cache': 'default'}
+# dotted paths of mytask.instrumentation hooks registered at startup, ex: 'mytask.instrumentation.LoggingHook'
+PLANET_SEARCH_INSTRUMENTATION_HOOKS = []
+# load the parser dependencies at startup (ParserSearch.warm_up) instead of on the first search,
+# for preforked or long lived workers; off keeps commands and short lived workers fast to start
+PLANET_SEARCH_WARM_UP = False
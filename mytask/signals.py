@@ -0,0 +1,16 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from . import cache
+
+
+# sent by PlanetQuerySet after bulk writes that skip post_save / post_delete.
+# pks: ids of the written rows, None when they are not known; deleted: True when the rows were deleted
+planets_changed = Signal()
+
+
+@receiver(post_save, sender="mytask.Planet")
+@receiver(post_delete, sender="mytask.Planet")
+@receiver(planets_changed)
+def invalidate_search_cache(sender, **kwargs):
+    cache.invalidate()
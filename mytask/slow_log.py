@@ -0,0 +1,173 @@
+'''
+Slow search log.
+
+Every search page computed by the search service is timed. A search slower
+than threshold_ms is kept, with sample_rate, together with what produced it:
+the phrase, the allowed fields, the normalized expression (the mytask.ast_format
+tree), its shape (the expression with "?" for the values), the SQL and
+parameters, the EXPLAIN QUERY PLAN output and the time spent per stage.
+
+Entries are kept in the Django cache like the index advisor samples, the last
+max_entries of them, so every worker sharing the cache backend writes to the
+same ring buffer. Concurrent writes may drop an entry, this is a sample, not
+an audit log. The slow_searches command dumps or aggregates the entries.
+'''
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from time import perf_counter
+from typing import Callable, Union
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DatabaseError
+
+from . import ast_format, instrumentation
+from .index_advisor import IndexAdvisor
+from .parser import Group, ParserSearch, SearchPhraseError
+
+
+ENTRIES_KEY = "slow-searches:entries"
+
+# statement of the search being watched, set with statement()
+_current = ContextVar("slow_search", default=None)
+
+
+def get_log():
+    '''
+    SlowSearchLog configured by PLANET_SEARCH_SLOW_LOG, None when disabled
+    '''
+    config = getattr(settings, "PLANET_SEARCH_SLOW_LOG", None)
+    return SlowSearchLog(**config) if config is not None else None
+
+
+def statement(sql_with_params: Callable[[], tuple], using: str):
+    '''
+    Tell the watched search, if any, which SQL it runs; sql_with_params() is only called for slow searches
+    '''
+    search = _current.get()
+    if search is not None:
+        search["statement"] = (sql_with_params, using)
+
+
+def shape_text(shape: tuple) -> str:
+    '''
+    Phrase of a ParserSearch.split_values() shape with "?" for the values
+    '''
+    if shape[0] == "P":
+        _, field, op, structural, value = shape
+        return f"{field} {op} {value if structural else '?'}"
+
+    parts = []
+    for index, (op, item) in enumerate(shape[1]):
+        text = f"({shape_text(item)})" if item[0] == "G" else shape_text(item)
+        parts.append(f"{op} {text}" if index else text)
+    return " ".join(parts)
+
+
+class SlowSearchLog:
+
+    def __init__(self, threshold_ms: float = 500, sample_rate: float = 1.0, max_entries: int = 200,
+                 cache: str = "default", explain: bool = True):
+        self.threshold_ms = threshold_ms
+        self.sample_rate = sample_rate
+        self.max_entries = max_entries
+        self.cache = caches[cache]
+        self.explain = explain
+
+    @contextmanager
+    def watch(self, search_phrase: str, allowed_fields: Union[list[str], tuple[str]], tree: Union[Group, None],
+              model=None, **details):
+        '''
+        Time the block, record it when it is slow. Stages are measured with mytask.instrumentation for the
+        duration of the block, details (ex: ordering) are added to the entry.
+        '''
+        timings = instrumentation.request_timings.get()
+        token = instrumentation.request_timings.set({}) if timings is None else None
+        before = dict(timings or {})
+        search = {"statement": None}
+        search_token = _current.set(search)
+        started = perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = perf_counter() - started
+            _current.reset(search_token)
+            stages = instrumentation.request_timings.get()
+            if token is not None:
+                instrumentation.request_timings.reset(token)
+
+        if elapsed * 1000 < self.threshold_ms or random.random() >= self.sample_rate:
+            return
+        stages = {stage: seconds - before.get(stage, 0) for stage, seconds in stages.items()}
+        self.record(search_phrase, allowed_fields, tree, model, search["statement"], elapsed, stages, details)
+
+    def record(self, search_phrase: str, allowed_fields: Union[list[str], tuple[str]], tree: Union[Group, None],
+               model, statement: Union[tuple, None], elapsed: float, stages: dict, details: dict):
+        if tree is None:
+            try:
+                tree = ParserSearch.to_ast(allowed_fields, search_phrase, model)
+            except SearchPhraseError:
+                tree = Group(())
+        shape, _ = ParserSearch.split_values(tree)
+
+        sql = params = using = plan = None
+        if statement is not None:
+            sql_with_params, using = statement
+            try:
+                sql, params = sql_with_params()
+            except Exception:
+                # EmptyResultSet and friends, there was no SQL
+                pass
+        if sql is not None and self.explain:
+            try:
+                plan = IndexAdvisor.explain({"sql": sql, "params": params, "using": using})
+            except DatabaseError:
+                pass
+
+        entry = {
+            "time": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "phrase": search_phrase,
+            "allowed_fields": sorted(allowed_fields),
+            "expression": ast_format.dumps(tree),
+            "shape": shape_text(shape),
+            "sql": sql,
+            "params": list(params) if params is not None else None,
+            "using": using,
+            "plan": plan,
+            "total_ms": elapsed * 1000,
+            "timings_ms": {stage: seconds * 1000 for stage, seconds in stages.items()},
+            **details,
+        }
+        entries = self.cache.get(ENTRIES_KEY) or []
+        entries.append(entry)
+        self.cache.set(ENTRIES_KEY, entries[-self.max_entries:], timeout=None)
+
+    def entries(self) -> list[dict]:
+        '''
+        Recorded searches, oldest first
+        '''
+        return self.cache.get(ENTRIES_KEY) or []
+
+    def clear(self):
+        self.cache.delete(ENTRIES_KEY)
+
+    def aggregate(self) -> list[dict]:
+        '''
+        One entry per shape, slowest total time first: count, total / mean / max ms and the slowest search
+        '''
+        shapes = {}
+        for entry in self.entries():
+            group = shapes.setdefault(entry["shape"], {"shape": entry["shape"], "count": 0, "total_ms": 0.0,
+                                                       "max_ms": 0.0, "slowest": entry})
+            group["count"] += 1
+            group["total_ms"] += entry["total_ms"]
+            if entry["total_ms"] >= group["max_ms"]:
+                group["max_ms"] = entry["total_ms"]
+                group["slowest"] = entry
+
+        for group in shapes.values():
+            group["mean_ms"] = group["total_ms"] / group["count"]
+            group["full_scan"] = IndexAdvisor.is_full_scan(group["slowest"]["plan"] or [])
+        return sorted(shapes.values(), key=lambda group: (-group["total_ms"], group["shape"]))
@@ -0,0 +1,364 @@
+'''
+In-process columnar snapshot of the Planet table.
+
+Rows are kept as columns (array of ids, distances and date ordinals, lists of
+interned names and descriptions) and a filter is evaluated into a bitmask, an
+int with bit i set when row i matches. AND / OR / NOT of sub-filters are then
+single big-int operations.
+
+Every column gets a lazily built sorted index: the row positions ordered by
+(value, id) and the bitmask of the first k * block rows of that order, so the
+rows below any value cost one stored mask plus at most one block of bit sets.
+eq, gt, lt, in and range all reduce to "rows below a position" differences.
+
+Only what is guaranteed to match the database is evaluated, anything else
+raises Unsupported and the caller queries the database instead:
+- exact, gt, gte, lt, lte, in and range lookups on the snapshot columns
+- values of the column type (int, date, str), no implicit conversions
+- ordering comparisons of strings only on SQLite, other databases use collations
+- NULL: a comparison with NULL is false, "field eq None" is IS NULL, like the SQL Django writes
+
+Writes are applied on commit from post_save / post_delete, bulk writes
+(planets_changed) and writes from other processes (seen through the search
+cache generation, see mytask.cache) reload the snapshot.
+'''
+import sys
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import date
+from math import isqrt
+from typing import Union
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import cache
+from .models import Planet
+from .signals import planets_changed
+
+
+LOOKUPS = ("exact", "gt", "gte", "lt", "lte", "in", "range")
+# column -> value type, date columns are stored as ordinals
+COLUMN_TYPES = {"id": int, "name": str, "description": str, "distance": int, "date": date}
+
+
+class Unsupported(Exception):
+    '''
+    Raised for filters the snapshot can not evaluate exactly
+    '''
+
+
+class _Index:
+    '''
+    Sorted index of one column
+    '''
+
+    def __init__(self, values: list, ids: array, alive: int, size: int):
+        alive = bin(alive)[:1:-1]
+        present = sorted(
+            (value, ids[pos], pos) for pos, value in enumerate(values)
+            if value is not None and pos < len(alive) and alive[pos] == "1")
+        self.values = [value for value, _, _ in present]
+        self.order = array("q", [pos for _, _, pos in present])
+        self.size = size
+        self.block = max(64, 4 * isqrt(len(present)))
+
+        self.prefix = []
+        bits = bytearray((size + 7) // 8)
+        for start in range(0, len(self.order) + 1, self.block):
+            if start:
+                _set_bits(bits, self.order[start - self.block:start])
+            self.prefix.append(int.from_bytes(bits, "little"))
+
+    def below(self, index: int) -> int:
+        '''
+        Mask of the rows at positions [0, index) of the sorted order
+        '''
+        block, rest = divmod(index, self.block)
+        if not rest:
+            return self.prefix[block]
+
+        return self.prefix[block] | _mask(self.order[index - rest:index], self.size)
+
+    def between(self, start: int, end: int) -> int:
+        if start >= end:
+            return 0
+        return self.below(end) ^ self.below(start)
+
+
+class PlanetSnapshot:
+
+    def __init__(self, using: str = "default"):
+        self.using = using
+        self.generation = None
+        self._lock = threading.RLock()
+        self._clear()
+
+    def _clear(self):
+        self.ids = array("q")
+        self.columns = {"name": [], "description": [], "distance": array("q"), "date": array("l")}
+        self.positions = {}
+        self.alive = 0
+        self._indexes = {}
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    def load(self):
+        '''
+        Read the whole table
+        '''
+        with self._lock:
+            generation = cache.get_generation()
+            self._clear()
+            rows = Planet.objects.using(self.using).order_by("id").values_list(
+                "id", "name", "description", "distance", "date")
+            for row in rows.iterator(chunk_size=5000):
+                self._append(*row)
+            self.alive = (1 << len(self.ids)) - 1
+            self.generation = generation
+        return self
+
+    def refresh(self):
+        '''
+        Reload when another process changed the table since the last load
+        '''
+        if cache.get_generation() != self.generation:
+            self.load()
+
+    def _append(self, pk: int, name: str, description: str, distance: int, found: date):
+        position = len(self.ids)
+        self.ids.append(pk)
+        self.columns["name"].append(_intern(name))
+        self.columns["description"].append(description)
+        self.columns["distance"].append(distance)
+        self.columns["date"].append(found.toordinal())
+        self.positions[pk] = position
+        return position
+
+    def upsert(self, pk: int):
+        '''
+        Read the row back, the instance may hold values the database stores differently
+        '''
+        row = Planet.objects.using(self.using).filter(pk=pk).values_list(
+            "id", "name", "description", "distance", "date").first()
+        if row is None:
+            return self.remove(pk)
+
+        with self._lock:
+            position = self.positions.get(pk)
+            if position is None:
+                self.alive |= 1 << self._append(*row)
+            else:
+                _, name, description, distance, found = row
+                self.columns["name"][position] = _intern(name)
+                self.columns["description"][position] = description
+                self.columns["distance"][position] = distance
+                self.columns["date"][position] = found.toordinal()
+            self._indexes.clear()
+
+    def remove(self, pk: int):
+        with self._lock:
+            position = self.positions.pop(pk, None)
+            if position is not None:
+                self.alive &= ~(1 << position)
+                self._indexes.clear()
+
+    # evaluation
+
+    def _values(self, column: str) -> Union[list, array]:
+        return self.ids if column == "id" else self.columns[column]
+
+    def _index(self, column: str) -> _Index:
+        index = self._indexes.get(column)
+        if index is None:
+            index = self._indexes[column] = _Index(self._values(column), self.ids, self.alive, len(self.ids))
+        return index
+
+    def _nulls(self, column: str) -> int:
+        if column != "description":
+            return 0
+        nulls = [pos for pos, value in enumerate(self.columns[column]) if value is None]
+        return _mask(nulls, len(self.ids)) & self.alive
+
+    def _check(self, column: str, value):
+        expected = COLUMN_TYPES[column]
+        if type(value) is not expected:
+            raise Unsupported(f"{column} value {value!r} is not {expected.__name__}")
+        return value.toordinal() if expected is date else value
+
+    def _predicate(self, key: str, value) -> int:
+        column, _, lookup = key.partition("__")
+        column = "id" if column == "pk" else column
+        lookup = lookup or "exact"
+        if column not in COLUMN_TYPES or lookup not in LOOKUPS:
+            raise Unsupported(f"lookup {key!r}")
+
+        if lookup == "exact" and value is None:
+            return self._nulls(column)
+        if COLUMN_TYPES[column] is str and lookup not in ("exact", "in") and \
+                connections[self.using].vendor != "sqlite":
+            raise Unsupported("string ordering depends on the database collation")
+
+        index = self._index(column)
+        if lookup == "in":
+            values = sorted({self._check(column, item) for item in value if item is not None})
+            mask = 0
+            for item in values:
+                mask |= index.between(bisect_left(index.values, item), bisect_right(index.values, item))
+            return mask
+        if lookup == "range":
+            low, high = (self._check(column, item) for item in value)
+            return index.between(bisect_left(index.values, low), bisect_right(index.values, high))
+
+        value = self._check(column, value)
+        if lookup == "exact":
+            return index.between(bisect_left(index.values, value), bisect_right(index.values, value))
+        if lookup == "gt":
+            return index.between(bisect_right(index.values, value), len(index.values))
+        if lookup == "gte":
+            return index.between(bisect_left(index.values, value), len(index.values))
+        if lookup == "lt":
+            return index.below(bisect_left(index.values, value))
+        return index.below(bisect_right(index.values, value))
+
+    def _evaluate(self, qobj: Q) -> int:
+        if qobj.connector == Q.AND:
+            mask = self.alive
+            for child in qobj.children:
+                mask &= self._evaluate(child) if isinstance(child, Q) else self._predicate(*child)
+        else:
+            mask = 0
+            for child in qobj.children:
+                mask |= self._evaluate(child) if isinstance(child, Q) else self._predicate(*child)
+        return self.alive & ~mask if qobj.negated else mask
+
+    def evaluate(self, qobj: Q) -> int:
+        '''
+        Bitmask of the rows matching qobj, raise Unsupported when the database has to answer
+        '''
+        with self._lock:
+            return self._evaluate(qobj)
+
+    def filter(self, qobj: Q) -> list[int]:
+        '''
+        Ids of the rows matching qobj, same rows as Planet.objects.filter(qobj)
+        '''
+        with self._lock:
+            return sorted(self.ids[pos] for pos in _positions(self._evaluate(qobj)))
+
+    def rows(self, mask: int, columns: Union[list[str], tuple[str]], ordering: str = "date",
+             limit: int = None) -> list[dict]:
+        '''
+        Matching rows as values() dicts ordered like order_by(ordering, "id"), "-" for descending
+        '''
+        key = ordering.lstrip("-")
+        descending = ordering.startswith("-")
+        with self._lock:
+            count = bin(mask).count("1")
+            if limit is not None and count > limit * 8:
+                # many matches, walk the sorted index until the page is full
+                index = self._index(key)
+                bits = bin(mask)[:1:-1]
+                order = reversed(index.order) if descending else index.order
+                positions = []
+                for pos in order:
+                    if pos < len(bits) and bits[pos] == "1":
+                        positions.append(pos)
+                        if len(positions) == limit:
+                            break
+            else:
+                values = self._values(key)
+                positions = sorted(_positions(mask), key=lambda pos: (values[pos], self.ids[pos]), reverse=descending)
+                positions = positions[:limit]
+            return [self._row(pos, columns) for pos in positions]
+
+    def _row(self, position: int, columns: Union[list[str], tuple[str]]) -> dict:
+        row = {}
+        for column in columns:
+            value = self._values(column)[position]
+            row[column] = date.fromordinal(value) if column == "date" else value
+        return row
+
+
+def _intern(text: str) -> str:
+    return sys.intern(text) if type(text) is str else text
+
+
+def _set_bits(bits: bytearray, positions):
+    for pos in positions:
+        bits[pos >> 3] |= 1 << (pos & 7)
+
+
+def _mask(positions, size: int) -> int:
+    bits = bytearray((size + 7) // 8)
+    _set_bits(bits, positions)
+    return int.from_bytes(bits, "little")
+
+
+def _positions(mask: int):
+    bits = bin(mask)[:1:-1]
+    position = bits.find("1")
+    while position != -1:
+        yield position
+        position = bits.find("1", position + 1)
+
+
+_snapshot = None
+_snapshot_lock = threading.Lock()
+
+
+def get_snapshot() -> Union[PlanetSnapshot, None]:
+    '''
+    Shared, up to date PlanetSnapshot when PLANET_SEARCH_SNAPSHOT is enabled, else None
+    '''
+    global _snapshot
+    if not getattr(settings, "PLANET_SEARCH_SNAPSHOT", False):
+        return
+
+    with _snapshot_lock:
+        if _snapshot is None:
+            _snapshot = PlanetSnapshot().load()
+        else:
+            _snapshot.refresh()
+        return _snapshot
+
+
+def reset_snapshot():
+    global _snapshot
+    with _snapshot_lock:
+        _snapshot = None
+
+
+def _on_commit(apply):
+    def run():
+        snapshot = _snapshot
+        if snapshot is not None:
+            apply(snapshot)
+            # our own write bumped the generation, do not reload for it
+            snapshot.generation = cache.get_generation()
+    transaction.on_commit(run)
+
+
+@receiver(post_save, sender=Planet)
+def _planet_saved(sender, instance, **kwargs):
+    if _snapshot is not None:
+        pk = instance.pk
+        _on_commit(lambda snapshot: snapshot.upsert(pk))
+
+
+@receiver(post_delete, sender=Planet)
+def _planet_deleted(sender, instance, **kwargs):
+    if _snapshot is not None:
+        pk = instance.pk
+        _on_commit(lambda snapshot: snapshot.remove(pk))
+
+
+@receiver(planets_changed)
+def _planets_changed(sender, **kwargs):
+    if _snapshot is not None:
+        _on_commit(lambda snapshot: snapshot.load())
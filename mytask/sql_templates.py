@@ -0,0 +1,177 @@
+'''
+Compiled SQL per query shape.
+
+Phrases that only differ in their values, like "distance gt 20" and
+"distance gt 30", have the same shape (see ParserSearch.split_values). The
+first query of a shape is compiled by the ORM with a distinct sentinel per
+value, the sentinels are looked up in the SQL parameters to learn which value
+goes to which parameter, and the SQL is kept. Later queries of the shape only
+bind their values and run the SQL on a cursor, converting the rows with the
+same converters the ORM uses.
+
+A shape is not templated when a sentinel can not be found back in the
+parameters, ex: full text "match" values are rewritten by the lookup, or an
+integer lookup rounds a float. Those queries keep going through the ORM.
+'''
+import threading
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Callable, NamedTuple, Union
+
+from django.conf import settings
+from django.core.exceptions import EmptyResultSet
+from django.db import connections
+from django.db.models import QuerySet
+
+
+class Untemplatable(Exception):
+    '''
+    Raised for shapes whose SQL can not be reused with other values
+    '''
+
+
+class SQLTemplate(NamedTuple):
+    sql: str
+    # one (value index, str) per SQL parameter, str: the backend passes the value as its str()
+    slots: tuple
+    columns: tuple
+    # column index -> (converter functions, expression)
+    converters: dict
+    using: str
+
+
+def _sentinel(index: int, value):
+    '''
+    Value of the type of value that no other sentinel of the query shares
+    '''
+    kind = type(value)
+    if kind is int:
+        return 2 ** 40 + index
+    if kind is float:
+        return 2.0 ** 40 + index + 0.5
+    if kind is Decimal:
+        return Decimal(2 ** 40 + index) + Decimal("0.5")
+    if kind is str:
+        return f"\x00sentinel-{index}\x00"
+    if kind is datetime:
+        return datetime(1, 1, 1) + timedelta(seconds=index)
+    if kind is date:
+        return date(1, 1, 1) + timedelta(days=index)
+    raise Untemplatable(f"can not template {kind.__name__} values")
+
+
+def build(make_queryset: Callable[[list], QuerySet], values: list) -> SQLTemplate:
+    '''
+    Compile make_queryset(sentinels) and map its parameters back to the value positions
+    '''
+    sentinels = [_sentinel(index, value) for index, value in enumerate(values)]
+    queryset = make_queryset(sentinels)
+    compiler = queryset.query.get_compiler(queryset.db)
+    try:
+        sql, params = compiler.as_sql()
+    except EmptyResultSet:
+        raise Untemplatable("query of this shape never matches")
+
+    raw = {(type(sentinel), sentinel): index for index, sentinel in enumerate(sentinels)}
+    text = {str(sentinel): index for index, sentinel in enumerate(sentinels)}
+    slots = []
+    for param in params:
+        try:
+            slot = (raw[type(param), param], False)
+        except (KeyError, TypeError):
+            if not isinstance(param, str) or param not in text:
+                raise Untemplatable(f"parameter {param!r} is not a value of the query")
+            slot = (text[param], True)
+        slots.append(slot)
+
+    columns = tuple(queryset.query.values_select)
+    converters = compiler.get_converters([expression for expression, _, _ in compiler.select])
+    return SQLTemplate(sql, tuple(slots), columns, converters, queryset.db)
+
+
+def bind_params(template: SQLTemplate, values: list) -> list:
+    return [str(values[index]) if as_text else values[index] for index, as_text in template.slots]
+
+
+def execute(template: SQLTemplate, values: list, using: str = None) -> list[dict]:
+    '''
+    Run the template with values, on the database alias using (default: the one it was compiled for)
+    '''
+    params = bind_params(template, values)
+    connection = connections[using or template.using]
+    with connection.cursor() as cursor:
+        cursor.execute(template.sql, params)
+        rows = cursor.fetchall()
+
+    result = []
+    for row in rows:
+        row = list(row)
+        for index, (functions, expression) in template.converters.items():
+            value = row[index]
+            for function in functions:
+                value = function(value, expression, connection)
+            row[index] = value
+        result.append(dict(zip(template.columns, row)))
+    return result
+
+
+class TemplateCache:
+    '''
+    Bounded LRU of SQLTemplate per shape, None remembers shapes that can not be templated
+    '''
+
+    def __init__(self, maxsize: int = 512):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get_or_build(self, key, make_queryset: Callable[[list], QuerySet], values: list) -> SQLTemplate:
+        with self._lock:
+            found = key in self._data
+            if found:
+                template = self._data[key]
+                self._data.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        if not found:
+            try:
+                template = build(make_queryset, values)
+            except Untemplatable:
+                template = None
+            with self._lock:
+                self._data[key] = template
+                while len(self._data) > self.maxsize:
+                    self._data.popitem(last=False)
+
+        if template is None:
+            raise Untemplatable("shape can not be templated")
+        return template
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
+
+
+_cache = None
+
+
+def get_cache() -> Union[TemplateCache, None]:
+    '''
+    Shared TemplateCache, None when PLANET_SEARCH_SQL_TEMPLATES is disabled
+    '''
+    global _cache
+    maxsize = getattr(settings, "PLANET_SEARCH_SQL_TEMPLATES", 0)
+    if not maxsize:
+        return
+    if _cache is None or _cache.maxsize != maxsize:
+        _cache = TemplateCache(maxsize)
+    return _cache
@@ -0,0 +1,107 @@
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.db.models import Q
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+
+from .. import ast_format
+from ..ast_format import ASTFormatError
+from ..models import Planet
+from ..parser import AND, OR, Group, ParserSearch, Predicate, SearchLimitError, SearchLimits
+
+
+class ASTFormatTestCase(SimpleTestCase):
+
+    fields = ["name", "description", "distance", "date"]
+
+    def test_round_trip(self):
+        for search in [
+            "(date ne 2016-05-01) AND ((distance gt 20) OR (distance lt 10))",
+            'name eq "Mars 2" OR description match "gas giant" AND distance lt 10000',
+            "date gt 2000-01-01 AND distance gt 2000 OR name eq Mars OR name ne Saturnus",
+            "name eq",
+        ]:
+            for model in (None, Planet):
+                tree = ParserSearch.to_ast(self.fields, search, model=model)
+                for data, loads in ((ast_format.dumps(tree), ast_format.loads),
+                                    (ast_format.dumpb(tree), ast_format.loadb)):
+                    assert loads(data) == tree
+                    assert ParserSearch.compile(loads(data), self.fields, model=model) == \
+                        ParserSearch.parse(self.fields, search, model=model, use_cache=False)
+
+        values = [None, True, False, 0, -3, 2 ** 70, 1.5, "Märs", date(2016, 5, 1), datetime(2016, 5, 1, 12, 30),
+                  Decimal("1.10")]
+        tree = Group(tuple((OR, Predicate("name", "eq", value)) for value in values))
+        for dumps, loads in ((ast_format.dumps, ast_format.loads), (ast_format.dumpb, ast_format.loadb)):
+            decoded = loads(dumps(tree))
+            assert [type(item.value) for _, item in decoded.items] == [type(value) for value in values]
+            assert decoded == tree
+
+        assert ast_format.dumps(ParserSearch.to_ast(self.fields, "distance gt 20 AND date eq 2016-05-01", Planet)) == \
+            '{"v":1,"ast":[["&",["distance","gt",20]],["&",["date","eq",{"date":"2016-05-01"}]]]}'
+
+    def test_compile(self):
+        tree = Group(((AND, Predicate("name", "eq", "Mars")), (OR, Predicate("password", "eq", "x")),
+                      (OR, Group(((AND, Predicate("distance", "gt", 10)), (AND, Predicate("distance", "lt", 11)))))))
+        assert ParserSearch.compile(tree, ["name", "distance"]) == Q(name="Mars") | Q(distance__gt=10, distance__lt=11)
+        assert ParserSearch.compile(tree, ["name", "distance"], model=Planet, optimize=True) == Q(name="Mars")
+
+    def test_invalid(self):
+        for data in ['{"v":2,"ast":[]}', '{"v":1,"ast":["name","eq","Mars"]}',
+                     '{"v":1,"ast":[["&",["name","in",[1]]]]}', '{"v":1,"ast":[["^",["name","eq","Mars"]]]}',
+                     '{"v":1,"ast":[["&",["date","eq",{"date":"x"}]]]}', "[", b"\xff"]:
+            with self.assertRaises(ASTFormatError):
+                ast_format.loads(data)
+
+        data = ast_format.dumpb(ParserSearch.to_ast(self.fields, "name eq Mars AND date eq 2016-05-01"))
+        for broken in (data[:-1], data + b"x", b"XYZ" + data[3:], data[:3] + b"\x02" + data[4:]):
+            with self.assertRaises(ASTFormatError):
+                ast_format.loadb(broken)
+
+        nested = "[" * 5000 + "]" * 5000
+        with self.assertRaises(ASTFormatError):
+            ast_format.loads(f'{{"v":1,"ast":{nested}}}')
+
+        tree = ParserSearch.to_ast(self.fields, "(((name eq Mars)))")
+        with self.assertRaises(SearchLimitError):
+            ast_format.loadb(ast_format.dumpb(tree), limits=SearchLimits(max_depth=2))
+        assert ast_format.loadb(ast_format.dumpb(tree), limits=SearchLimits(max_depth=3)) == tree
+
+
+class ASTViewTestCase(TestCase):
+
+    fixtures = ['planets.json']
+
+    def test_search_with_ast(self):
+        tree = ParserSearch.to_ast(["name", "distance"], "distance lt 2000", model=Planet)
+        response = self.client.get(reverse("planet-search"), {"ast": ast_format.dumps(tree), "fields": "name"})
+        assert [row["name"] for row in response.json()["results"]] == ["Mars", "Saturnus"]
+        assert self.client.get(reverse("planet-search"), {"ast": "{}"}).status_code == 400
+
+    def test_invalid_tree(self):
+        trees = {
+            '{"v":1,"ast":[["&",["distance","match","x"]]]}': "match is only supported on text fields",
+            '{"v":1,"ast":[["|",["date","match","x"]]]}': "match is only supported on text fields",
+            '{"v":1,"ast":[["&",["date","gt","abc"]]]}': "invalid value 'abc' for field 'date'",
+            '{"v":1,"ast":[["&",["date","gt",5]]]}': "invalid value 5 for field 'date'",
+            '{"v":1,"ast":[["&",["distance","gt",{"date":"2016-05-01"}]]]}': "invalid value",
+            '{"v":1,"ast":[["&",["distance","gt",99999999999999999999999]]]}': "invalid value",
+            '{"v":1,"ast":[["&",["distance","lt",null]]]}': "invalid value None",
+        }
+        for name in ("planet-search", "planet-search-async", "planet-facets", "planet-export"):
+            for data, error in trees.items():
+                response = self.client.get(reverse(name), {"ast": data})
+                assert response.status_code == 400, (name, data)
+                assert error in response.json()["error"]
+
+    def test_tree_values(self):
+        # values of a client tree are converted like the values of a phrase
+        tree = ast_format.loads('{"v":1,"ast":[["&",["date","gt","2016-05-01"]],["&",["distance","lt","2000"]]]}')
+        query = ParserSearch.compile(tree, ["date", "distance"], model=Planet)
+        assert query == Q(date__gt=date(2016, 5, 1), distance__lt=2000)
+        tree = ast_format.loads('{"v":1,"ast":[["&",["distance","lt",1999.5]],["&",["name","ne",null]]]}')
+        assert ParserSearch.compile(tree, ["name", "distance"], model=Planet) == Q(distance__lt=1999.5) & ~Q(name=None)
+
+        with self.assertRaises(ASTFormatError):
+            ParserSearch.compile(ast_format.loads('{"v":1,"ast":[["&",["date","gt","abc"]]]}'), ["date"], model=Planet)
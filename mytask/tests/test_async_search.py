@@ -0,0 +1,70 @@
+import asyncio
+import threading
+import time
+from unittest import mock
+from urllib.parse import urlencode
+
+from django.test import TransactionTestCase, override_settings
+from django.urls import reverse
+
+from .. import async_search, search, slow_log
+
+
+# database work runs in executor threads with their own connections, the fixture rows have to be committed
+class AsyncSearchTestCase(TransactionTestCase):
+
+    fixtures = ['planets.json']
+
+    def search(self, **params):
+        # the Django 3.2 AsyncClient drops the data argument of get() from the ASGI scope
+        return self.async_client.get(f'{reverse("planet-search-async")}?{urlencode(params)}')
+
+    async def test_view(self):
+        response = await self.search(q="distance gt 100 OR name eq Mars", order="distance", limit=2, fields="name")
+        assert response.status_code == 200
+        page = response.json()
+        assert [row["name"] for row in page["results"]] == ["Mars", "Saturnus"]
+        assert "execute" in response["Server-Timing"]
+        response = await self.search(q="distance gt 100 OR name eq Mars", order="distance", cursor=page["next"])
+        assert [row["name"] for row in response.json()["results"]] == ["Uranus", "Venus", "Pluto"]
+
+        assert (await self.search(order="name")).status_code == 400
+        assert (await self.search(q="(" * 100)).json()["limit"] == "max_depth"
+        assert (await self.async_client.post(reverse("planet-search-async"))).status_code == 405
+
+    @override_settings(PLANET_SEARCH_CACHE=None, PLANET_SEARCH_ASYNC={"max_concurrency": 2})
+    async def test_coalescing_and_limits(self):
+        compute_page = search.compute_page
+        running = []
+        peak = []
+        lock = threading.Lock()
+
+        def slow_compute_page(*args):
+            with lock:
+                running.append(1)
+                peak.append(len(running))
+            time.sleep(0.05)
+            try:
+                return compute_page(*args)
+            finally:
+                with lock:
+                    running.pop()
+
+        with mock.patch.object(search, "compute_page", side_effect=slow_compute_page) as compute:
+            pages = await asyncio.gather(*[async_search.asearch_page("distance gt 2000") for _ in range(5)])
+            assert compute.call_count == 1
+            assert all(page == pages[0] for page in pages)
+            assert [row["name"] for row in pages[0]["results"]] == ["Venus", "Uranus", "Pluto"]
+
+            await asyncio.gather(*[async_search.asearch_page(f"distance gt {number}") for number in range(6)])
+            assert compute.call_count == 7
+            assert max(peak) == 2
+
+    @override_settings(PLANET_SEARCH_CACHE=None, PLANET_SEARCH_SLOW_LOG={"threshold_ms": 0, "sample_rate": 1.0})
+    async def test_slow_log(self):
+        log = slow_log.get_log()
+        log.clear()
+        await async_search.asearch_page("distance gt 2000 AND name ne Venus")
+        entry, = log.entries()
+        assert entry["phrase"] == "distance gt 2000 AND name ne Venus"
+        assert entry["shape"] == "distance gt ? AND name ne ?"
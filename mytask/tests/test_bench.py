@@ -0,0 +1,101 @@
+import json
+import os
+import random
+import sys
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+
+from .. import bench, saved_searches
+from ..models import Planet, SavedSearch, SavedSearchMatch
+from ..parser import Group, ParserSearch, SearchLimits
+
+
+FIELDS = ["name", "description", "distance", "date"]
+
+
+class GeneratorTestCase(SimpleTestCase):
+
+    def test_phrases(self):
+        phrases = bench.generate_phrases(200, seed=3, depth=4, width=3)
+        assert phrases == bench.generate_phrases(200, seed=3, depth=4, width=3)
+        limits = SearchLimits(max_length=None, max_depth=4, max_predicates=None, max_fields=None)
+        for phrase in phrases:
+            ParserSearch.check_limits(phrase, limits)
+            assert ParserSearch.to_ast(FIELDS, phrase, Planet) != Group(())
+
+        for phrase in bench.generate_phrases(200, seed=3, invalid_ratio=1):
+            assert ParserSearch.to_ast(FIELDS, phrase, Planet) == Group(())
+
+        rng = random.Random(0)
+        phrase = bench.generate_phrase(rng, depth=1, width=5, operators=["gt", "lt"])
+        assert "(" not in phrase and " eq " not in phrase and "name" not in phrase
+        with self.assertRaises(ValueError):
+            bench.generate_phrase(rng, fields=["name"], operators=["gt"])
+
+    def test_summarize(self):
+        assert bench.percentile([1, 2, 3, 4], 0.5) == 2
+        assert bench.percentile(list(range(1, 101)), 0.99) == 99
+        stats = bench.summarize([0.002, 0.001, 0.003, 0.002])
+        assert (stats["count"], stats["p50_ms"], stats["max_ms"]) == (4, 2.0, 3.0)
+        assert round(stats["per_second"]) == 500
+        assert bench.compare({"stages": {"parse": stats}}, {"stages": {"parse": stats, "execute": stats}}) == \
+            {"parse": {"p50_ms": 1.0, "p99_ms": 1.0}}
+
+
+class BenchSearchTestCase(TestCase):
+
+    def test_planets(self):
+        planets = list(bench.generate_planets(50, seed=1))
+        assert [planet.name for planet in planets] == [planet.name for planet in bench.generate_planets(50, seed=1)]
+        SavedSearch.objects.create(name="near", phrase="distance lt 1000")
+        with mock.patch.object(saved_searches, "rebuild_all", wraps=saved_searches.rebuild_all) as rebuild_all:
+            with self.captureOnCommitCallbacks(execute=True):
+                start = bench.load_planets(120, seed=1, batch_size=50)
+        assert rebuild_all.call_count == 1
+        assert Planet.objects.filter(id__gt=start).count() == 120
+        assert SavedSearchMatch.objects.filter(planet_id__gt=start).exists()
+
+        # rows and their matches are deleted in SQL, one planets_changed for all of them
+        with mock.patch.object(bench, "planets_changed") as planets_changed:
+            # the highest id, then per batch a savepoint, two DELETE and its release
+            with self.assertNumQueries(1 + 3 * 4):
+                assert bench.delete_planets(start, batch_size=50) == 120
+        assert planets_changed.send.call_count == 1
+        assert not Planet.objects.filter(id__gt=start).exists()
+        assert not SavedSearchMatch.objects.filter(planet_id__gt=start).exists()
+
+    def test_command(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bench.json")
+            call_command("bench_search", "--phrases=40", "--warmup=5", "--rows=300", "--invalid=0.2", "-o", path,
+                         stderr=StringIO())
+            with open(path) as report_file:
+                report = json.load(report_file)
+            assert Planet.objects.count() == 0
+            assert report["rows"] == 300
+            assert set(report["stages"]) == set(bench.STAGES)
+            assert report["stages"]["parse"]["count"] == 40
+
+            output = StringIO()
+            call_command("bench_search", "--phrases=20", "--warmup=0", "--no-execute", "--compare", path,
+                         stdout=output)
+            report = json.loads(output.getvalue())
+            assert "execute" not in report["stages"]
+            assert set(report["compare"]) == {"parse", "build", "compile"}
+
+
+class StartupTestCase(SimpleTestCase):
+
+    def test_lazy_imports(self):
+        # a fresh process imports the search service without the parser dependencies
+        result = bench.startup(repeat=1)
+        assert result["loaded"] == []
+        assert result["first_parse_ms"] > 0
+
+        ParserSearch.warm_up()
+        assert ParserSearch._PARSER is not None
+        assert all(name in sys.modules for name in ("pyparsing", "dateutil"))
@@ -0,0 +1,34 @@
+from datetime import date
+
+from django.test import TestCase
+
+from .. import cache
+from ..models import Planet
+from ..search import search_page
+
+
+class SearchCacheTestCase(TestCase):
+
+    fixtures = ['planets.json']
+
+    def test_cached_until_write(self):
+        search = "distance lt 2000"
+        assert [row["name"] for row in search_page(search)["results"]] == ["Mars", "Saturnus"]
+        with self.assertNumQueries(0):
+            assert [row["name"] for row in search_page(f" {search}")["results"]] == ["Mars", "Saturnus"]
+
+        generation = cache.get_generation()
+        planet = Planet.objects.create(name="Mercury", distance=90, date=date(2000, 1, 1))
+        assert cache.get_generation() > generation
+        assert [row["name"] for row in search_page(search)["results"]] == ["Mercury", "Mars", "Saturnus"]
+
+        # bulk writes skip post_save, the queryset sends planets_changed instead
+        Planet.objects.filter(pk=planet.pk).update(distance=5000)
+        assert [row["name"] for row in search_page(search)["results"]] == ["Mars", "Saturnus"]
+
+        Planet.objects.bulk_create([Planet(name="Ceres", distance=1, date=date(2001, 1, 1))])
+        assert [row["name"] for row in search_page(search)["results"]] == ["Ceres", "Mars", "Saturnus"]
+
+        Planet.objects.filter(name="Ceres").delete()
+        assert [row["name"] for row in search_page(search)["results"]] == ["Mars", "Saturnus"]
+        assert not hasattr(Planet.objects, "delete")
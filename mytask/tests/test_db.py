@@ -0,0 +1,41 @@
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from .. import db
+from ..models import Planet
+
+
+class PragmaTestCase(TestCase):
+
+    def test_apply_pragmas(self):
+        with self.assertRaises(ValueError):
+            db.pragma_statements({"cache_size": "1; DROP TABLE mytask_planet"})
+
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA cache_size")
+            cache_size = cursor.fetchone()[0]
+            connection.settings_dict["PRAGMAS"] = {"cache_size": -1234}
+            try:
+                db.apply_pragmas(sender=None, connection=connection)
+                cursor.execute("PRAGMA cache_size")
+                assert cursor.fetchone()[0] == -1234
+            finally:
+                del connection.settings_dict["PRAGMAS"]
+                cursor.execute(f"PRAGMA cache_size = {cache_size}")
+
+
+class SearchReplicaRouterTestCase(SimpleTestCase):
+
+    def test_routing(self):
+        router = db.SearchReplicaRouter()
+        assert router.db_for_read(Planet, search=True) is None
+        with override_settings(PLANET_SEARCH_READ_DATABASES=["replica1", "replica2"]):
+            assert [router.db_for_read(Planet, search=True) for _ in range(3)] == ["replica1", "replica2", "replica1"]
+            assert router.db_for_read(Planet) is None
+            assert router.db_for_write(Planet) == "default"
+            assert router.allow_migrate("default", "mytask")
+            assert not router.allow_migrate("replica2", "mytask")
+
+        with override_settings(PLANET_SEARCH_READ_DATABASES=["replica1"], DATABASE_ROUTERS=[db.SearchReplicaRouter()]):
+            assert db.search_db() == "replica1"
+        assert db.search_db() == "default"
@@ -0,0 +1,48 @@
+from datetime import date
+
+from django.test import TestCase
+from django.urls import reverse
+
+from ..facets import facets
+from ..models import Planet
+
+
+class FacetsTestCase(TestCase):
+
+    fixtures = ['planets.json']
+
+    def test_facets(self):
+        with self.assertNumQueries(1):
+            result = facets("distance gt 100", edges=[1000, 10000])
+        assert result == {
+            "count": 4,
+            "distance": [
+                {"from": None, "to": 1000, "count": 0},
+                {"from": 1000, "to": 10000, "count": 3},
+                {"from": 10000, "to": None, "count": 1},
+            ],
+            "year": [{"year": 2009, "count": 1}, {"year": 2011, "count": 1}, {"year": 2012, "count": 1},
+                     {"year": 2020, "count": 1}],
+            "approximate": False,
+        }
+        with self.assertNumQueries(0):
+            assert facets(" distance gt 100 ", edges=[1000, 10000]) == result
+
+        Planet.objects.create(name="Mercury", distance=5000, date=date(2020, 1, 1))
+        assert facets("distance gt 100", edges=[1000, 10000])["year"][-1] == {"year": 2020, "count": 2}
+
+        with self.assertNumQueries(0):
+            assert facets("date gt 2016-05-01 AND date lt 2000-01-01")["count"] == 0
+
+    def test_approximate_and_view(self):
+        Planet.objects.bulk_create([Planet(name=f"p{number}", distance=number, date=date(2000, 1, 1))
+                                    for number in range(1000)])
+        result = facets("name ne Mars", edges=[500], approximate=True)
+        assert result["approximate"]
+        assert 800 <= result["count"] <= 1200
+        assert sum(bucket["count"] for bucket in result["distance"]) == result["count"]
+
+        response = self.client.get(reverse("planet-facets"), {"q": "distance lt 2000", "edges": "100,1000"})
+        assert [bucket["count"] for bucket in response.json()["distance"]] == [100, 901, 1]
+        assert self.client.get(reverse("planet-facets"), {"edges": "1000,100"}).status_code == 400
+        assert self.client.get(reverse("planet-facets"), {"edges": "x"}).status_code == 400
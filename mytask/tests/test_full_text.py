@@ -0,0 +1,53 @@
+from datetime import date
+
+from django.db.models import Q
+from django.test import TestCase
+
+from ..lookups import match_rank
+from ..models import Planet
+from ..parser import ParserSearch, SearchPhraseError
+
+
+class FullTextTestCase(TestCase):
+
+    fixtures = ['planets.json']
+
+    def test_parse(self):
+        fields = ["name", "description", "distance"]
+        assert ParserSearch.parse(fields, 'description match "gas (giant) AND" OR name eq "2016"') == \
+            Q(description__match="gas (giant) AND") | Q(name="2016")
+        assert ParserSearch.parse(fields, "description match 2016-05-01", model=Planet) == \
+            Q(description__match="2016-05-01")
+        assert ParserSearch.parse(fields, 'name eq "Mars') == Q()
+
+        # full text search is only on text fields, elsewhere it invalidates the phrase
+        for search in ("distance match 100", "date match foo", "distance match 100 OR name eq Mars"):
+            assert ParserSearch.parse(fields + ["date"], search, model=Planet) == Q()
+        tree = ParserSearch.to_ast(fields, "distance match 100")
+        with self.assertRaises(SearchPhraseError):
+            ParserSearch.compile(tree, fields, model=Planet)
+        assert ParserSearch.compile(tree, fields) == Q(distance__match="100")
+
+    def test_match(self):
+        Planet.objects.create(name="Jupiter", description="the largest gas giant", distance=600, date=date(1610, 1, 7))
+        fields = ["name", "description", "distance"]
+
+        def names(search):
+            return sorted(Planet.objects.filter(ParserSearch.parse(fields, search)).values_list("name", flat=True))
+
+        assert names('description match "gas giant"') == ["Jupiter"]
+        assert names('description match "giant gas"') == []
+        assert names("description match THIS AND distance gt 1000") == ["Uranus"]
+        assert names("(description match this) OR name match pluto") == ["Mars", "Pluto", "Uranus"]
+        # the value is a single phrase, FTS5 operators in it have no effect
+        assert names('name match "mars OR pluto"') == []
+
+        # the triggers keep the index in sync
+        Planet.objects.filter(name="Mars").update(description="a cold desert")
+        assert names("description match desert") == ["Mars"]
+        Planet.objects.filter(name="Mars").delete()
+        assert names("description match desert") == []
+
+        ranked = Planet.objects.annotate(rank=match_rank(Planet, "uranus", ["name", "description"])) \
+            .filter(description__match="uranus").order_by("rank")
+        assert [(planet.name, planet.rank < 0) for planet in ranked] == [("Uranus", True)]
@@ -0,0 +1,76 @@
+import os
+import tempfile
+from datetime import date
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from ..models import Planet
+
+
+class ImportPlanetsTestCase(TestCase):
+
+    def write(self, name: str, content: str) -> str:
+        path = os.path.join(self.tmp.name, name)
+        with open(path, "w") as output:
+            output.write(content)
+        return path
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_csv_and_upsert(self):
+        path = self.write("planets.csv", "name,description,distance,date\n" + "".join(
+            f"Planet {i},,{i * 10},2000-01-{i:02d}\n" for i in range(1, 8)))
+        output = StringIO()
+        call_command("import_planets", path, "--batch-size=3", "--progress-every=1", stdout=output)
+        assert Planet.objects.count() == 7
+        assert output.getvalue().count("rows/s") == 4
+        planet = Planet.objects.get(name="Planet 2")
+        assert (planet.distance, planet.date, planet.description) == (20, date(2000, 1, 2), None)
+
+        path = self.write("planets.jsonl", "\n".join([
+            f'{{"id": {planet.pk}, "name": "Mars", "distance": 100, "date": "2013-10-02"}}',
+            '{"name": "Venus", "description": "hot", "distance": 6500, "date": "2009-10-02"}',
+        ]))
+        call_command("import_planets", path, "--upsert", stdout=StringIO())
+        assert Planet.objects.count() == 8
+        assert Planet.objects.get(pk=planet.pk).name == "Mars"
+
+    def test_resume_from_checkpoint(self):
+        checkpoint = os.path.join(self.tmp.name, "checkpoint")
+        path = self.write("planets.jsonl", "\n".join([
+            '{"name": "Mars", "distance": 100, "date": "2013-10-02"}',
+            '{"name": "Pluto", "distance": 90000, "date": "2012-10-02"}',
+            '{"name": "Uranus", "distance": "far", "date": "2011-10-02"}',
+        ]))
+        with self.assertRaisesMessage(CommandError, "row 3: invalid distance"):
+            call_command("import_planets", path, "--batch-size=2", f"--checkpoint={checkpoint}", stdout=StringIO())
+        assert Planet.objects.count() == 2
+
+        self.write("planets.jsonl", "\n".join([
+            '{"name": "Mars", "distance": 100, "date": "2013-10-02"}',
+            '{"name": "Pluto", "distance": 90000, "date": "2012-10-02"}',
+            '{"name": "Uranus", "distance": 2500, "date": "2011-10-02"}',
+        ]))
+        call_command("import_planets", path, "--batch-size=2", f"--checkpoint={checkpoint}", stdout=StringIO())
+        assert list(Planet.objects.order_by("id").values_list("name", flat=True)) == ["Mars", "Pluto", "Uranus"]
+        assert not os.path.exists(checkpoint)
+
+    def test_out_of_range(self):
+        row = '{"name": "Mars", "distance": 99999999999999999999999, "date": "2013-10-02"}'
+        path = self.write("planets.jsonl", row)
+        with self.assertRaisesMessage(CommandError, "row 1: invalid distance"):
+            call_command("import_planets", path, stdout=StringIO())
+        assert Planet.objects.count() == 0
+
+    def test_not_an_object(self):
+        for row in ("[1, 2]", '"Mars"', "12"):
+            path = self.write("planets.jsonl", '{"name": "Mars", "distance": 100, "date": "2013-10-02"}\n' + row)
+            with self.assertRaisesMessage(CommandError, "row 2: expected a JSON object"):
+                call_command("import_planets", path, stdout=StringIO())
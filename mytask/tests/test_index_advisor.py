@@ -0,0 +1,43 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from ..index_advisor import get_advisor
+from ..models import Planet
+from ..search import filter_planets
+
+
+ADVISOR = {"sample_rate": 1, "max_samples": 10, "cache": "default"}
+
+
+@override_settings(PLANET_SEARCH_INDEX_ADVISOR=ADVISOR,
+                   PLANET_SEARCH_ALLOWED_FIELDS=["name", "distance", "description"])
+class IndexAdvisorTestCase(TestCase):
+
+    fixtures = ['planets.json']
+
+    def setUp(self):
+        self.advisor = get_advisor()
+        self.advisor.reset()
+
+    def test_report(self):
+        list(filter_planets("distance gt 20 AND description eq OK"))
+        list(filter_planets("description eq OK OR description eq Hot"))
+        list(filter_planets("name eq Mars"))
+
+        assert self.advisor.usage() == {
+            ("distance", "gt"): 1, ("description", "exact"): 1, ("description", "in"): 1, ("name", "exact"): 1,
+        }
+        report = {entry["field"]: entry for entry in self.advisor.report(Planet)}
+        # the first query can use the distance index, the second one scans the table
+        assert (report["description"]["full_scans"], report["description"]["sampled"]) == (1, 2)
+        assert report["name"]["indexed"] and report["name"]["full_scans"] == 0
+        assert [index.fields for index in self.advisor.suggest(Planet)] == [["description"]]
+
+        output = StringIO()
+        call_command("advise_indexes", stdout=output)
+        assert "suggested: models.Index(fields=['description'], name='planet_description_idx')" in output.getvalue()
+
+        call_command("advise_indexes", "--reset", stdout=StringIO())
+        assert self.advisor.usage() == {}
@@ -0,0 +1,60 @@
+from django.test import TestCase
+from django.urls import reverse
+
+from .. import instrumentation
+from ..models import Planet
+from ..parser import ENGINE_PYPARSING, ParserSearch
+
+
+class InstrumentationTestCase(TestCase):
+
+    fixtures = ['planets.json']
+
+    def setUp(self):
+        self.stats = instrumentation.StatsHook()
+        self.reports = []
+        instrumentation.add_hook(self.stats)
+        instrumentation.add_hook(self.reports.append)
+
+    def tearDown(self):
+        instrumentation.remove_hook(self.stats)
+        instrumentation.remove_hook(self.reports.append)
+
+    def test_parse_stages(self):
+        fields = ["name", "distance"]
+        ParserSearch.parse(fields, "name eq Mars OR (distance gt 10 AND distance lt 20)", use_cache=False,
+                           model=Planet, optimize=True)
+        report = self.reports[-1]
+        assert report["kind"] == "parse"
+        assert set(report["timings"]) == {"tokenize", "coerce", "build", "optimize"}
+        # measured on the optimized query: name OR distance__range
+        assert (report["predicates"], report["depth"]) == (2, 1)
+
+        ParserSearch.parse(fields, "name eq Mars", engine=ENGINE_PYPARSING, use_cache=False)
+        assert set(self.reports[-1]["timings"]) == {"tokenize", "build"}
+
+        snapshot = self.stats.snapshot()
+        assert snapshot["stages"]["tokenize"]["count"] == 2
+        assert snapshot["max_depth"] == 1
+
+        exporter = instrumentation.PrometheusHook()
+        exporter(report)
+        assert 'planet_search_stage_seconds_count{stage="coerce"} 1' in exporter.render()
+
+    def test_disabled(self):
+        instrumentation.remove_hook(self.stats)
+        instrumentation.remove_hook(self.reports.append)
+        try:
+            assert not instrumentation.is_enabled()
+            ParserSearch.parse(["name"], "name eq Mars", use_cache=False)
+        finally:
+            instrumentation.add_hook(self.stats)
+            instrumentation.add_hook(self.reports.append)
+        assert self.reports == []
+
+    def test_server_timing_header(self):
+        response = self.client.get(reverse("planet-search"), {"q": "distance gt 100"})
+        assert response.status_code == 200
+        stages = [part.split(";")[0] for part in response["Server-Timing"].split(", ")]
+        assert {"tokenize", "build", "execute"} <= set(stages)
+        assert any(report["kind"] == "execute" and report["rows"] for report in self.reports)
@@ -0,0 +1,63 @@
+from datetime import date, datetime
+
+from django.db.models import Q
+from django.test import TestCase
+
+from ..models import Planet
+from ..optimizer import EmptyQ, optimize
+from ..parser import ParserSearch
+
+
+class OptimizerTestCase(TestCase):
+
+    fixtures = ['planets.json']
+
+    def test_optimize(self):
+        fields = ["date", "distance", "name"]
+
+        search = "(distance gt 20) AND ((distance lt 100) AND (distance lt 10000))"
+        assert ParserSearch.parse(fields, search, optimize=True) == Q(distance__gt=20, distance__lt=100)
+        assert ParserSearch.parse(fields, search, model=Planet, optimize=True) == Q(distance__range=(21, 99))
+
+        search = "name eq Mars OR (name eq Venus OR name eq Mars) OR distance lt 10"
+        assert ParserSearch.parse(fields, search, optimize=True) == \
+            Q(name__in=["Mars", "Venus"]) | Q(distance__lt=10)
+
+        search = "date gt 2010-01-01 AND date lt 2012-01-01 AND date ne 2011-10-02 AND date ne 2000-01-01"
+        assert ParserSearch.parse(fields, search, model=Planet, optimize=True) == \
+            Q(date__range=(date(2010, 1, 2), date(2011, 12, 31))) & ~Q(date=date(2011, 10, 2))
+
+        # unknown lookups and values the optimizer can not order are kept as they are
+        assert optimize(Q(name__icontains="a") & Q(name__gt="a")) == Q(name__icontains="a") & Q(name__gt="a")
+        assert optimize(Q()) == Q()
+
+    def test_unsatisfiable(self):
+        search = "((date gt 2016-05-01) AND (name eq Mars)) AND ((distance gt 20) OR (distance lt 10) OR (name ne Pluto)) AND (date lt 2000-01-01)"  # noqa: E501
+        query = ParserSearch.parse(["date"], search, optimize=True)
+        assert isinstance(query, EmptyQ)
+        with self.assertNumQueries(0):
+            assert list(Planet.objects.filter(query)) == []
+
+        assert isinstance(optimize(Q(distance=10) & Q(distance=20)), EmptyQ)
+        assert isinstance(optimize(Q(name="Mars") & ~Q(name="Mars")), EmptyQ)
+        # there is no integer between 10 and 11, only known from the model field
+        query = Q(distance__gt=10, distance__lt=11) | Q(distance=1, distance__gt=5)
+        assert isinstance(optimize(query, Planet), EmptyQ)
+        assert optimize(query) == Q(distance__gt=10, distance__lt=11)
+        assert optimize(~(Q(distance=10) & Q(distance=20))) == Q()
+        assert optimize(Q(date__gt=datetime(2016, 5, 1)) & Q(date__lt=datetime(2016, 5, 1))) == EmptyQ()
+
+    def test_same_results(self):
+        fields = ["date", "distance", "name"]
+        searches = [
+            "(date gt 2000-01-01) AND (distance gt 2000) OR (name eq Mars) OR (name eq Saturnus)",
+            "distance gt 100 AND distance lt 6500 AND (distance gt 1000 OR name eq Venus OR name eq Pluto)",
+            "distance gt 99 AND distance lt 101 OR date gt 2012-10-01 AND date lt 2012-10-03",
+            "(name eq Mars OR name eq Venus) AND (name ne Venus) AND distance gt 0",
+        ]
+        for search in searches:
+            for model in (None, Planet):
+                expected = set(Planet.objects.filter(ParserSearch.parse(fields, search, model=model)))
+                assert expected
+                assert set(Planet.objects.filter(ParserSearch.parse(fields, search, model=model, optimize=True))) == \
+                    expected
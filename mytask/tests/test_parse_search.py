@@ -1,9 +1,9 @@
-from datetime import datetime
+from datetime import date, datetime
 
 from django.db.models import Q
-from django.test import TestCase
+from django.test import SimpleTestCase, TestCase
 
-from ..parser import ParserSearch
+from ..parser import ENGINE_NATIVE, ENGINE_PYPARSING, ParserSearch, SearchLimitError, SearchLimits
 from ..models import Planet
 
 
@@ -205,3 +205,152 @@ class AnimalTestCase(TestCase):
 
         for i in range(len(result_query_str)):
             assert result_query[i].pk == result_query_str[i].pk
+
+    def test_engines_agree(self):
+        search = " OR ".join(f"((distance gt {i}) AND (name ne Mars{i}))" for i in range(200))
+        assert ParserSearch.parse(["distance", "name"], search, engine=ENGINE_NATIVE) == \
+            ParserSearch.parse(["distance", "name"], search, engine=ENGINE_PYPARSING)
+
+        # keywords are whole words, "ORION" is a value and not "OR" + "ION"
+        assert ParserSearch.parse(["name"], "name eq ORION") == Q(name="ORION")
+
+        # lower case "and" / "or" are part of a value, between groups they are keywords in both engines
+        fields = ["name", "distance"]
+        for search, expected in [
+            ("name eq Black and White", Q(name="Black and White")),
+            ("distance gt 10 and distance lt 20", Q(distance__gt="10 and distance lt 20")),
+            ("(name eq Mars) or (name eq Venus)", Q(name="Mars") | Q(name="Venus")),
+            ("name eq Mars or (distance gt 10) and (name eq Venus)",
+             Q(name="Mars or") & Q(distance__gt=10, name="Venus")),
+            # a keyword starting a predicate makes it invalid
+            ("(distance gt 10) or name eq Rock and Roll", Q()),
+        ]:
+            assert ParserSearch.parse(fields, search, engine=ENGINE_NATIVE, use_cache=False) == expected, search
+            assert ParserSearch.parse(fields, search, engine=ENGINE_PYPARSING, use_cache=False) == expected, search
+
+        try:
+            ParserSearch.parse(["name"], "name eq Mars", engine="unknown")
+        except Exception as ex:
+            assert isinstance(ex, ValueError)
+
+    def test_model_values(self):
+        fields = ["date", "distance", "name"]
+        search = "(date gt 2000-01-01) AND (distance gt 2000) OR (name eq Mars) OR (name eq 2016)"
+        query = ParserSearch.parse(fields, search, model=Planet)
+        assert query == Q(date__gt=date(2000, 1, 1)) & Q(distance__gt=2000) | Q(name="Mars") | Q(name="2016")
+        assert set(Planet.objects.filter(query)) == \
+            set(Planet.objects.filter(ParserSearch.parse(fields, search, engine=ENGINE_PYPARSING)))
+
+        # values that do not fit the field type invalidate the phrase
+        assert ParserSearch.parse(fields, "distance gt far AND name eq Mars", model=Planet) == Q()
+        assert ParserSearch.parse(fields, "date eq yesterday", model=Planet) == Q()
+        # integers are bounded by the column, the query would overflow when it runs
+        assert ParserSearch.parse(fields, "distance gt 99999999999999999999999", model=Planet) == Q()
+        assert ParserSearch.parse(fields, "distance gt 9223372036854775807", model=Planet) == \
+            Q(distance__gt=2 ** 63 - 1)
+
+
+class PyparsingEngineTestCase(AnimalTestCase):
+    '''
+    Run the same cases against the original pyparsing engine
+    '''
+
+    def setUp(self):
+        self._engine = ParserSearch.ENGINE
+        ParserSearch.ENGINE = ENGINE_PYPARSING
+
+    def tearDown(self):
+        ParserSearch.ENGINE = self._engine
+
+    def test_engines_agree(self):
+        pass
+
+
+class PhraseCacheTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.cache = ParserSearch.enable_cache(maxsize=2)
+
+    def tearDown(self):
+        ParserSearch.disable_cache()
+
+    def test_cache(self):
+        search = "(date ne 2016-05-01) AND ((distance gt 20) OR (distance lt 10))"
+        expected = ~Q(date=datetime(2016, 5, 1)) & (Q(distance__gt=20) | Q(distance__lt=10))
+
+        first = ParserSearch.parse(["date", "distance"], search)
+        # returned objects are copies, changing them must not leak into the cache
+        first.children.append(("name", "Mars"))
+        assert ParserSearch.parse(["distance", "date"], f"  {search} ") == expected
+        assert self.cache.stats() == {"hits": 1, "misses": 1, "evictions": 0, "size": 1, "maxsize": 2}
+
+        # allowed fields are part of the key
+        assert ParserSearch.parse(["distance"], search) == Q(distance__gt=20) | Q(distance__lt=10)
+        assert ParserSearch.parse(["date"], search) == ~Q(date=datetime(2016, 5, 1))
+        assert self.cache.evictions == 1
+        assert len(self.cache) == 2
+
+        assert ParserSearch.parse(["date", "distance"], search, use_cache=False) == expected
+        assert self.cache.misses == 3
+
+
+class SearchLimitsTestCase(SimpleTestCase):
+
+    def assert_rejected(self, search_phrase: str, limit: str, **limits):
+        with self.assertRaises(SearchLimitError) as context:
+            ParserSearch.parse(["name", "distance"], search_phrase, use_cache=False, limits=SearchLimits(**limits))
+        assert context.exception.limit == limit
+        return context.exception
+
+    def test_limits(self):
+        error = self.assert_rejected("name eq Mars" * 10, "max_length", max_length=100)
+        assert (error.value, error.maximum) == (120, 100)
+        self.assert_rejected("(" * 5000 + "name eq Mars" + ")" * 5000, "max_depth", max_length=None)
+        self.assert_rejected(" OR ".join(["distance eq 1"] * 20000), "max_predicates", max_length=None)
+        self.assert_rejected("a eq 1 AND b eq 2 OR c eq 3", "max_fields", max_fields=2)
+
+        # values are not counted as predicates or fields
+        limits = SearchLimits(max_depth=2, max_predicates=2, max_fields=1)
+        search = '((name eq "eq AND" OR name eq Mars))'
+        assert ParserSearch.parse(["name"], search, use_cache=False, limits=limits) == Q(name="eq AND") | Q(name="Mars")
+
+        ParserSearch.LIMITS = SearchLimits(max_predicates=1)
+        try:
+            with self.assertRaises(SearchLimitError):
+                ParserSearch.parse(["name"], "name eq Mars AND name ne Venus", use_cache=False)
+        finally:
+            ParserSearch.LIMITS = None
+
+    def test_deep_nesting(self):
+        # without limits deep nesting is parsed, not a RecursionError
+        search = "(" * 5000 + "name eq Mars" + ")" * 5000
+        assert ParserSearch.parse(["name"], search, use_cache=False) == Q(name="Mars")
+        assert ParserSearch.parse(["name"], search, use_cache=False, model=Planet, optimize=True) == Q(name="Mars")
+        tree = ParserSearch.to_ast(["name"], search, model=Planet)
+        assert ParserSearch.compile(tree, ["name"], model=Planet, optimize=True) == Q(name="Mars")
+
+        # alternating connectors keep every level, deduplication does not hash the subtrees again per level
+        search = "(name eq A OR (name eq B AND " * 200 + "name eq C" + "))" * 200
+        assert ParserSearch.parse(["name"], search, use_cache=False)
+
+
+class ParseManyTestCase(SimpleTestCase):
+
+    def test_parse_many(self):
+        fields = ["name", "distance", "date"]
+        phrases = [f"distance gt {number % 7} OR name eq Mars" for number in range(30)] + ["", " distance gt 1 "]
+
+        expected = [ParserSearch.parse(fields, phrase, use_cache=False, model=Planet) for phrase in phrases]
+        results = ParserSearch.parse_many(fields, phrases, model=Planet)
+        assert results == expected
+        # duplicates are copies
+        assert results[1] == results[8] and results[1] is not results[8]
+
+        for processes in (None, 2):
+            assert ParserSearch.parse_many(fields, phrases, model=Planet, processes=processes, chunksize=3) == expected
+            trees = ParserSearch.parse_many(fields, phrases, model=Planet, as_ast=True, processes=processes,
+                                            chunksize=3)
+            assert [ParserSearch.compile(tree, fields) for tree in trees] == expected
+
+        with self.assertRaises(ValueError):
+            ParserSearch.parse_many(fields, ["name eq Mars", None])
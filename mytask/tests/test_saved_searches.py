@@ -0,0 +1,158 @@
+import json
+import tempfile
+from datetime import date
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase
+from django.urls import reverse
+
+from .. import saved_searches
+from ..models import Planet, SavedSearch, SavedSearchMatch
+from ..parser import SearchPhraseError
+
+
+PHRASES = {
+    "far": "distance gt 2000",
+    "text": "description match mars OR (name ne Venus AND date lt 2013-01-01)",
+    "never": "distance gt 100 AND distance lt 50",
+}
+
+
+class SavedSearchTestCase(TestCase):
+
+    fixtures = ['planets.json']
+
+    def setUp(self):
+        # the class fixture was loaded raw, its rebuild waits for a commit of the test transaction that never comes
+        # and would stand for every rebuild scheduled by the tests
+        connection.run_on_commit = [
+            entry for entry in connection.run_on_commit if entry[1] is not saved_searches.rebuild_all]
+        for name, phrase in PHRASES.items():
+            SavedSearch.objects.create(name=name, phrase=phrase)
+
+    def assert_consistent(self):
+        for saved_search in SavedSearch.objects.all():
+            query = saved_searches.compile_search(saved_search)
+            expected = sorted(Planet.objects.filter(query).values_list("name", flat=True))
+            assert sorted(saved_searches.saved_search_planets(saved_search).values_list("name", flat=True)) == \
+                expected, saved_search.name
+
+    def names(self, name: str) -> list[str]:
+        return sorted(Planet.objects.filter(saved_searches__name=name).values_list("name", flat=True))
+
+    def test_rebuild_on_save(self):
+        assert self.names("far") == ["Pluto", "Uranus", "Venus"]
+        assert self.names("text") == ["Mars", "Pluto", "Uranus"]
+        assert self.names("never") == []
+        assert SavedSearch.objects.get(name="far").allowed_fields == ["name", "description", "distance", "date"]
+
+        saved_search = SavedSearch.objects.get(name="far")
+        saved_search.phrase = "distance lt 2000"
+        saved_search.save()
+        assert self.names("far") == ["Mars", "Saturnus"]
+
+        with self.assertRaises(SearchPhraseError):
+            SavedSearch.objects.create(name="broken", phrase="distance gt (")
+        with self.assertRaises(SearchPhraseError):
+            SavedSearch.objects.create(name="hidden", phrase="description match mars", allowed_fields=["name"])
+
+    def test_row_updates(self):
+        planet = Planet.objects.create(name="Kepler", description="far from mars", distance=5000,
+                                       date=date(2010, 1, 1))
+        assert "Kepler" in self.names("far") and "Kepler" in self.names("text")
+
+        # the update, the saved searches, one conditional count on the row, its current matches, one delete
+        planet.distance = 10
+        with self.assertNumQueries(5):
+            planet.save(update_fields=["distance"])
+        assert "Kepler" not in self.names("far") and "Kepler" in self.names("text")
+        self.assert_consistent()
+
+        # an empty full text phrase never matches
+        SavedSearch.objects.create(name="empty", phrase='description match "" OR distance lt 20')
+        SavedSearch.objects.create(name="nothing", phrase='description match ""')
+        planet.save()
+        assert self.names("empty") == ["Kepler"]
+        assert self.names("nothing") == []
+
+        Planet.objects.get(name="Mars").delete()
+        Planet.objects.get(name="Venus").delete()
+        self.assert_consistent()
+        assert not SavedSearchMatch.objects.filter(planet__name__in=["Mars", "Venus"]).exists()
+
+    def rebuilds(self, callbacks: list) -> int:
+        return sum(callback is saved_searches.rebuild_all for callback in callbacks)
+
+    def test_bulk_writes(self):
+        # the written rows are checked like saved rows, nothing is rebuilt
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            Planet.objects.filter(name__in=["Mars", "Saturnus"]).update(distance=3000)
+            assert self.names("far") == ["Mars", "Pluto", "Saturnus", "Uranus", "Venus"]
+            planets = list(Planet.objects.filter(name__in=["Mars", "Pluto"]))
+            for planet in planets:
+                planet.distance = 10
+            Planet.objects.bulk_update(planets, ["distance"])
+            assert self.names("far") == ["Saturnus", "Uranus", "Venus"]
+            Planet.objects.filter(name="Venus").delete()
+        assert self.rebuilds(callbacks) == 0
+        self.assert_consistent()
+
+        # nothing written, nothing checked
+        with self.assertNumQueries(2):
+            Planet.objects.filter(name="Ceres").update(distance=1)
+        with self.assertNumQueries(1):
+            Planet.objects.filter(name="Ceres").delete()
+
+        # SQLite does not return the ids of bulk_create rows, they are rebuilt on commit, once per transaction
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            Planet.objects.bulk_create([Planet(name="Eris", distance=96000, date=date(2005, 1, 5))])
+            Planet.objects.bulk_create([Planet(name="Ceres", distance=3, date=date(1801, 1, 1))])
+        assert self.rebuilds(callbacks) == 1
+        assert self.names("far") == ["Eris", "Saturnus", "Uranus"]
+        self.assert_consistent()
+
+    def test_rolled_back_rebuild(self):
+        # a rolled back savepoint drops its rebuild, a later bulk write schedules one again
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with transaction.atomic():
+                Planet.objects.bulk_create([Planet(name="Eris", distance=96000, date=date(2005, 1, 5))])
+                transaction.set_rollback(True)
+            Planet.objects.bulk_create([Planet(name="Ceres", distance=3000, date=date(1801, 1, 1))])
+        assert self.rebuilds(callbacks) == 1
+        assert "Ceres" in self.names("far")
+        self.assert_consistent()
+
+    def test_fixtures(self):
+        # loaddata saves raw rows, the saved searches are rebuilt once it commits
+        SavedSearchMatch.objects.all().delete()
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            call_command("loaddata", "planets.json", verbosity=0)
+        assert self.rebuilds(callbacks) == 1
+        assert self.names("far") == ["Pluto", "Uranus", "Venus"]
+        self.assert_consistent()
+
+    def test_bulk_load(self):
+        rows = "\n".join(json.dumps({"name": f"p{number}", "distance": 3000 + number, "date": "2005-01-05"})
+                         for number in range(10))
+        with tempfile.NamedTemporaryFile("w", suffix=".jsonl") as stream:
+            stream.write(rows)
+            stream.flush()
+            with mock.patch.object(saved_searches, "rebuild_all", wraps=saved_searches.rebuild_all) as rebuild_all:
+                with self.captureOnCommitCallbacks(execute=True):
+                    call_command("import_planets", stream.name, "--batch-size=3", stdout=StringIO())
+        assert rebuild_all.call_count == 1
+        assert len(self.names("far")) == 13
+        self.assert_consistent()
+
+    def test_view(self):
+        response = self.client.get(reverse("planet-saved-search", args=["far"]), {"order": "distance", "limit": 2})
+        assert response.status_code == 200
+        page = response.json()
+        assert [row["name"] for row in page["results"]] == ["Uranus", "Venus"]
+        response = self.client.get(reverse("planet-saved-search", args=["far"]), {"order": "distance",
+                                                                                  "cursor": page["next"]})
+        assert [row["name"] for row in response.json()["results"]] == ["Pluto"]
+        assert self.client.get(reverse("planet-saved-search", args=["missing"])).status_code == 404
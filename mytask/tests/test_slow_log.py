@@ -0,0 +1,85 @@
+import json
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from .. import instrumentation, search, slow_log
+from ..models import Planet
+from ..parser import ParserSearch
+
+
+FIELDS = ["name", "distance", "date"]
+RECORD_ALL = {"threshold_ms": 0, "sample_rate": 1.0, "max_entries": 3}
+
+
+@override_settings(PLANET_SEARCH_SLOW_LOG=RECORD_ALL)
+class SlowSearchLogTestCase(TestCase):
+
+    fixtures = ['planets.json']
+
+    def setUp(self):
+        self.log = slow_log.get_log()
+        self.log.clear()
+
+    def page(self, phrase: str):
+        return search.compute_page(phrase, FIELDS, None, "date", None, 10, None)
+
+    def test_record(self):
+        page = self.page("distance gt 20 AND (name ne Mars OR date gt 2000-01-01)")
+        assert instrumentation.request_timings.get() is None
+        entry, = self.log.entries()
+        assert entry["phrase"] == "distance gt 20 AND (name ne Mars OR date gt 2000-01-01)"
+        assert entry["shape"] == "distance gt ? AND (name ne ? OR date gt ?)"
+        assert entry["allowed_fields"] == ["date", "distance", "name"]
+        assert entry["ordering"] == "date"
+        assert "mytask_planet" in entry["sql"] and 20 in entry["params"]
+        assert entry["plan"]
+        assert {"tokenize", "coerce", "build", "execute"} <= set(entry["timings_ms"])
+        assert entry["total_ms"] >= entry["timings_ms"]["execute"]
+        assert len(page["results"]) == len(Planet.objects.filter(ParserSearch.parse(FIELDS, entry["phrase"])))
+
+        # the ring buffer keeps the last max_entries
+        for distance in range(4):
+            self.page(f"distance gt {distance}")
+        assert [entry["phrase"] for entry in self.log.entries()] == [f"distance gt {d}" for d in (1, 2, 3)]
+
+    @override_settings(PLANET_SEARCH_SQL_TEMPLATES=16)
+    def test_template(self):
+        self.page("distance lt 100")
+        self.page("distance lt 200")
+        entries = self.log.entries()
+        assert [entry["params"][0] for entry in entries] == [100, 200]
+        assert entries[0]["sql"] == entries[1]["sql"]
+
+    def test_threshold_and_sampling(self):
+        with override_settings(PLANET_SEARCH_SLOW_LOG={**RECORD_ALL, "threshold_ms": 60000}):
+            self.page("distance gt 20")
+        with override_settings(PLANET_SEARCH_SLOW_LOG={**RECORD_ALL, "sample_rate": 0}):
+            self.page("distance gt 20")
+        assert self.log.entries() == []
+
+    def test_shape_text(self):
+        tree = ParserSearch.to_ast(FIELDS, "(name eq Mars OR name eq None) distance gt 3")
+        shape, _ = ParserSearch.split_values(tree)
+        assert slow_log.shape_text(shape) == "(name eq ? OR name eq None) AND distance gt ?"
+
+    def test_command(self):
+        self.page("distance gt 20")
+        self.page("distance gt 30")
+        self.page("name eq Mars")
+
+        output = StringIO()
+        call_command("slow_searches", "--aggregate", stdout=output)
+        lines = output.getvalue().splitlines()
+        assert "count=2" in lines[0] and lines[0].endswith("distance gt ?")
+        assert any(line.startswith("    plan: ") for line in lines)
+
+        output = StringIO()
+        call_command("slow_searches", "--json", "--limit=1", stdout=output)
+        assert [entry["phrase"] for entry in json.loads(output.getvalue())] == ["name eq Mars"]
+
+        call_command("slow_searches", "--clear", stdout=StringIO())
+        output = StringIO()
+        call_command("slow_searches", stdout=output)
+        assert output.getvalue().strip() == "no slow searches recorded"
@@ -0,0 +1,117 @@
+import random
+from datetime import date, timedelta
+
+from django.db.models import Q
+from django.test import TestCase, override_settings
+
+from .. import cache, snapshot
+from ..models import Planet
+from ..parser import ParserSearch
+from ..search import filter_planets, paginate, search_page
+
+
+@override_settings(PLANET_SEARCH_SNAPSHOT=True)
+class SnapshotTestCase(TestCase):
+
+    fixtures = ['planets.json']
+    fields = ["name", "description", "distance", "date"]
+
+    def setUp(self):
+        snapshot.reset_snapshot()
+
+    def tearDown(self):
+        snapshot.reset_snapshot()
+
+    def assert_same(self, planets: snapshot.PlanetSnapshot, qobj: Q):
+        expected = list(Planet.objects.filter(qobj).order_by("id").values_list("id", flat=True))
+        assert planets.filter(qobj) == expected, qobj
+
+    def test_matches_database(self):
+        planets = snapshot.get_snapshot()
+        phrases = [
+            "(date ne 2016-05-01) AND ((distance gt 20) OR (distance lt 10))",
+            "date gt 2000-01-01 AND distance gt 2000 OR name eq Mars OR name ne Saturnus",
+            "distance gt 100 AND distance lt 2500 OR date eq 2013-10-02",
+            "name gt Mars AND name lt Uranus",
+            "description ne \"this is mars\"",
+            "name eq Mars OR name eq Venus OR name eq Pluto",
+            "",
+        ]
+        for phrase in phrases:
+            for optimize in (False, True):
+                self.assert_same(planets, ParserSearch.parse(self.fields, phrase, model=Planet, optimize=optimize))
+
+        for qobj in [Q(description=None), ~Q(description=None), ~Q(description="this is mars") | Q(distance=100),
+                     Q(pk__in=[1, 3, 99]), Q(distance__range=(100, 2500)), Q(pk__in=[]), ~(~Q(description="x"))]:
+            self.assert_same(planets, qobj)
+
+        for qobj in [Q(description__match="mars"), Q(distance=1.5), Q(date="2013-10-02"), Q(name__startswith="M")]:
+            with self.assertRaises(snapshot.Unsupported):
+                planets.evaluate(qobj)
+
+    def test_many_rows(self):
+        rng = random.Random(7)
+        Planet.objects.bulk_create([
+            Planet(name=f"p{rng.randrange(300)}", distance=rng.randrange(1000),
+                   date=date(2000, 1, 1) + timedelta(days=rng.randrange(400)))
+            for _ in range(2000)
+        ])
+        planets = snapshot.get_snapshot()
+        assert len(planets) == Planet.objects.count()
+        for _ in range(40):
+            low = rng.randrange(1000)
+            day = date(2000, 1, 1) + timedelta(days=rng.randrange(400))
+            self.assert_same(planets, Q(distance__gt=low) & ~Q(date__lt=day) | Q(name=f"p{low % 300}"))
+            self.assert_same(planets, Q(distance__lte=low, date__gte=day) | Q(distance__in=[low, low + 1]))
+
+        for ordering in ("date", "-date", "distance", "-distance"):
+            for limit in (7, 500):
+                with self.assertNumQueries(0):
+                    first = search_page("distance gt 500", ordering=ordering, limit=limit)
+                    second = search_page("distance gt 500", ordering=ordering, limit=limit, cursor=first["next"])
+                queryset = filter_planets("distance gt 500")
+                assert paginate(queryset, ordering=ordering, limit=limit) == first
+                assert paginate(queryset, ordering=ordering, limit=limit, cursor=first["next"]) == second
+
+    def test_incremental_updates(self):
+        planets = snapshot.get_snapshot()
+        with self.captureOnCommitCallbacks(execute=True):
+            mercury = Planet.objects.create(name="Mercury", distance=90, date=date(2000, 1, 1))
+        with self.captureOnCommitCallbacks(execute=True):
+            Planet.objects.filter(name="Mars").first().delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            mercury.distance = 95
+            mercury.save()
+
+        assert snapshot.get_snapshot() is planets
+        assert planets.generation == cache.get_generation()
+        self.assert_same(planets, Q(distance__lt=2000))
+        assert search_page("distance lt 2000", limit=10)["results"][0]["name"] == "Mercury"
+
+        # bulk writes and writes of other processes reload
+        with self.captureOnCommitCallbacks(execute=True):
+            Planet.objects.filter(name="Mercury").update(distance=5)
+        self.assert_same(planets, Q(distance__lt=10))
+        Planet.objects.filter(name="Venus").update(distance=1)
+        cache.invalidate()
+        self.assert_same(snapshot.get_snapshot(), Q(distance__lt=10))
+
+    @override_settings(PLANET_SEARCH_CACHE=None)
+    def test_without_cache(self):
+        # the generation is kept in the process
+        planets = snapshot.get_snapshot()
+        generation = cache.get_generation()
+        with self.captureOnCommitCallbacks(execute=True):
+            Planet.objects.create(name="Mercury", distance=90, date=date(2000, 1, 1))
+        assert cache.get_generation() > generation
+        assert snapshot.get_snapshot() is planets
+        assert planets.generation == cache.get_generation()
+        assert search_page("distance lt 100", limit=10)["results"][0]["name"] == "Mercury"
+
+        Planet.objects.filter(name="Mercury").update(distance=5)
+        cache.invalidate()
+        self.assert_same(snapshot.get_snapshot(), Q(distance__lt=10))
+
+    def test_fallback(self):
+        page = search_page('description match "mars"', limit=10)
+        assert [row["name"] for row in page["results"]] == ["Mars"]
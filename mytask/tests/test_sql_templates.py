@@ -0,0 +1,55 @@
+from django.test import TestCase, override_settings
+
+from .. import cache, sql_templates
+from ..models import Planet
+from ..parser import ParserSearch
+from ..search import filter_planets, paginate, search_page
+
+
+@override_settings(PLANET_SEARCH_SQL_TEMPLATES=16)
+class SQLTemplateTestCase(TestCase):
+
+    fixtures = ['planets.json']
+    fields = ["name", "description", "distance", "date"]
+
+    def setUp(self):
+        self.templates = sql_templates.get_cache()
+        self.templates.clear()
+
+    def test_same_rows_as_orm(self):
+        phrases = [
+            "(date ne 2016-05-01) AND ((distance gt 20) OR (distance lt 10))",
+            "date gt 2000-01-01 AND distance gt 2000 OR name eq Mars OR name ne Saturnus",
+            'description ne "this is mars" AND date lt 2013-10-02',
+            'description match "mars"',
+            "name eq Mars AND name eq Venus",
+            "",
+        ]
+        for phrase in phrases:
+            for ordering in ("date", "-distance"):
+                expected = paginate(filter_planets(phrase), ordering=ordering, limit=2)
+                cursor = expected["next"]
+                assert search_page(phrase, ordering=ordering, limit=2) == expected, phrase
+                if cursor:
+                    assert search_page(phrase, ordering=ordering, limit=2, cursor=cursor) == \
+                        paginate(filter_planets(phrase), ordering=ordering, limit=2, cursor=cursor)
+
+        # full text values are rewritten by the lookup, that shape is remembered as not templated
+        assert None in self.templates._data.values()
+
+    def test_shape_reuse(self):
+        search_page("distance gt 20 AND date gt 2000-01-01", ordering="distance")
+        assert (self.templates.hits, self.templates.misses) == (0, 1)
+        cache.invalidate()
+        with self.assertNumQueries(1):
+            page = search_page("distance gt 2400 AND date gt 2010-01-01", ordering="distance")
+        assert [row["name"] for row in page["results"]] == ["Uranus", "Pluto"]
+        assert page["results"][0]["date"] == Planet.objects.get(name="Uranus").date
+        assert (self.templates.hits, len(self.templates)) == (1, 1)
+
+        tree = ParserSearch.to_ast(self.fields, "name eq Mars OR (distance gt 20 AND description eq None)", Planet)
+        shape, values = ParserSearch.split_values(tree)
+        assert values == ["Mars", 20, "None"]
+        assert ParserSearch.bind(shape, values) == tree
+        other = ParserSearch.to_ast(self.fields, "name eq Venus OR (distance gt 5 AND description eq x)", Planet)
+        assert ParserSearch.split_values(other)[0] == shape
@@ -0,0 +1,83 @@
+import json
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+
+
+class PlanetSearchViewTestCase(TestCase):
+
+    fixtures = ['planets.json']
+
+    def search(self, **params):
+        return self.client.get(reverse("planet-search"), params)
+
+    def test_keyset_pages(self):
+        names = []
+        params = {"q": "distance gt 100 OR name eq Mars", "order": "distance", "limit": 2, "fields": "name"}
+        while True:
+            response = self.search(**params)
+            assert response.status_code == 200
+            page = response.json()
+            assert all(set(row) == {"id", "name", "distance"} for row in page["results"])
+            names.extend(row["name"] for row in page["results"])
+            if not page["next"]:
+                break
+            params["cursor"] = page["next"]
+
+        assert names == ["Mars", "Saturnus", "Uranus", "Venus", "Pluto"]
+
+        page = self.search(q="date gt 2010-01-01", order="-date", limit=10).json()
+        assert [row["date"] for row in page["results"]] == ["2020-10-02", "2013-10-02", "2012-10-02", "2011-10-02"]
+        assert page["next"] is None
+
+    def test_empty_and_invalid(self):
+        with self.assertNumQueries(0):
+            page = self.search(q="date gt 2016-05-01 AND date lt 2000-01-01").json()
+        assert page == {"results": [], "next": None}
+
+        cursor = self.search(order="date", limit=1).json()["next"]
+        assert self.search(order="distance", cursor=cursor).status_code == 400
+        assert self.search(cursor="garbage").status_code == 400
+        assert self.search(order="name").status_code == 400
+        assert self.search(fields="password").status_code == 400
+        assert self.search(limit=100000).status_code == 400
+        # out of range integers are an invalid phrase, not an OverflowError
+        assert self.search(q="distance gt 99999999999999999999999").status_code == 200
+
+        response = self.search(q="(" * 100 + "name eq Mars" + ")" * 100)
+        assert response.status_code == 400
+        assert response.json() == {
+            "error": "search phrase exceeds max_depth: 17 > 16", "limit": "max_depth", "value": 17, "maximum": 16,
+        }
+
+
+class PlanetExportTestCase(TestCase):
+
+    fixtures = ['planets.json']
+
+    def test_export(self):
+        response = self.client.get(reverse("planet-export"), {"q": "distance gt 2000", "fields": "name,distance"})
+        assert response["Content-Type"] == "application/x-ndjson"
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        assert [json.loads(line) for line in lines] == [
+            {"name": "Pluto", "distance": 90000},
+            {"name": "Uranus", "distance": 2500},
+            {"name": "Venus", "distance": 6500},
+        ]
+
+        response = self.client.get(reverse("planet-export"), {"q": "name eq Mars", "format": "csv"})
+        assert response["Content-Type"] == "text/csv"
+        assert b"".join(response.streaming_content).decode().splitlines() == [
+            "id,name,description,distance,date",
+            "1,Mars,this is mars,100,2013-10-02",
+        ]
+
+        assert self.client.get(reverse("planet-export"), {"format": "xml"}).status_code == 400
+
+    def test_command(self):
+        output = StringIO()
+        call_command("export_planets", "date lt 2012-01-01", "--format=csv", "--fields=name", "--chunk-size=1",
+                     stdout=output)
+        assert output.getvalue().splitlines() == ["name", "Uranus", "Venus"]
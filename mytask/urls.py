@@ -16,6 +16,13 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path
 
+from . import views
+
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('planets/search', views.planet_search, name='planet-search'),
+    path('planets/search/async', views.planet_search_async, name='planet-search-async'),
+    path('planets/facets', views.planet_facets, name='planet-facets'),
+    path('planets/export', views.planet_export, name='planet-export'),
+    path('planets/saved/<str:name>', views.planet_saved_search, name='planet-saved-search'),
 ]
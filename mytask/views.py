@@ -0,0 +1,155 @@
+from django.http import HttpResponseNotAllowed, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
+
+from . import ast_format
+from .async_search import asearch_page
+from .db import search_db
+from .facets import facets
+from .models import SavedSearch
+from .parser import SearchLimitError
+from .saved_searches import saved_search_planets
+from .search import filter_planets, get_limits, paginate, search_page, stream_rows
+
+EXPORT_CONTENT_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+def _split(value: str) -> list[str]:
+    return [item.strip() for item in value.split(",") if item.strip()] if value else None
+
+
+def _tree(request):
+    '''
+    Pre-parsed search tree of the "ast" parameter (mytask.ast_format JSON), it takes precedence over "q"
+    '''
+    data = request.GET.get("ast")
+    return ast_format.loads(data, limits=get_limits()) if data else None
+
+
+@require_GET
+def planet_search(request):
+    '''
+    GET /planets/search?q=<search phrase>&order=date&limit=50&fields=name,date&cursor=<next>
+    GET /planets/search?ast=<serialized search tree>&...
+    '''
+    try:
+        limit = int(request.GET.get("limit") or 0) or None
+        page = search_page(
+            request.GET.get("q", ""),
+            ordering=request.GET.get("order", "date"),
+            cursor=request.GET.get("cursor"),
+            limit=limit,
+            columns=_split(request.GET.get("fields")),
+            tree=_tree(request),
+        )
+    except SearchLimitError as ex:
+        return JsonResponse(ex.as_dict(), status=400)
+    except ValueError as ex:
+        return JsonResponse({"error": str(ex)}, status=400)
+
+    return JsonResponse(page)
+
+
+async def planet_search_async(request):
+    '''
+    planet_search for the ASGI deployment, see mytask.async_search
+    '''
+    # require_GET wraps the view in a sync function, Django would no longer see a coroutine
+    if request.method != "GET":
+        return HttpResponseNotAllowed(["GET"])
+
+    try:
+        limit = int(request.GET.get("limit") or 0) or None
+        page = await asearch_page(
+            request.GET.get("q", ""),
+            ordering=request.GET.get("order", "date"),
+            cursor=request.GET.get("cursor"),
+            limit=limit,
+            columns=_split(request.GET.get("fields")),
+            tree=_tree(request),
+        )
+    except SearchLimitError as ex:
+        return JsonResponse(ex.as_dict(), status=400)
+    except ValueError as ex:
+        return JsonResponse({"error": str(ex)}, status=400)
+
+    return JsonResponse(page)
+
+
+@require_GET
+def planet_facets(request):
+    '''
+    GET /planets/facets?q=<search phrase>&edges=100,1000,10000&approximate=1
+    '''
+    try:
+        edges = [int(edge) for edge in _split(request.GET.get("edges")) or ()]
+        result = facets(
+            request.GET.get("q", ""),
+            edges=edges or None,
+            approximate=request.GET.get("approximate") in ("1", "true"),
+            tree=_tree(request),
+        )
+    except SearchLimitError as ex:
+        return JsonResponse(ex.as_dict(), status=400)
+    except ValueError as ex:
+        return JsonResponse({"error": str(ex)}, status=400)
+
+    return JsonResponse(result)
+
+
+@require_GET
+def planet_saved_search(request, name: str):
+    '''
+    GET /planets/saved/<name>?order=date&limit=50&fields=name,date&cursor=<next>
+    Planets matching a SavedSearch, read from its materialized matches
+    '''
+    try:
+        saved_search = SavedSearch.objects.get(name=name)
+    except SavedSearch.DoesNotExist:
+        return JsonResponse({"error": f"no saved search {name!r}"}, status=404)
+
+    try:
+        limit = int(request.GET.get("limit") or 0) or None
+        page = paginate(
+            saved_search_planets(saved_search, using=search_db()),
+            ordering=request.GET.get("order", "date"),
+            cursor=request.GET.get("cursor"),
+            limit=limit,
+            columns=_split(request.GET.get("fields")),
+        )
+    except ValueError as ex:
+        return JsonResponse({"error": str(ex)}, status=400)
+
+    return JsonResponse(page)
+
+
+@require_GET
+def planet_export(request):
+    '''
+    GET /planets/export?q=<search phrase>&format=ndjson|csv&fields=name,date
+    Streams every matching row, "ast" can replace "q" like in planet_search.
+    '''
+    export_format = request.GET.get("format", "ndjson")
+    try:
+        rows = stream_rows(
+            filter_planets(request.GET.get("q", ""), tree=_tree(request)),
+            export_format=export_format,
+            columns=_split(request.GET.get("fields")),
+        )
+        # run the argument checks now, not after the response started
+        first = next(rows, "")
+    except SearchLimitError as ex:
+        return JsonResponse(ex.as_dict(), status=400)
+    except ValueError as ex:
+        return JsonResponse({"error": str(ex)}, status=400)
+
+    response = StreamingHttpResponse(_chain(first, rows), content_type=EXPORT_CONTENT_TYPES[export_format])
+    response["Content-Disposition"] = f'attachment; filename="planets.{export_format}"'
+    return response
+
+
+def _chain(first: str, rest):
+    yield first
+    yield from rest